@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from resources import setup_vectorstore, chat_chain, get_answer_cache, get_verse_index, get_glossary_index, get_translator
+from semantic_cache import CachedChain
+from streaming import AnswerStream
+from verse_lookup import GITA, YOGA_SUTRAS, format_verse, wants_explanation
+from glossary import format_glossary
+from tracing import start_trace, span, render_metrics
+
+max_concurrency = 8  # Questions answered at the same time (each holds a worker thread)
+max_waiting = 32  # Requests allowed to queue behind them before new ones get 503
+session_ttl_seconds = 3600
+shutdown_timeout = 30
+
+SCRIPTURES = {"gita": GITA, "bg": GITA, "yoga-sutras": YOGA_SUTRAS, "ys": YOGA_SUTRAS}
+
+
+def serialize_documents(documents):
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+
+
+def bad_request(message):
+    return web.HTTPBadRequest(text=json.dumps({"error": message}), content_type="application/json")
+
+
+# Define a function to read and validate a question request body; returns (payload, question)
+async def read_question(request):
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        raise bad_request("request body must be JSON")
+    if not isinstance(payload, dict):
+        raise bad_request("request body must be a JSON object")
+    question = str(payload.get("question", "")).strip()
+    if not question:
+        raise bad_request("question is required")
+    return payload, question
+
+
+# Define a function to pick the language an answer is translated into; None keeps the English answer
+def target_language(payload):
+    language = str(payload.get("language") or "").strip().lower()
+    return None if language in ("", "english") else language
+
+
+# Blocking: builds the chain and loads the session's persisted memory, so it runs on the thread pool.
+# Memory is persisted per session id, so a session that expired from the store resumes its conversation.
+def build_session_chain(session_id):
+    return CachedChain(chat_chain(setup_vectorstore(), session_id=session_id), get_answer_cache())
+
+
+# Per-session conversation state: each session owns a chain (and so its memory); idle sessions expire.
+# `build(session_id)` is a coroutine that makes the chain off the event loop; concurrent requests
+# for a new session wait on the same build.
+class SessionStore:
+    def __init__(self, build, ttl_seconds=session_ttl_seconds):
+        self.build = build
+        self.ttl_seconds = ttl_seconds
+        self.sessions = {}
+
+    async def get(self, session_id=None):
+        now = time.time()
+        for stale in [key for key, session in self.sessions.items() if now - session["last_used"] > self.ttl_seconds]:
+            del self.sessions[stale]
+        session_id = session_id or uuid.uuid4().hex
+        if session_id not in self.sessions:
+            self.sessions[session_id] = {
+                "ready": asyncio.ensure_future(self.build(session_id)),
+                "lock": asyncio.Lock(),  # One question at a time per conversation
+                "last_used": now,
+            }
+        session = self.sessions[session_id]
+        session["last_used"] = now
+        try:
+            session["chain"] = await asyncio.shield(session["ready"])
+        except Exception:
+            if self.sessions.get(session_id) is session:
+                del self.sessions[session_id]  # The next request for this session tries again
+            raise
+        return session_id, session
+
+
+class AssistantService:
+    def __init__(self, max_concurrency=max_concurrency, max_waiting=max_waiting):
+        # The chain is synchronous, so it runs on a bounded thread pool; the LLM gateway, embeddings
+        # and vectorstore behind it are the process-wide instances from resources.py
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="assistant")
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.in_flight = 0
+        self.sessions = SessionStore(lambda session_id: self.run(build_session_chain, session_id))
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    # Backpressure: queue up to max_waiting requests for a free slot, reject the rest immediately
+    @contextlib.asynccontextmanager
+    async def admitted(self):
+        if self.waiting >= self.max_waiting:
+            raise web.HTTPServiceUnavailable(
+                text=json.dumps({"error": "server busy, retry shortly"}),
+                content_type="application/json",
+                headers={"Retry-After": "1"}
+            )
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self.idle.set()
+            self.slots.release()
+
+    # Runs on the thread pool in a copy of the request's context, so spans land in its trace
+    async def run(self, function, *args):
+        call = functools.partial(contextvars.copy_context().run, function, *args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def translate(self, text, language):
+        if language is None:
+            return text
+        return await self.run(get_translator().translate, text, language)
+
+    # Runs on the thread pool: verse references and word-meaning questions are answered from the
+    # indexes without the chain (as in the Streamlit app); returns None for everything else
+    def direct_answer(self, question, chain):
+        with span("verse_lookup"):
+            verse_entry = get_verse_index().lookup(question)
+        if verse_entry is not None:
+            if wants_explanation(question):
+                return None
+            answer = format_verse(verse_entry)
+        else:
+            with span("glossary_lookup"):
+                matches = get_glossary_index().answer(question)
+            if matches is None:
+                return None
+            answer = format_glossary(matches, question)
+        chain.memory.save_context({"question": question}, {"answer": answer})
+        return {"answer": answer, "source_documents": []}
+
+    # Define a function to build the JSON body of a failed request; the trace id finds it in the logs
+    @staticmethod
+    def error_body(error, session_id, trace):
+        return {"session_id": session_id, "error": str(error) or type(error).__name__, "trace_id": trace.trace_id}
+
+    async def ask(self, request):
+        payload, question = await read_question(request)
+        async with self.admitted():
+            session_id, session = await self.sessions.get(payload.get("session_id"))
+            async with session["lock"]:
+                start_time = time.perf_counter()
+                trace = start_trace(question)
+                response = None
+                error = None
+                try:
+                    response = await self.run(self.direct_answer, question, session["chain"])
+                    if response is None:
+                        config = {"callbacks": [trace.handler()]}
+                        response = await self.run(session["chain"].invoke, {"question": question}, config)
+                    answer = await self.translate(response["answer"], target_language(payload))
+                except Exception as exception:
+                    error = exception
+                    return web.json_response(self.error_body(exception, session_id, trace), status=500)
+                finally:
+                    trace.finish(
+                        error=error,
+                        cached=bool(response and response.get("cached")),
+                        session_id=session_id,
+                        prompt_tokens=trace.prompt_tokens(),
+                        history_tokens=session["chain"].memory.history_tokens()
+                    )
+        return web.json_response({
+            "session_id": session_id,
+            "answer": answer,
+            "source_documents": serialize_documents(response.get("source_documents", [])),
+            "cached": bool(response.get("cached")),
+            "total_time": time.perf_counter() - start_time,
+            "prompt_tokens": trace.prompt_tokens(),
+            "trace": trace.to_dict() if payload.get("debug") else None,
+        })
+
+    # Streams newline-delimited JSON events: sources as soon as retrieval ends, then tokens, then done.
+    # Questions are handled as in /ask: the same direct answers, the same translation. A failure after
+    # the headers are sent arrives as an "error" event; if the client disconnects, generation stops.
+    async def ask_stream(self, request):
+        payload, question = await read_question(request)
+        language = target_language(payload)
+        async with self.admitted():
+            session_id, session = await self.sessions.get(payload.get("session_id"))
+            async with session["lock"]:
+                start_time = time.perf_counter()
+                response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+                await response.prepare(request)
+                trace = start_trace(question)
+                stream = None
+                error = None
+
+                async def send(event):
+                    await response.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+
+                try:
+                    await send({"event": "session", "session_id": session_id})
+                    direct = await self.run(self.direct_answer, question, session["chain"])
+                    if direct is not None:
+                        answer = await self.translate(direct["answer"], language)
+                        await send({"event": "sources", "source_documents": []})
+                        await send({"event": "token", "text": answer})
+                        await send({"event": "done", "answer": answer, "metrics": {"total_time": time.perf_counter() - start_time}})
+                    else:
+                        stream = AnswerStream(session["chain"], question, callbacks=[trace.handler()])
+                        error = await self.pump_stream(stream, language, send)
+                        if error is not None:
+                            await send(dict(self.error_body(error, session_id, trace), event="error"))
+                    await response.write_eof()
+                except ConnectionResetError as exception:
+                    error = exception  # The client went away; nothing more can be sent
+                except asyncio.CancelledError as exception:
+                    error = exception
+                    raise
+                except Exception as exception:
+                    error = exception
+                    with contextlib.suppress(ConnectionResetError):
+                        await send(dict(self.error_body(exception, session_id, trace), event="error"))
+                        await response.write_eof()
+                finally:
+                    if stream is not None:
+                        stream.cancel()  # No-op once the answer is complete; otherwise stops the generation
+                    trace.finish(
+                        error=error,
+                        session_id=session_id,
+                        streamed=True,
+                        prompt_tokens=trace.prompt_tokens(),
+                        history_tokens=session["chain"].memory.history_tokens()
+                    )
+                return response
+
+    # Define a function to run an AnswerStream on the pool and send its events as they arrive;
+    # returns the exception the answer failed with, or None. Write errors propagate to the caller.
+    async def pump_stream(self, stream, language, send):
+        events = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+
+        def emit(kind, data):
+            loop.call_soon_threadsafe(events.put_nowait, (kind, data))
+
+        # The stream's event generator blocks, so it is drained on a worker thread
+        def pump():
+            try:
+                if language is None:
+                    for kind, data in stream.events():
+                        emit(kind, data)
+                    return
+                # Sentences are translated while the rest of the answer is still being generated
+                pieces = []
+                tokens = stream.tokens(on_sources=functools.partial(emit, "sources"))
+                for piece in get_translator().translate_stream(tokens, language):
+                    if stream.cancelled.is_set():
+                        return
+                    pieces.append(piece)
+                    emit("token", piece)
+                emit("done", dict(stream.response, answer="".join(pieces)))
+            except Exception as error:
+                emit("error", error)
+
+        loop.run_in_executor(self.executor, contextvars.copy_context().run, pump)
+        while True:
+            kind, data = await events.get()
+            if kind == "error":
+                return data
+            if kind == "sources":
+                await send({"event": "sources", "source_documents": serialize_documents(data)})
+            elif kind == "token":
+                await send({"event": "token", "text": data})
+            elif kind == "done":
+                await send({"event": "done", "answer": data.get("answer", ""), "metrics": stream.metrics})
+                return None
+
+    async def verse(self, request):
+        scripture = SCRIPTURES.get(request.query.get("scripture", "gita").lower())
+        try:
+            chapter, verse = int(request.match_info["chapter"]), int(request.match_info["verse"])
+        except ValueError:
+            raise web.HTTPBadRequest(text=json.dumps({"error": "chapter and verse must be numbers"}), content_type="application/json")
+        entry = get_verse_index().get(scripture, chapter, verse)
+        if entry is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "verse not found"}), content_type="application/json")
+        return web.json_response(dict(entry, text=format_verse(entry)))
+
+    async def glossary(self, request):
+        matches = get_glossary_index().lookup(request.match_info["word"])
+        if not matches:
+            raise web.HTTPNotFound(text=json.dumps({"error": "word not found"}), content_type="application/json")
+        return web.json_response({"matches": matches, "text": format_glossary(matches, request.match_info["word"])})
+
+    async def metrics(self, request):
+        return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+    async def health(self, request):
+        return web.json_response({"in_flight": self.in_flight, "waiting": self.waiting, "sessions": len(self.sessions.sessions)})
+
+    # Graceful shutdown: stop taking work, let in-flight answers finish, then release the thread pool
+    async def shutdown(self, app):
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.idle.wait(), timeout=shutdown_timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_app():
+    service = AssistantService()
+    app = web.Application()
+    app["service"] = service
+    app.router.add_post("/ask", service.ask)
+    app.router.add_post("/ask/stream", service.ask_stream)
+    app.router.add_get("/verse/{chapter}/{verse}", service.verse)
+    app.router.add_get("/glossary/{word}", service.glossary)
+    app.router.add_get("/health", service.health)
+    app.router.add_get("/metrics", service.metrics)
+    app.on_shutdown.append(service.shutdown)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the Wisdom Query Assistant over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    # Load the models before accepting traffic so the first request doesn't pay for it
+    setup_vectorstore()
+    web.run_app(create_app(), host=args.host, port=args.port, shutdown_timeout=shutdown_timeout)
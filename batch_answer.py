@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+from rate_limit import RateBudget, retry_async, estimate_tokens
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+default_inputs = [
+    os.path.join(working_dir, "Data", "Bhagwad_Gita_Verses_English_Questions (1).csv"),
+    os.path.join(working_dir, "Data", "Patanjali_Yoga_Sutras_Verses_English_Questions.csv"),
+]
+
+
+def question_id(question):
+    return hashlib.sha1(question.strip().encode("utf-8")).hexdigest()[:16]
+
+
+# Define a function to read questions from CSV files (a `question` column) or JSONL ({"question": ..., "id": ...})
+def read_questions(paths):
+    items = []
+    for path in paths:
+        if path.endswith(".jsonl"):
+            with open(path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = pd.read_csv(path).dropna(subset=["question"]).to_dict("records")
+        for record in records:
+            question = str(record["question"]).strip()
+            if question:
+                items.append({"id": str(record.get("id") or question_id(question)), "question": question})
+    # The same question listed twice is only answered once
+    return list({item["id"]: item for item in items}.values())
+
+
+# Define a function to collect the IDs already answered in an earlier (possibly interrupted) run
+def load_done_ids(output_path):
+    done = set()
+    if os.path.exists(output_path):
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Last line cut off by the interruption
+                if "answer" in record:
+                    done.add(record["id"])
+    return done
+
+
+# Define a function to retrieve documents for many questions with the app's retriever (metadata
+# filters, BM25 fusion, diversification and packing). The questions are embedded in one model call
+# up front, so the retriever's own per-question embedding is a cache hit.
+def retrieve_batch(retriever, embeddings, questions):
+    embeddings.embed_queries(questions)
+    return [retriever.invoke(question) for question in questions]
+
+
+class BatchAnswerer:
+    def __init__(self, llm, output_path, requests_per_minute, tokens_per_minute, concurrency, attempts, max_answer_tokens):
+        from langchain.chains.question_answering.stuff_prompt import PROMPT_SELECTOR
+
+        self.llm = llm
+        self.prompt = PROMPT_SELECTOR.get_prompt(llm)  # Same "stuff" prompt the conversational chain uses
+        self.output_path = output_path
+        self.budget = RateBudget(requests_per_minute, tokens_per_minute)
+        self.slots = asyncio.Semaphore(concurrency)
+        self.attempts = attempts
+        self.max_answer_tokens = max_answer_tokens
+        self.write_lock = asyncio.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    async def write(self, record):
+        async with self.write_lock:
+            with open(self.output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def answer(self, item, documents, retrieval_time):
+        async with self.slots:
+            start_time = time.perf_counter()
+            context = "\n\n".join(document.page_content for document in documents)
+            messages = self.prompt.format_messages(context=context, question=item["question"])
+            prompt_tokens = estimate_tokens(context + item["question"])
+            estimated = prompt_tokens + self.max_answer_tokens
+            record = {"id": item["id"], "question": item["question"]}
+            calls = 0
+            queued = None
+
+            # Every attempt is a request of its own, so each one pays the budget; a failed attempt's
+            # token estimate is refunded (the request itself still counts against the RPM limit)
+            async def call():
+                nonlocal calls, queued
+                await self.budget.acquire(estimated)
+                if queued is None:
+                    queued = time.perf_counter() - start_time
+                calls += 1
+                try:
+                    return await self.llm.ainvoke(messages)
+                except Exception:
+                    self.budget.settle(estimated, 0)
+                    raise
+
+            try:
+                result, attempts = await retry_async(call, attempts=self.attempts)
+            except Exception as error:
+                self.failed += 1
+                record.update({"error": repr(error), "attempts": calls})
+            else:
+                usage = (result.response_metadata or {}).get("token_usage", {})
+                self.budget.settle(estimated, usage.get("total_tokens") or prompt_tokens + estimate_tokens(result.content))
+                self.completed += 1
+                record.update({
+                    "answer": result.content,
+                    "sources": [document.metadata for document in documents],
+                    "attempts": attempts,
+                    "tokens": usage.get("total_tokens"),
+                })
+            queued = time.perf_counter() - start_time if queued is None else queued
+            record["timings"] = {
+                "retrieval_ms": round(1000 * retrieval_time, 2),
+                "queue_ms": round(1000 * queued, 2),
+                "llm_ms": round(1000 * (time.perf_counter() - start_time - queued), 2),
+            }
+            await self.write(record)
+
+
+async def run(args):
+    from resources import setup_vectorstore, get_embeddings, get_llm, build_retriever, load_config
+    from context_packing import default_token_budget
+
+    items = read_questions(args.inputs or default_inputs)
+    done = load_done_ids(args.output)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} questions, {len(done)} already answered, {len(pending)} to go")
+
+    # The same retriever and context budget as the chat chain, so a batch answer matches the app's
+    retriever = build_retriever(
+        setup_vectorstore(), k=args.k, token_budget=load_config().get("CONTEXT_TOKEN_BUDGET", default_token_budget)
+    )
+    embeddings = get_embeddings()
+    answerer = BatchAnswerer(
+        get_llm(args.model) if args.model else get_llm(), args.output, args.rpm, args.tpm,
+        args.concurrency, args.attempts, args.max_answer_tokens
+    )
+    loop = asyncio.get_running_loop()
+    start_time = time.perf_counter()
+    tasks = []
+    for i in range(0, len(pending), args.batch_size):
+        batch = pending[i:i + args.batch_size]
+        retrieval_start = time.perf_counter()
+        # Retrieval for the next batch runs while earlier answers are still being generated
+        documents = await loop.run_in_executor(
+            None, retrieve_batch, retriever, embeddings, [item["question"] for item in batch]
+        )
+        per_item = (time.perf_counter() - retrieval_start) / len(batch)
+        tasks.extend(asyncio.create_task(answerer.answer(item, docs, per_item)) for item, docs in zip(batch, documents))
+        # Don't retrieve too far ahead of the rate-limited answering
+        while len(tasks) > args.concurrency * 4:
+            _, still_running = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            tasks = list(still_running)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start_time
+    print(f"Answered {answerer.completed}, failed {answerer.failed} in {elapsed:.1f}s "
+          f"({answerer.completed / max(elapsed, 1e-9):.2f} answers/sec); results in {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate answers for a list of questions")
+    parser.add_argument("inputs", nargs="*", help="CSV files with a 'question' column or JSONL files (default: the Questions CSVs)")
+    parser.add_argument("--output", default="batch_answers.jsonl")
+    parser.add_argument("--model", default=None, help="Groq model to answer with (default: the app's model)")
+    parser.add_argument("--k", type=int, default=4, help="Documents retrieved per question")
+    parser.add_argument("--batch-size", type=int, default=64, help="Questions embedded per model call")
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight")
+    parser.add_argument("--rpm", type=float, default=30, help="Requests per minute budget")
+    parser.add_argument("--tpm", type=float, default=6000, help="Tokens per minute budget")
+    parser.add_argument("--attempts", type=int, default=5, help="Tries per question before recording an error")
+    parser.add_argument("--max-answer-tokens", type=int, default=512, help="Answer size assumed when budgeting")
+    asyncio.run(run(parser.parse_args()))
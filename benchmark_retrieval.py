@@ -0,0 +1,209 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import random
+import time
+import numpy as np
+
+# Retrieval benchmark: the Questions CSVs pair every question with its chapter/verse, which gives
+# free ground truth for recall@k and MRR; results go to JSON so runs can be compared
+working_dir = os.path.dirname(os.path.abspath(__file__))
+results_directory = os.path.join(working_dir, "benchmark_results")
+k_values = (1, 4, 10)
+ingest_embedding_sample = 256  # Chunks embedded (uncached) to measure embedding throughput
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    values = 1000 * np.asarray(latencies)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2), "mean_ms": round(values.mean(), 2)}
+
+
+def directory_size_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return round(total / 2 ** 20, 2)
+
+
+# Define a function to read the resident set size of this process in MB
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 2)
+    except OSError:
+        pass
+    import resource  # Not Linux: fall back to the peak RSS (KB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2 ** 20 if peak > 2 ** 32 else 1024), 2)
+
+
+# Define a function to pick a reproducible subset of the benchmark questions
+def sample_questions(questions, limit, seed=0):
+    if not limit or limit >= len(questions):
+        return questions
+    return random.Random(seed).sample(questions, limit)
+
+
+# Define a function to score a retriever: rank of the first relevant chunk per question, plus latency
+def evaluate_retriever(retrieve, questions, k_values=k_values):
+    from verse_lookup import is_relevant
+
+    max_k = max(k_values)
+    ranks = []
+    latencies = []
+    for question, scripture, chapter, verse in questions:
+        start_time = time.perf_counter()
+        documents = retrieve(question)[:max_k]
+        latencies.append(time.perf_counter() - start_time)
+        rank = next((i + 1 for i, doc in enumerate(documents) if is_relevant(doc.metadata, scripture, chapter, verse)), None)
+        ranks.append(rank)
+    count = max(len(questions), 1)
+    report = {f"recall@{k}": round(sum(1 for rank in ranks if rank and rank <= k) / count, 4) for k in k_values}
+    report[f"mrr@{max_k}"] = round(sum(1.0 / rank for rank in ranks if rank) / count, 4)
+    report["latency"] = percentiles(latencies)
+    return report
+
+
+# Define a function to measure ingest throughput without touching the vector store: parsing and
+# chunking of every CSV, then embedding a sample of the chunks with the uncached model
+def measure_ingest(embeddings=None):
+    from vectorize_documents import data_directory, iter_csv_documents, iter_chunks
+
+    start_time = time.perf_counter()
+    rows = 0
+    chunks = []
+    for file_path in sorted(glob.glob(os.path.join(data_directory, "*.csv"))):
+        documents = list(iter_csv_documents(file_path))
+        rows += len(documents)
+        chunks.extend(chunk.page_content for _, _, chunk in iter_chunks(documents))
+    parse_time = time.perf_counter() - start_time
+    report = {
+        "rows": rows,
+        "chunks": len(chunks),
+        "parse_seconds": round(parse_time, 3),
+        "rows_per_second": round(rows / max(parse_time, 1e-9), 1),
+    }
+    if embeddings is not None and chunks:
+        sample = chunks[:ingest_embedding_sample]
+        model = getattr(embeddings, "embeddings", embeddings)  # Bypass CachedEmbeddings: measure the model
+        start_time = time.perf_counter()
+        model.embed_documents(sample)
+        embed_time = time.perf_counter() - start_time
+        report["embedded_sample"] = len(sample)
+        report["embed_chunks_per_second"] = round(len(sample) / max(embed_time, 1e-9), 1)
+    return report
+
+
+# Define a function to time whole questions through the chat chain, answered by the offline stub model
+def measure_end_to_end(vectorstore, questions):
+    from resources import chat_chain
+    from stub_llm import StubChatModel
+    from tracing import start_trace
+
+    llm = StubChatModel()
+    latencies = []
+    prompt_tokens = []
+    context_characters = []
+    for question, *_ in questions:
+        chain = chat_chain(vectorstore, llm=llm)  # Fresh memory: every question is a first turn
+        trace = start_trace(question)
+        start_time = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):  # The chain is verbose
+                response = chain.invoke({"question": question}, config={"callbacks": [trace.handler()]})
+            latencies.append(time.perf_counter() - start_time)
+        finally:
+            chain.memory.clear()  # Don't leave benchmark conversations in the session store
+        trace.finish(benchmark=True)
+        prompt_tokens.append(trace.prompt_tokens())
+        context_characters.append(sum(len(doc.page_content) for doc in response["source_documents"]))
+    return {
+        "questions": len(questions),
+        "latency": percentiles(latencies),
+        "mean_prompt_tokens": round(float(np.mean(prompt_tokens)), 1) if prompt_tokens else None,
+        "mean_context_characters": round(float(np.mean(context_characters)), 1) if context_characters else None,
+    }
+
+
+def run_benchmark(limit=None, e2e_limit=50, skip_ingest=False):
+    from resources import persist_directory, get_embeddings, setup_vectorstore, get_bm25_index, build_retriever
+    from bm25_index import default_index_directory as bm25_directory
+    from verse_lookup import load_question_verses
+
+    questions = sample_questions(load_question_verses(), limit)
+    report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "questions": len(questions)}
+
+    rss_start = current_rss_mb()
+    embeddings = get_embeddings()
+    rss_model = current_rss_mb()
+    vectorstore = setup_vectorstore()
+    bm25_index = get_bm25_index()
+    retriever = build_retriever(vectorstore, k=max(k_values))
+    retriever.invoke("warm up")  # Loads the collection and HNSW index into memory
+    rss_index = current_rss_mb()
+    report["index"] = {
+        "retriever": type(retriever).__name__,
+        "vector_index": type(vectorstore).__name__,
+        "chunks": len(vectorstore) if hasattr(vectorstore, "__len__") else vectorstore._collection.count(),
+        "vector_db_disk_mb": directory_size_mb(getattr(vectorstore, "directory", persist_directory)),
+        "bm25_disk_mb": directory_size_mb(bm25_directory) if bm25_index is not None else 0.0,
+        "embedding_model_ram_mb": round(rss_model - rss_start, 2),
+        "index_ram_mb": round(rss_index - rss_model, 2),
+        "process_rss_mb": rss_index,
+    }
+    if hasattr(vectorstore, "router"):
+        from retrieval_filters import parse_metadata_filter
+
+        # Share of all vectors in the shards each question is routed to
+        fractions = [vectorstore.router.scanned_fraction(vectorstore.route(
+            question, embeddings.embed_query(question), parse_metadata_filter(question)
+        )) for question, *_ in questions]
+        report["index"]["shard_chunks"] = {name: info["count"] for name, info in vectorstore.router.shards.items()}
+        report["index"]["mean_scanned_fraction"] = round(float(np.mean(fractions)), 4) if fractions else None
+
+    report["retrieval"] = evaluate_retriever(retriever.invoke, questions)
+    if not skip_ingest:
+        report["ingest"] = measure_ingest(embeddings)
+    report["end_to_end"] = measure_end_to_end(vectorstore, sample_questions(questions, e2e_limit, seed=1))
+    return report
+
+
+# Define a function to print how each numeric metric moved against an earlier run
+def compare_reports(previous, current, prefix=""):
+    for key, value in current.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if isinstance(value, dict):
+            compare_reports(old or {}, value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and not isinstance(value, bool):
+            change = f"{100 * (value - old) / old:+.1f}%" if old else "n/a"
+            print(f"  {prefix + key:<40} {old:>12} -> {value:<12} ({change})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality, latency and index size")
+    parser.add_argument("--limit", type=int, default=None, help="Questions to evaluate (default: all)")
+    parser.add_argument("--e2e-limit", type=int, default=50, help="Questions timed through the full chain")
+    parser.add_argument("--skip-ingest", action="store_true", help="Don't measure parsing/embedding throughput")
+    parser.add_argument("--output", default=None, help="JSON file to write (default: benchmark_results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.limit, args.e2e_limit, args.skip_ingest)
+    output = args.output or os.path.join(results_directory, f"retrieval-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Saved to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print(f"Compared with {args.compare}:")
+            compare_reports(json.load(f), report)
@@ -0,0 +1,207 @@
+import json
+import math
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_core.retrievers import BaseRetriever
+from tracing import span
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+default_index_directory = os.path.join(working_dir, "bm25_index")
+
+TOKEN_PATTERN = re.compile(r"[\wऀ-ॿ]+(?:-[\wऀ-ॿ]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "for", "from", "how", "i", "in", "is", "it",
+    "me", "of", "on", "or", "say", "says", "that", "the", "this", "to", "was", "what", "when", "which",
+    "who", "why", "with", "about", "do", "can", "should", "tell",
+}
+
+
+# Define a function to fold Latin diacritics ("prajña" -> "prajna") while keeping Devanagari vowel signs intact
+def fold_diacritics(text):
+    decomposed = unicodedata.normalize("NFKD", text)
+    kept = []
+    latin_base = False
+    for char in decomposed:
+        if unicodedata.combining(char):
+            if latin_base:
+                continue
+        else:
+            latin_base = char < "ɐ"
+        kept.append(char)
+    return unicodedata.normalize("NFC", "".join(kept))
+
+
+# Hyphenated compounds ("sthita-prajña") index both their parts and the joined form
+def tokenize(text):
+    tokens = []
+    for match in TOKEN_PATTERN.findall(fold_diacritics(text).lower()):
+        parts = match.split("-")
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+        tokens.extend(part for part in parts if part and part not in STOPWORDS)
+    return tokens
+
+
+# Define a function to build and persist a BM25 inverted index over (id, text) pairs.
+# Postings are stored as flat .npy arrays so they can be memory-mapped at query time.
+def build_bm25_index(ids, texts, directory=default_index_directory):
+    start_time = time.perf_counter()
+    postings = defaultdict(list)
+    doc_lengths = np.zeros(len(ids), dtype=np.int32)
+    for doc_index, text in enumerate(texts):
+        counts = Counter(tokenize(text or ""))
+        doc_lengths[doc_index] = sum(counts.values())
+        for term, tf in counts.items():
+            postings[term].append((doc_index, tf))
+
+    vocabulary = {}
+    postings_docs = []
+    postings_tf = []
+    offset = 0
+    for term in sorted(postings):
+        entries = postings[term]
+        vocabulary[term] = [offset, len(entries)]
+        postings_docs.extend(doc_index for doc_index, _ in entries)
+        postings_tf.extend(tf for _, tf in entries)
+        offset += len(entries)
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "postings_docs.npy"), np.asarray(postings_docs, dtype=np.int32))
+    np.save(os.path.join(directory, "postings_tf.npy"), np.asarray(postings_tf, dtype=np.float32))
+    np.save(os.path.join(directory, "doc_lengths.npy"), doc_lengths)
+    with open(os.path.join(directory, "vocabulary.json"), "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+    with open(os.path.join(directory, "doc_ids.json"), "w", encoding="utf-8") as f:
+        json.dump(list(ids), f)
+    return time.perf_counter() - start_time
+
+
+# Read-only BM25 index over the persisted arrays (memory-mapped, so processes share the pages)
+class BM25Index:
+    def __init__(self, directory=default_index_directory, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings_docs = np.load(os.path.join(directory, "postings_docs.npy"), mmap_mode="r")
+        self.postings_tf = np.load(os.path.join(directory, "postings_tf.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(directory, "doc_lengths.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "vocabulary.json"), encoding="utf-8") as f:
+            self.vocabulary = json.load(f)
+        with open(os.path.join(directory, "doc_ids.json"), encoding="utf-8") as f:
+            self.doc_ids = json.load(f)
+        self.average_length = float(self.doc_lengths.mean()) if len(self.doc_lengths) else 0.0
+
+    @classmethod
+    def exists(cls, directory=default_index_directory):
+        return os.path.exists(os.path.join(directory, "doc_ids.json"))
+
+    # Define a function to return the top-k (doc_id, score) pairs for a query
+    def search(self, query, k=10):
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        doc_count = len(self.doc_ids)
+        for term in set(tokenize(query)):
+            if term not in self.vocabulary:
+                continue
+            offset, length = self.vocabulary[term]
+            docs = self.postings_docs[offset:offset + length]
+            tf = self.postings_tf[offset:offset + length]
+            idf = math.log(1 + (doc_count - length + 0.5) / (length + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / (self.average_length or 1.0))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+        top = min(k, int(np.count_nonzero(scores)))
+        if not top:
+            return []
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(self.doc_ids[i], float(scores[i])) for i in best]
+
+
+# Define a function to check Chroma-style equality / $and filters against a metadata dict
+def matches_filter(metadata, metadata_filter):
+    if not metadata_filter:
+        return True
+    if "$and" in metadata_filter:
+        return all(matches_filter(metadata, condition) for condition in metadata_filter["$and"])
+    return all(metadata.get(key) == value for key, value in metadata_filter.items())
+
+
+# Hybrid retriever: dense results from `dense_retriever` and lexical BM25 hits are fused with
+# reciprocal rank fusion. BM25 hits are fetched back from the vectorstore by chunk ID; on a sharded
+# store only from the shards the dense search was routed to, so both rankings cover the same subset.
+class HybridRetriever(BaseRetriever):
+    dense_retriever: Any
+    bm25_index: Any
+    vectorstore: Any
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        dense_documents, metadata_filter, shards = self.dense_retriever.search_routed(query, k=self.fetch_k)
+        with span("bm25_search") as attributes:
+            lexical_ids = [doc_id for doc_id, _ in self.bm25_index.search(query, k=self.fetch_k)]
+            lexical_documents = []
+            if lexical_ids:
+                routing = {} if shards is None else {"shards": shards}
+                found = self.vectorstore.get(ids=lexical_ids, include=["documents", "metadatas"], **routing)
+                by_id = {
+                    doc_id: Document(page_content=text, metadata=metadata or {})
+                    for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+                }
+                lexical_documents = [
+                    by_id[doc_id] for doc_id in lexical_ids
+                    if doc_id in by_id and matches_filter(by_id[doc_id].metadata, metadata_filter)
+                ]
+            attributes["documents"] = len(lexical_documents)
+
+        scores = defaultdict(float)
+        documents = {}
+        for ranking in (dense_documents, lexical_documents):
+            for rank, document in enumerate(ranking):
+                documents.setdefault(document.page_content, document)
+                scores[document.page_content] += 1.0 / (self.rrf_k + rank + 1)
+        fused = sorted(scores, key=scores.get, reverse=True)[:self.k]
+        return [documents[key] for key in fused]
+
+
+# Define a function to measure recall@k and mean latency of a retrieval function over the curated questions
+def evaluate_recall(retrieve, questions, k):
+    from verse_lookup import is_relevant
+
+    found = 0
+    latencies = []
+    for question, scripture, chapter, verse in questions:
+        start_time = time.perf_counter()
+        documents = retrieve(question)[:k]
+        latencies.append(time.perf_counter() - start_time)
+        if any(is_relevant(document.metadata, scripture, chapter, verse) for document in documents):
+            found += 1
+    return found / max(len(questions), 1), 1000 * sum(latencies) / max(len(latencies), 1)
+
+
+if __name__ == "__main__":
+    from resources import setup_vectorstore, get_bm25_index
+    from retrieval_filters import MetadataFilteredRetriever
+    from verse_lookup import load_question_verses
+
+    k = 4
+    vectorstore = setup_vectorstore()
+    index = get_bm25_index()
+    dense = MetadataFilteredRetriever(vectorstore=vectorstore, k=k)
+    hybrid = HybridRetriever(dense_retriever=dense, bm25_index=index, vectorstore=vectorstore, k=k)
+
+    def lexical(question):
+        ids = [doc_id for doc_id, _ in index.search(question, k=k)]
+        found = vectorstore.get(ids=ids, include=["documents", "metadatas"])
+        return [Document(page_content=text, metadata=metadata) for text, metadata in zip(found["documents"], found["metadatas"])]
+
+    questions = load_question_verses()
+    print(f"{len(questions)} questions, recall@{k}:")
+    for name, retrieve in (("bm25", lexical), ("dense", lambda q: dense.search(q)[0]), ("hybrid", hybrid.invoke)):
+        recall, latency = evaluate_recall(retrieve, questions, k)
+        print(f"  {name:<7} recall={recall:.3f}  mean latency={latency:.1f} ms")
@@ -0,0 +1,436 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from langchain.docstore.document import Document
+from shards import ShardRouter, default_max_shards, shard_attributes, shard_for_source
+from tracing import span
+
+# Read-only export of the Chroma collection for serving: vectors as one memory-mapped float16 or
+# int8 matrix, texts/ids as UTF-8 blobs with offsets, metadata as one array per field. Every file
+# is opened with mmap, so worker processes on a machine share the same page-cache pages instead
+# of each loading its own copy of the HNSW index and pickled metadata.
+# Each export is written to its own version directory and published by atomically replacing the
+# CURRENT pointer, so an open index keeps reading the files it mapped and never sees a half-written
+# export; the next CompactIndex() opens the new version.
+working_dir = os.path.dirname(os.path.abspath(__file__))
+default_index_directory = os.path.join(working_dir, "compact_index")
+export_page_size = 5000  # Rows read from Chroma per call while exporting
+block_rows = 8192  # Rows scored per NumPy matmul, bounding the float32 scratch space per query
+kmeans_sample = 20000
+kmeans_iterations = 10
+current_pointer = "CURRENT"  # File naming the version directory served by the next open
+
+
+def write_strings(directory, name, values):
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(directory, f"{name}.offsets.npy"), offsets)
+
+
+# Memory-mapped list of strings stored as a UTF-8 blob plus offsets
+class StringColumn:
+    def __init__(self, directory, name):
+        self.offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        path = os.path.join(directory, f"{name}.bin")
+        self.blob = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return bytes(self.blob[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8")
+
+
+# Define a function to write metadata as columns: integers as int64 arrays, strings dictionary-encoded
+def write_metadata_columns(directory, metadatas):
+    keys = sorted({key for metadata in metadatas for key in metadata})
+    columns = {}
+    for key in keys:
+        values = [metadata.get(key) for metadata in metadatas]
+        present = np.array([value is not None for value in values])
+        if all(isinstance(value, int) and not isinstance(value, bool) for value in values if value is not None):
+            np.save(os.path.join(directory, f"meta.{key}.npy"), np.array([value or 0 for value in values], dtype=np.int64))
+            np.save(os.path.join(directory, f"meta.{key}.present.npy"), present)
+            columns[key] = "int"
+        else:
+            categories = sorted({str(value) for value in values if value is not None})
+            lookup = {category: code for code, category in enumerate(categories)}
+            codes = np.array([lookup[str(value)] if value is not None else -1 for value in values], dtype=np.int32)
+            np.save(os.path.join(directory, f"meta.{key}.npy"), codes)
+            with open(os.path.join(directory, f"meta.{key}.categories.json"), "w", encoding="utf-8") as f:
+                json.dump(categories, f, ensure_ascii=False)
+            columns[key] = "str"
+    return columns
+
+
+# Define a function to store each row's shard as a code column and return the routing table
+# (count and centroid per shard) ShardRouter reads, computed from the exported unit vectors
+def write_shard_column(directory, metadatas, vectors):
+    rows = [shard_for_source(metadata.get("source", "")) for metadata in metadatas]
+    names = sorted(set(rows))
+    lookup = {name: code for code, name in enumerate(names)}
+    codes = np.array([lookup[name] for name in rows], dtype=np.int16)
+    np.save(os.path.join(directory, "shards.npy"), codes)
+    shards = {}
+    for code, name in enumerate(names):
+        total = vectors[codes == code].sum(axis=0)
+        centroid = (total / max(float(np.linalg.norm(total)), 1e-12)).tolist()
+        shards[name] = {**shard_attributes(name), "count": int((codes == code).sum()), "centroid": centroid}
+    return shards
+
+
+# Define a function to cluster unit vectors with spherical k-means (the IVF coarse quantizer)
+def train_centroids(vectors, nlist, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), kmeans_sample), replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(kmeans_iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(nlist):
+            members = sample[assignments == cluster]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[cluster] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids
+
+
+def assign_lists(vectors, centroids):
+    return np.concatenate([
+        np.argmax(vectors[i:i + block_rows] @ centroids.T, axis=1) for i in range(0, len(vectors), block_rows)
+    ])
+
+
+# Define a function to find the version directory an index opens: the one CURRENT names, or the
+# directory itself for an export written before versioning
+def version_directory(directory=default_index_directory):
+    pointer = os.path.join(directory, current_pointer)
+    if not os.path.exists(pointer):
+        return directory
+    with open(pointer, encoding="utf-8") as f:
+        return os.path.join(directory, f.read().strip())
+
+
+# Define a function to point CURRENT at a finished version and remove all but it and the previous
+# one; the previous version is kept for a process that read the old pointer but has not mapped it yet
+def publish_version(directory, version):
+    previous = os.path.basename(version_directory(directory)) if os.path.exists(os.path.join(directory, current_pointer)) else None
+    tmp_path = os.path.join(directory, f"{current_pointer}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(directory, current_pointer))
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name in (version, previous, current_pointer):
+            continue
+        # Unlinking a mapped file is safe on POSIX; where the OS refuses, the next export retries
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# Define a function to export a Chroma collection to the compact format; returns the export time
+def export_compact_index(vectorstore, directory=default_index_directory, dtype="int8", nlist=0):
+    start_time = time.perf_counter()
+    ids, texts, metadatas, vectors = [], [], [], []
+    offset = 0
+    while True:
+        page = vectorstore.get(limit=export_page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        metadatas.extend(metadata or {} for metadata in page["metadatas"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    vectors = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    # Unit length, so the dot product ranks like cosine similarity
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    root = directory
+    os.makedirs(root, exist_ok=True)
+    directory = tempfile.mkdtemp(dir=root, prefix="v")
+    os.chmod(directory, 0o755)  # mkdtemp creates it private to this user
+    meta = {"count": len(ids), "dim": int(vectors.shape[1]) if len(ids) else 0, "dtype": dtype, "nlist": 0}
+    if nlist and len(ids) > nlist:
+        # Rows of the same inverted list are stored contiguously, so a probe scans plain slices
+        centroids = train_centroids(vectors, nlist)
+        lists = assign_lists(vectors, centroids)
+        order = np.argsort(lists, kind="stable")
+        vectors = vectors[order]
+        ids, texts, metadatas = ([values[i] for i in order] for values in (ids, texts, metadatas))
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=nlist), out=list_offsets[1:])
+        np.save(os.path.join(directory, "centroids.npy"), centroids.astype(np.float32))
+        np.save(os.path.join(directory, "list_offsets.npy"), list_offsets)
+        meta["nlist"] = nlist
+
+    if dtype == "int8":
+        # Symmetric per-dimension scale; the query is multiplied by it instead of dequantizing the matrix
+        scales = np.maximum(np.abs(vectors).max(axis=0), 1e-12) / 127.0 if len(ids) else np.ones(0, np.float32)
+        np.save(os.path.join(directory, "vectors.npy"), np.round(vectors / scales).astype(np.int8))
+        np.save(os.path.join(directory, "scales.npy"), scales.astype(np.float32))
+    else:
+        np.save(os.path.join(directory, "vectors.npy"), vectors.astype(np.float16))
+
+    meta["shards"] = write_shard_column(directory, metadatas, vectors)
+    write_strings(directory, "ids", ids)
+    write_strings(directory, "texts", texts)
+    meta["columns"] = write_metadata_columns(directory, metadatas)
+    meta["exported_at"] = time.time()
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    publish_version(root, os.path.basename(directory))
+    return time.perf_counter() - start_time
+
+
+# Read-only vector index over the exported files. It answers the subset of the vectorstore API the
+# retrievers use (similarity_search_by_vector, get by ids, route, embeddings), so MetadataFilteredRetriever
+# and HybridRetriever work on it unchanged. Routing picks the same shards ShardedVectorStore would,
+# from the shard column and centroids stored with the export, and masks rows of every other shard.
+class CompactIndex:
+    def __init__(self, directory=default_index_directory, embeddings=None, nprobe=8, max_shards=default_max_shards):
+        self.embeddings = embeddings
+        self.nprobe = nprobe
+        # Resolved once: everything below is mapped from this version even if a newer one is published
+        self.directory = directory = version_directory(directory)
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(directory, "scales.npy")) if self.meta["dtype"] == "int8" else None
+        self.ids = StringColumn(directory, "ids")
+        self.texts = StringColumn(directory, "texts")
+        self.columns = {}
+        for key, kind in self.meta["columns"].items():
+            values = np.load(os.path.join(directory, f"meta.{key}.npy"), mmap_mode="r")
+            if kind == "int":
+                present = np.load(os.path.join(directory, f"meta.{key}.present.npy"), mmap_mode="r")
+                self.columns[key] = (kind, values, present)
+            else:
+                with open(os.path.join(directory, f"meta.{key}.categories.json"), encoding="utf-8") as f:
+                    categories = json.load(f)
+                self.columns[key] = (kind, values, categories)
+        self.category_codes = {}
+        self.row_by_id = None
+        # Exports written before the shard column are searched whole: route() returns None for them
+        self.router = ShardRouter(self.meta.get("shards", {}), max_shards=max_shards)
+        self.shard_codes = np.load(os.path.join(directory, "shards.npy"), mmap_mode="r") if "shards" in self.meta else None
+        self.shard_names = list(self.meta.get("shards", {}))
+        if self.meta["nlist"]:
+            self.centroids = np.load(os.path.join(directory, "centroids.npy"))
+            self.list_offsets = np.load(os.path.join(directory, "list_offsets.npy"))
+
+    @staticmethod
+    def exists(directory=default_index_directory):
+        return os.path.exists(os.path.join(version_directory(directory), "meta.json"))
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def _column_mask(self, key, condition):
+        if key not in self.columns:
+            return np.zeros(len(self), dtype=bool)
+        values = condition.get("$in", [condition.get("$eq")]) if isinstance(condition, dict) else [condition]
+        kind, column, extra = self.columns[key]
+        if kind == "int":
+            return np.isin(column, [value for value in values if isinstance(value, int)]) & extra
+        if key not in self.category_codes:
+            self.category_codes[key] = {category: code for code, category in enumerate(extra)}
+        codes = [self.category_codes[key][str(value)] for value in values if str(value) in self.category_codes[key]]
+        return np.isin(column, codes)
+
+    # Define a function to turn a Chroma-style filter ({"key": value}, $eq, $in, $and) into a row mask
+    def filter_mask(self, metadata_filter):
+        if "$and" in metadata_filter:
+            return np.logical_and.reduce([self.filter_mask(condition) for condition in metadata_filter["$and"]])
+        return np.logical_and.reduce([self._column_mask(key, value) for key, value in metadata_filter.items()])
+
+    def route(self, query=None, vector=None, metadata_filter=None):
+        if self.shard_codes is None:
+            return None
+        return self.router.route(query, vector, metadata_filter)
+
+    # Define a function to turn a list of shard names into a row mask
+    def shard_mask(self, shards):
+        codes = [code for code, name in enumerate(self.shard_names) if name in shards]
+        return np.isin(self.shard_codes, codes)
+
+    def _candidate_ranges(self, query):
+        if not self.meta["nlist"]:
+            return [(0, len(self))]
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        return [(self.list_offsets[probe], self.list_offsets[probe + 1]) for probe in sorted(probes)]
+
+    # Define a function to find the k best rows for a query vector: [(row, score)], best first
+    # With `shards`, rows of any other shard are skipped
+    def search(self, vector, k=4, metadata_filter=None, shards=None):
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        scaled = query * self.scales if self.scales is not None else query
+        mask = self.filter_mask(metadata_filter) if metadata_filter else None
+        if shards is not None and self.shard_codes is not None:
+            mask = self.shard_mask(shards) if mask is None else mask & self.shard_mask(shards)
+        best_rows, best_scores = [], []
+        for start, end in self._candidate_ranges(query):
+            for block_start in range(start, end, block_rows):
+                block_end = min(block_start + block_rows, end)
+                scores = self.vectors[block_start:block_end].astype(np.float32) @ scaled
+                if mask is not None:
+                    scores[~mask[block_start:block_end]] = -np.inf
+                top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k] if len(scores) > k else np.arange(len(scores))
+                best_rows.append(top + block_start)
+                best_scores.append(scores[top])
+        if not best_rows:
+            return []
+        rows, scores = np.concatenate(best_rows), np.concatenate(best_scores)
+        order = np.argsort(-scores)[:k]
+        return [(int(rows[i]), float(scores[i])) for i in order if np.isfinite(scores[i])]
+
+    def metadata(self, row):
+        metadata = {}
+        for key, (kind, column, extra) in self.columns.items():
+            if kind == "int":
+                if extra[row]:
+                    metadata[key] = int(column[row])
+            elif column[row] >= 0:
+                metadata[key] = extra[column[row]]
+        return metadata
+
+    def document(self, row):
+        return Document(page_content=self.texts[row], metadata=self.metadata(row))
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, shards=None, **kwargs):
+        if shards is None:
+            shards = self.route(vector=embedding, metadata_filter=filter)
+        if shards is None:
+            return [self.document(row) for row, _ in self.search(embedding, k, filter)]
+        with span("shard_search", shards=",".join(shards), scanned_fraction=self.router.scanned_fraction(shards)):
+            return [self.document(row) for row, _ in self.search(embedding, k, filter, shards)]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        vector = self.embeddings.embed_query(query)
+        return self.similarity_search_by_vector(vector, k, filter, shards=self.route(query, vector, filter))
+
+    # With `shards`, IDs that live in any other shard are skipped, as on ShardedVectorStore
+    def get(self, ids=None, include=("documents", "metadatas"), shards=None, **kwargs):
+        if self.row_by_id is None:
+            self.row_by_id = {self.ids[row]: row for row in range(len(self))}
+        rows = [self.row_by_id[doc_id] for doc_id in ids if doc_id in self.row_by_id] if ids is not None else range(len(self))
+        if shards is not None and self.shard_codes is not None:
+            allowed = self.shard_mask(shards)
+            rows = [row for row in rows if allowed[row]]
+        found = {"ids": [self.ids[row] for row in rows]}
+        if "documents" in include:
+            found["documents"] = [self.texts[row] for row in rows]
+        if "metadatas" in include:
+            found["metadatas"] = [self.metadata(row) for row in rows]
+        return found
+
+    def as_retriever(self, k=4, metadata_filter=None):
+        from retrieval_filters import MetadataFilteredRetriever
+
+        return MetadataFilteredRetriever(vectorstore=self, k=k, filter=metadata_filter)
+
+
+def memory_status():
+    status = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "RssAnon", "RssFile"):
+                status[name] = round(int(value.split()[0]) / 1024, 2)
+    return status
+
+
+# Define a function to open one backend in this (fresh) process and time it, for the cold-start comparison
+def probe(backend, vector_path, k=4):
+    vector = np.load(vector_path)
+    start_time = time.perf_counter()
+    if backend == "chroma":
+        from shards import open_vectorstore
+        from resources import persist_directory
+
+        store = open_vectorstore(directory=persist_directory)
+    else:
+        store = CompactIndex()
+    opened = time.perf_counter()
+    store.similarity_search_by_vector(vector.tolist(), k=k)
+    first_query = time.perf_counter()
+    for _ in range(20):
+        store.similarity_search_by_vector(vector.tolist(), k=k)
+    return {
+        "open_seconds": round(opened - start_time, 4),
+        "first_query_seconds": round(first_query - opened, 4),
+        "warm_query_ms": round(1000 * (time.perf_counter() - first_query) / 20, 3),
+        **{name.lower() + "_mb": value for name, value in memory_status().items()},
+    }
+
+
+# Define a function to compare Chroma and the compact index: cold start and memory in fresh
+# processes, then recall@k of each as a plain dense retriever on the Questions CSVs
+def compare(limit=None, k=4):
+    from resources import setup_vectorstore, get_embeddings
+    from retrieval_filters import MetadataFilteredRetriever
+    from benchmark_retrieval import evaluate_retriever, sample_questions, directory_size_mb
+    from verse_lookup import load_question_verses
+
+    embeddings = get_embeddings()
+    report = {}
+    with tempfile.NamedTemporaryFile(suffix=".npy", delete=False) as f:
+        np.save(f, np.asarray(embeddings.embed_query("What is the nature of the self?"), dtype=np.float32))
+        vector_path = f.name
+    for backend in ("chroma", "compact"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "probe", backend, vector_path],
+            capture_output=True, text=True, check=True, cwd=working_dir
+        ).stdout
+        report[backend] = json.loads(output.strip().splitlines()[-1])
+    os.unlink(vector_path)
+
+    from resources import persist_directory
+
+    report["chroma"]["disk_mb"] = directory_size_mb(persist_directory)
+    report["compact"]["disk_mb"] = directory_size_mb(version_directory())
+    questions = sample_questions(load_question_verses(), limit)
+    compact = CompactIndex(embeddings=embeddings)
+    for backend, store in (("chroma", setup_vectorstore()), ("compact", compact)):
+        retriever = MetadataFilteredRetriever(vectorstore=store, k=k)
+        report[backend]["retrieval"] = evaluate_retriever(lambda q: retriever.search(q)[0], questions, (1, k))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export, probe and compare the compact vector index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Export vector_db_dir to the compact format")
+    export_parser.add_argument("--dtype", choices=("int8", "float16"), default="int8")
+    export_parser.add_argument("--nlist", type=int, default=0, help="IVF lists (0 = exact search)")
+    probe_parser = commands.add_parser("probe")
+    probe_parser.add_argument("backend", choices=("chroma", "compact"))
+    probe_parser.add_argument("vector_path")
+    compare_parser = commands.add_parser("compare", help="Compare cold start, memory and recall against Chroma")
+    compare_parser.add_argument("--limit", type=int, default=None, help="Questions used for recall")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from shards import open_vectorstore
+        from resources import persist_directory
+
+        seconds = export_compact_index(open_vectorstore(directory=persist_directory), dtype=args.dtype, nlist=args.nlist)
+        print(f"Exported {CompactIndex().meta['count']} vectors ({args.dtype}, nlist={args.nlist}) in {seconds:.2f}s")
+    elif args.command == "probe":
+        print(json.dumps(probe(args.backend, args.vector_path)))
+    else:
+        print(json.dumps(compare(args.limit), indent=2))
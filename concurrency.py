@@ -0,0 +1,138 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+
+# Wait statistics for every InstrumentedLock, by lock name (several instances may share a name)
+lock_registry = {}
+lock_registry_lock = threading.Lock()
+
+
+class LockStats:
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def to_dict(self):
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "contention_rate": round(self.contended / self.acquisitions, 4) if self.acquisitions else 0.0,
+            "wait_ms": round(1000 * self.wait_seconds, 2),
+            "max_wait_ms": round(1000 * self.max_wait_seconds, 2),
+        }
+
+
+# Drop-in threading.Lock that records how often, and how long, callers had to wait for it.
+# The uncontended path is a single non-blocking acquire.
+class InstrumentedLock:
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        with lock_registry_lock:
+            self.stats = lock_registry.setdefault(name, LockStats())
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            self.stats.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        start_time = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        if acquired:
+            # Updated while holding the lock, so instances don't race on their own counters
+            waited = time.perf_counter() - start_time
+            self.stats.acquisitions += 1
+            self.stats.contended += 1
+            self.stats.wait_seconds += waited
+            self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def lock_stats():
+    with lock_registry_lock:
+        return {name: stats.to_dict() for name, stats in sorted(lock_registry.items())}
+
+
+def reset_lock_stats():
+    with lock_registry_lock:
+        for name in lock_registry:
+            lock_registry[name].__init__()
+
+
+# One thread pool shared by every session: each session's requests run in order (a conversation
+# can't answer turn 2 before turn 1), while different sessions run concurrently on the pool.
+# Work is queued per session instead of blocking a pool thread on a per-session lock, so a busy
+# session never ties up more than one worker.
+class SessionExecutor:
+    def __init__(self, max_workers=16, thread_name_prefix="requests"):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.queues = {}  # session_id -> requests waiting behind the one running
+        self.running = 0
+        self.queue_waits = deque(maxlen=10000)
+
+    # Define a function to run fn(*args) for a session, in the caller's context (so tracing follows it)
+    def submit(self, session_id, fn, *args):
+        future = Future()
+        item = (future, contextvars.copy_context(), fn, args, time.perf_counter())
+        with self.lock:
+            if session_id in self.queues:
+                self.queues[session_id].append(item)
+                return future
+            self.queues[session_id] = deque()
+        self.executor.submit(self._run, session_id, item)
+        return future
+
+    def _run(self, session_id, item):
+        future, context, fn, args, submitted = item
+        self.queue_waits.append(time.perf_counter() - submitted)
+        with self.lock:
+            self.running += 1
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(context.run(fn, *args))
+            except BaseException as error:
+                future.set_exception(error)
+        with self.lock:
+            self.running -= 1
+            queue = self.queues[session_id]
+            if not queue:
+                del self.queues[session_id]
+                return
+            next_item = queue.popleft()
+        self.executor.submit(self._run, session_id, next_item)
+
+    def stats(self):
+        with self.lock:
+            waiting = sum(len(queue) for queue in self.queues.values())
+            sessions = len(self.queues)
+            running = self.running
+        waits = 1000 * np.asarray(self.queue_waits) if self.queue_waits else np.zeros(1)
+        return {
+            "workers": self.max_workers,
+            "running": running,
+            "active_sessions": sessions,
+            "queued_behind_session": waiting,
+            "queue_wait_p50_ms": round(float(np.percentile(waits, 50)), 2),
+            "queue_wait_p95_ms": round(float(np.percentile(waits, 95)), 2),
+        }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,87 @@
+from typing import Any, Optional
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+from rate_limit import estimate_tokens
+from shards import shard_attributes, shard_for_source
+from tracing import span
+
+default_fetch_k = 20  # Candidates over-fetched before collapsing duplicates
+default_token_budget = 1200  # Context tokens handed to the answer prompt (~4,800 characters)
+duplicate_similarity = 0.95  # Cosine similarity at which two chunks without verse metadata are the same text
+mmr_lambda = 0.5
+verse_families = ("verses", "questions")  # Source families whose rows for one verse restate that verse
+
+
+# Chunks about the same verse (any translator, verse or question CSV) share a key; others have none.
+# Glossary and concept rows also carry a chapter and verse, but each is a different word or concept
+# of that verse, so they are left to the near-duplicate check instead.
+def verse_key(metadata):
+    family = shard_attributes(shard_for_source(metadata.get("source", "")))["family"]
+    if family in verse_families and metadata.get("chapter") and metadata.get("verse"):
+        return metadata.get("scripture"), metadata["chapter"], metadata["verse"]
+    return None
+
+
+# Post-retrieval stage: over-fetches from `base`, keeps one representative per verse (or per
+# near-duplicate group), or picks an MMR-diversified set, then packs the survivors into the
+# context token budget. The base retriever's own ranking decides which representative wins.
+class DiversifiedRetriever(BaseRetriever):
+    base: Any
+    embeddings: Any
+    k: int = 4
+    mode: str = "group"  # "group" or "mmr"
+    token_budget: Optional[int] = default_token_budget
+
+    # Define a function to embed the candidates; chunk texts were embedded at ingest, so these are cache hits
+    def _vectors(self, query, documents):
+        vectors = np.asarray(self.embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return np.asarray(self.embeddings.embed_query(query), dtype=np.float32), vectors
+
+    def group(self, query, documents):
+        kept, seen_verses = [], set()
+        vectors = None
+        for i, document in enumerate(documents):
+            key = verse_key(document.metadata)
+            if key is not None:
+                if key in seen_verses:
+                    continue
+                seen_verses.add(key)
+            elif kept:
+                # Only chunks without verse metadata (PDF pages, concept rows) need the vectors
+                if vectors is None:
+                    vectors = self._vectors(query, documents)[1]
+                if float(np.max(vectors[kept] @ vectors[i])) >= duplicate_similarity:
+                    continue
+            kept.append(i)
+        return [documents[i] for i in kept]
+
+    def mmr(self, query, documents):
+        query_vector, vectors = self._vectors(query, documents)
+        order = maximal_marginal_relevance(query_vector, list(vectors), lambda_mult=mmr_lambda, k=len(documents))
+        return [documents[i] for i in order]
+
+    # Define a function to keep documents in order until the next one would overflow the token budget
+    def pack(self, documents):
+        packed, used = [], 0
+        for document in documents:
+            if len(packed) == self.k:
+                break
+            tokens = estimate_tokens(document.page_content)
+            if packed and self.token_budget is not None and used + tokens > self.token_budget:
+                continue  # A shorter document further down may still fit
+            packed.append(document)
+            used += tokens
+        return packed, used
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        # Called directly rather than through invoke(), so callbacks see a single retrieval
+        candidates = self.base._get_relevant_documents(query, run_manager=run_manager)
+        if not candidates:
+            return []
+        with span("diversify", mode=self.mode, candidates=len(candidates)) as attributes:
+            ranked = self.mmr(query, candidates) if self.mode == "mmr" else self.group(query, candidates)
+            documents, tokens = self.pack(ranked)
+            attributes.update(kept=len(documents), context_tokens=tokens)
+        return documents
@@ -0,0 +1,82 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+import pandas as pd
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+quotes_file = os.path.join(working_dir, "Data", "Bhagwad_Gita_Verses_Concepts.csv")
+quote_ttl_seconds = 3600  # Re-check the date at most once an hour
+fallback_quote = {
+    "text": "Explore the Bhagavad Gita and Yoga Sutras for timeless wisdom!",
+    "reference": "",
+    "concept": "",
+    "link": None,
+}
+
+_cache = {"day": None, "quote": None, "expires": 0.0}
+_cache_lock = threading.Lock()
+_refresh_started = set()
+
+
+# Define a function to load the shipped concept verses once per process
+def load_quotes():
+    if "rows" not in _cache:
+        df = pd.read_csv(quotes_file).dropna(subset=["English"])
+        _cache["rows"] = [
+            {
+                "text": str(row.English).strip(),
+                "reference": f"Bhagavad Gita {row.Chapter}.{row.Verse}",
+                "concept": str(row.Concept).strip(),
+                "link": None,
+            }
+            for row in df.itertuples(index=False)
+        ]
+    return _cache["rows"]
+
+
+# Define a function to pick the same verse for everyone on a given day
+def quote_for_day(day):
+    quotes = load_quotes()
+    if not quotes:
+        return dict(fallback_quote)
+    index = int(hashlib.sha256(day.isoformat().encode("utf-8")).hexdigest(), 16) % len(quotes)
+    return dict(quotes[index])
+
+
+# Optional: look up a related web page in the background and attach it to today's quote.
+# Runs at most once per day per process and never blocks the page render.
+def _refresh_remote(day, quote):
+    try:
+        from googlesearch import search
+
+        results = list(search(f"Bhagavad Gita {quote['reference']} {quote['concept']}", num_results=1))
+    except Exception:
+        return
+    if results:
+        with _cache_lock:
+            if _cache["day"] == day:
+                _cache["quote"] = dict(_cache["quote"], link=results[0])
+
+
+# Define a function to return today's quote from the process cache, rebuilding it when the TTL runs out
+def get_daily_quote(remote_refresh=False):
+    now = time.time()
+    with _cache_lock:
+        if _cache["quote"] is None or now >= _cache["expires"]:
+            day = datetime.date.today()
+            if _cache["day"] != day:
+                try:
+                    _cache["quote"] = quote_for_day(day)
+                except (OSError, ValueError, KeyError):
+                    _cache["quote"] = dict(fallback_quote)
+                _cache["day"] = day
+            # Never keep yesterday's quote past midnight, even inside the TTL
+            midnight = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min).timestamp()
+            _cache["expires"] = min(now + quote_ttl_seconds, midnight)
+        day, quote = _cache["day"], _cache["quote"]
+        if remote_refresh and day not in _refresh_started and quote["reference"]:
+            _refresh_started.add(day)
+            threading.Thread(target=_refresh_remote, args=(day, quote), daemon=True).start()
+    return quote
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import platform
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+
+# Pluggable CPU embedding backends for the same sentence-transformers model:
+#   torch       HuggingFaceEmbeddings as before (the default)
+#   torch-int8  the torch model with its Linear layers dynamically quantized to int8
+#   onnx        the model exported to ONNX Runtime
+#   onnx-int8   the ONNX model dynamically quantized to int8 for this CPU (AVX2 / AVX-512 VNNI / ARM64)
+# (the ONNX backends need sentence-transformers>=3.2 with `pip install optimum[onnxruntime]`).
+# Vectors from the variants are close but not identical, so each one gets its own embedding cache
+# namespace, and `python embedding_backends.py migrate` re-embeds vector_db_dir after switching.
+working_dir = os.path.dirname(os.path.abspath(__file__))
+default_model_name = "sentence-transformers/all-mpnet-base-v2"  # HuggingFaceEmbeddings' default model
+models_directory = os.path.join(working_dir, "embedding_models")  # Local ONNX exports
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+default_max_batch = 64  # Concurrent queries folded into one forward pass
+migration_page_size = 512  # Rows re-embedded and written back per call
+
+
+# Define a function to name a backend's embedding cache namespace; the default keeps the model's
+# own name, so cache entries written before backends were pluggable stay valid
+def cache_model_name(backend, model_name=default_model_name):
+    return model_name if backend == "torch" else f"{model_name}:{backend}"
+
+
+# Define a function to pick the ONNX dynamic quantization preset for this CPU
+def quantization_preset():
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return "avx2"
+    return "avx512_vnni" if "avx512_vnni" in flags else "avx2"
+
+
+# Define a function to export the model to ONNX (and its int8 variant) once, under embedding_models/
+def export_onnx_model(model_name=default_model_name, quantize=False):
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    directory = os.path.join(models_directory, model_name.replace("/", "__"))
+    if not os.path.exists(os.path.join(directory, "onnx", "model.onnx")):
+        SentenceTransformer(model_name, device="cpu", backend="onnx").save(directory)
+    if not quantize:
+        return directory, "onnx/model.onnx"
+    preset = quantization_preset()
+    file_name = f"onnx/model_qint8_{preset}.onnx"
+    if not os.path.exists(os.path.join(directory, file_name)):
+        model = SentenceTransformer(directory, device="cpu", backend="onnx")
+        export_dynamic_quantized_onnx_model(model, preset, directory)
+    return directory, file_name
+
+
+# Define a function to build the (uncached) embedding model for a backend, with `threads` CPU threads
+def load_embedding_backend(backend="torch", threads=None, model_name=default_model_name):
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; choose one of {', '.join(BACKENDS)}")
+    if backend.startswith("onnx"):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        directory, file_name = export_onnx_model(model_name, quantize=backend == "onnx-int8")
+        return HuggingFaceEmbeddings(model_name=directory, model_kwargs={
+            "device": "cpu",
+            "backend": "onnx",
+            "model_kwargs": {"file_name": file_name, "provider": "CPUExecutionProvider", "session_options": options},
+        })
+
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    embeddings = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": "cpu"})
+    if backend == "torch-int8":
+        embeddings.client = torch.quantization.quantize_dynamic(embeddings.client, {torch.nn.Linear}, dtype=torch.qint8)
+    return embeddings
+
+
+# Dynamic batching for query embeddings: concurrent embed_query calls are queued and whatever has
+# queued up by the time the model is free is encoded in one forward pass. A lone query runs at
+# once (`max_wait_ms` can hold it briefly to gather company); document batches pass straight through.
+class BatchingEmbeddings(Embeddings):
+    def __init__(self, embeddings, max_batch=default_max_batch, max_wait_ms=0.0):
+        self.embeddings = embeddings
+        self.model_name = getattr(embeddings, "model_name", type(embeddings).__name__)
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.queries = 0
+        self.worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self.worker.start()
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        future = Future()
+        self.requests.put((text, future))
+        return future.result()
+
+    # Define a function to stop the worker thread once the queries already queued have been answered
+    def close(self):
+        self.requests.put(None)
+        self.worker.join()
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        if batch[0] is None:
+            return batch
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                request = (self.requests.get(timeout=max(deadline - time.perf_counter(), 0)) if self.max_wait
+                           else self.requests.get_nowait())
+            except queue.Empty:
+                break
+            batch.append(request)
+            if request is None:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            closing = batch[-1] is None
+            batch = [request for request in batch if request is not None]
+            if not batch:
+                return
+            try:
+                # Sentence-transformers models encode queries and documents alike
+                vectors = self.embeddings.embed_documents([text for text, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+            else:
+                self.batches += 1
+                self.queries += len(batch)
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            if closing:
+                return
+
+    def stats(self):
+        return {"batches": self.batches, "queries": self.queries,
+                "mean_batch": round(self.queries / self.batches, 2) if self.batches else 0.0}
+
+
+# Define a function to measure concurrent query throughput: `concurrency` threads embedding `texts`
+def concurrent_queries(embeddings, texts, concurrency):
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(embeddings.embed_query, texts))
+    return round(len(texts) / max(time.perf_counter() - start_time, 1e-9), 1)
+
+
+# Define a function to compare backends on the verse tables: load time, document throughput,
+# single-query latency, concurrent query throughput (with and without batching), recall@k of
+# the questions against an index embedded by that backend, and agreement with the first backend
+def compare_backends(backends=BACKENDS, threads=None, limit=None, concurrency=16):
+    from benchmark_retrieval import evaluate_retriever, percentiles, sample_questions
+    from vectorize_documents import data_directory, iter_csv_documents
+    from verse_lookup import load_question_verses
+
+    corpus = [document for file_name in ("Bhagwad_Gita_Verses_English.csv", "Patanjali_Yoga_Sutras_Verses_English.csv")
+              for document in iter_csv_documents(os.path.join(data_directory, file_name))]
+    questions = sample_questions(load_question_verses(), limit)
+    texts = [question for question, *_ in questions]
+    report = {"corpus": len(corpus), "questions": len(questions), "threads": threads, "backends": {}}
+    baseline = None
+    for backend in backends:
+        start_time = time.perf_counter()
+        embeddings = load_embedding_backend(backend, threads=threads)
+        embeddings.embed_query("warm up")
+        result = {"load_seconds": round(time.perf_counter() - start_time, 2)}
+
+        start_time = time.perf_counter()
+        matrix = np.asarray(embeddings.embed_documents([document.page_content for document in corpus]), dtype=np.float32)
+        result["documents_per_second"] = round(len(corpus) / max(time.perf_counter() - start_time, 1e-9), 1)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+        latencies, query_vectors = [], []
+        for text in texts:
+            start_time = time.perf_counter()
+            query_vectors.append(embeddings.embed_query(text))
+            latencies.append(time.perf_counter() - start_time)
+        result["query_latency"] = percentiles(latencies)
+        result["concurrent_queries_per_second"] = concurrent_queries(embeddings, texts, concurrency)
+        batching = BatchingEmbeddings(embeddings)
+        try:
+            result["batched_queries_per_second"] = concurrent_queries(batching, texts, concurrency)
+        finally:
+            batching.close()
+        result["batching"] = batching.stats()
+
+        vectors = dict(zip(texts, np.asarray(query_vectors, dtype=np.float32)))
+
+        def retrieve(question):
+            scores = matrix @ vectors[question]
+            return [corpus[i] for i in np.argsort(-scores)[:10]]
+
+        result["retrieval"] = evaluate_retriever(retrieve, questions)
+        query_matrix = np.asarray(query_vectors, dtype=np.float32)
+        query_matrix /= np.maximum(np.linalg.norm(query_matrix, axis=1, keepdims=True), 1e-12)
+        if baseline is None:
+            baseline = (backend, query_matrix)
+        else:
+            result[f"cosine_vs_{baseline[0]}"] = round(float(np.mean(np.sum(query_matrix * baseline[1], axis=1))), 5)
+        report["backends"][backend] = result
+        print(json.dumps({backend: result}))
+    return report
+
+
+# Define a function to re-embed every vector in vector_db_dir in place with `embeddings`,
+# keeping IDs, texts and metadata; shard centroids and a compact export are refreshed after
+def migrate_vector_db(embeddings, directory=None):
+    from shards import ShardedVectorStore, open_vectorstore
+    from compact_index import CompactIndex, export_compact_index
+    from resources import persist_directory
+
+    store = open_vectorstore(embeddings=embeddings, directory=directory or persist_directory)
+    if isinstance(store, ShardedVectorStore):
+        collections = [(name, store.shard(name)) for name in store.shard_names()]
+    else:
+        collections = [("vector_db_dir", store)]
+    start_time = time.perf_counter()
+    migrated = 0
+    for name, collection in collections:
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=migration_page_size, offset=offset)
+            if not page["ids"]:
+                break
+            # The store was opened with `embeddings`, so update_documents writes the new backend's vectors
+            collection.update_documents(ids=page["ids"], documents=[
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(page["documents"], page["metadatas"])
+            ])
+            offset += len(page["ids"])
+            migrated += len(page["ids"])
+        print(f"Re-embedded {offset} vectors in {name}")
+    if isinstance(store, ShardedVectorStore):
+        store.update_stats(store.shard_names())
+    if CompactIndex.exists():
+        previous = CompactIndex().meta
+        export_compact_index(store, dtype=previous["dtype"], nlist=previous["nlist"])
+    return migrated, time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends or re-embed vector_db_dir with one")
+    commands = parser.add_subparsers(dest="command", required=True)
+    benchmark_parser = commands.add_parser("benchmark", help="Compare throughput, latency and recall of backends")
+    benchmark_parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    benchmark_parser.add_argument("--threads", type=int, default=None, help="CPU threads per backend (default: all)")
+    benchmark_parser.add_argument("--limit", type=int, default=None, help="Questions used for latency and recall")
+    benchmark_parser.add_argument("--concurrency", type=int, default=16, help="Threads embedding queries at once")
+    benchmark_parser.add_argument("--output", default=None, help="JSON file to write (default: benchmark_results/embeddings-<timestamp>.json)")
+    migrate_parser = commands.add_parser("migrate", help="Re-embed vector_db_dir with a backend")
+    migrate_parser.add_argument("backend", choices=BACKENDS)
+    migrate_parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        from benchmark_retrieval import results_directory
+
+        report = compare_backends(args.backends, args.threads, args.limit, args.concurrency)
+        output = args.output or os.path.join(results_directory, f"embeddings-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(json.dumps(report, indent=2))
+        print(f"Saved to {output}")
+    else:
+        from embedding_cache import CachedEmbeddings
+
+        embeddings = CachedEmbeddings(load_embedding_backend(args.backend, threads=args.threads),
+                                      model_name=cache_model_name(args.backend))
+        migrated, seconds = migrate_vector_db(embeddings)
+        print(f"Re-embedded {migrated} vectors with {args.backend} in {seconds:.1f}s")
+        print(f'Set "EMBEDDING_BACKEND": "{args.backend}" in config.json so queries use the same backend')
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from concurrency import InstrumentedLock
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+default_cache_directory = os.path.join(working_dir, "embedding_cache")
+default_max_bytes = 512 * 1024 * 1024  # Vector file budget before least-recently-used entries are evicted
+store_version = 2  # Stores written before version 2 could map several keys to one slot and are discarded
+
+
+# Define a function to normalize text so whitespace/Unicode variants of the same text share a cache entry
+def normalize_text(text):
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+# Disk-backed vector store: a memory-mapped float16 matrix plus a SQLite index of key -> row slot.
+# Shared by the ingest script, the app and the API server: a write allocates its slots, fills them and
+# records them inside one BEGIN IMMEDIATE transaction, so processes never hand out the same slot, and
+# readers only see a slot once its vector is written. Growth is published through meta.json.
+class EmbeddingStore:
+    def __init__(self, directory, max_bytes=default_max_bytes, dtype=np.float16):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.lock = InstrumentedLock("embedding_cache")
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.bin")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.db = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False, timeout=60)
+        self.db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER, last_used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.dim = None
+        self.capacity = 0
+        self.vectors = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta.get("version") == store_version:
+                self.dim = meta["dim"]
+                self._open(meta["capacity"])
+            else:
+                self.db.execute("DELETE FROM entries")
+                self.db.commit()
+                if os.path.exists(self.vectors_path):
+                    os.remove(self.vectors_path)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _map(self, capacity):
+        self.capacity = capacity
+        self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+
+    # Define a function to grow the vector file to `capacity` rows (call inside the write transaction)
+    def _open(self, capacity):
+        row_bytes = self.dim * self.dtype.itemsize
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(max(capacity * row_bytes, os.path.getsize(self.vectors_path)))
+        self._map(capacity)
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": store_version, "dim": self.dim, "capacity": capacity, "dtype": self.dtype.name}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    # Define a function to pick up a file another process created or grew since this one mapped it
+    def _refresh(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta.get("version") == store_version and meta["capacity"] > self.capacity:
+            self.dim = meta["dim"]
+            self._map(meta["capacity"])
+
+    @property
+    def max_slots(self):
+        return max(1, self.max_bytes // (self.dim * self.dtype.itemsize))
+
+    def _used_slots(self):
+        return self.db.execute("SELECT COUNT(*), COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()
+
+    # Define a function to hand out `count` free slots, growing the file or evicting LRU entries
+    def _allocate_slots(self, count):
+        used, high_water = self._used_slots()
+        free = []
+        if used < high_water:
+            # Holes left by evictions and replaced keys are reused before the file grows
+            taken = {slot for (slot,) in self.db.execute("SELECT slot FROM entries")}
+            free = [slot for slot in range(high_water) if slot not in taken][:count]
+        grow = min(count - len(free), self.max_slots - high_water)
+        free.extend(range(high_water, high_water + max(grow, 0)))
+        shortfall = count - len(free)
+        if shortfall > 0:
+            # Evict a little more than needed so the next few inserts don't each pay for an eviction
+            evict = min(used, max(shortfall, self.max_slots // 10))
+            rows = self.db.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict,)).fetchall()
+            self.db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in rows])
+            self.evictions += len(rows)
+            free.extend(slot for _, slot in rows)
+        free = free[:count]
+        needed = max(free, default=-1) + 1
+        if needed > self.capacity:
+            self._open(min(max(needed, self.capacity * 2, 1024), self.max_slots))
+        return free
+
+    # Define a function to look up cached vectors; returns a list with None for misses
+    def get_many(self, keys):
+        with self.lock:
+            if self.vectors is None:
+                self._refresh()
+            if self.vectors is None:
+                self.misses += len(keys)
+                return [None] * len(keys)
+            found = {}
+            for i in range(0, len(keys), 500):  # SQLite caps the number of bound parameters
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                found.update(self.db.execute(f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", part))
+            if found and max(found.values()) >= self.capacity:
+                self._refresh()  # Written by a process that has grown the file since
+            now = time.time()
+            self.db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            self.db.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+            return [self.vectors[found[key]].astype(np.float32).tolist() if key in found else None for key in keys]
+
+    def put_many(self, keys, vectors):
+        if not keys:
+            return
+        with self.lock:
+            self.db.commit()
+            # Holds SQLite's write lock until the commit: no other process allocates slots meanwhile
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                if self.dim is None:
+                    self.dim = len(vectors[0])
+                    self._open(min(1024, self.max_slots))
+                unique = dict(zip(keys, vectors))
+                slots = self._allocate_slots(len(unique))
+                now = time.time()
+                for slot, vector in zip(slots, unique.values()):
+                    self.vectors[slot] = np.asarray(vector, dtype=self.dtype)
+                self.vectors.flush()
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                    [(key, slot, now) for key, slot in zip(unique, slots)]
+                )
+                self.db.commit()
+            except BaseException:
+                self.db.rollback()
+                raise
+
+    def stats(self):
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# LangChain Embeddings wrapper that consults the store before calling the model.
+# Used for ingest batches (embed_documents) and for query strings (embed_query) alike.
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, cache_directory=default_cache_directory, max_bytes=default_max_bytes, model_name=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model_name", type(embeddings).__name__)
+        model_directory = hashlib.sha1(self.model_name.encode("utf-8")).hexdigest()[:16]
+        self.store = EmbeddingStore(os.path.join(cache_directory, model_directory), max_bytes=max_bytes)
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.model_name, text) for text in texts]
+        vectors = self.store.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.store.put_many([keys[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text):
+        # Query vectors are cached under their own namespace: some models embed queries differently
+        key = cache_key(f"{self.model_name}:query", text)
+        vector = self.store.get_many([key])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.store.put_many([key], [vector])
+        return vector
+
+    # Define a function to embed many queries with a single model call for the misses (batch jobs, benchmarks).
+    # HuggingFaceEmbeddings encodes queries and documents identically, so misses go through embed_documents.
+    def embed_queries(self, texts):
+        keys = [cache_key(f"{self.model_name}:query", text) for text in texts]
+        vectors = self.store.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.store.put_many([keys[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def stats(self):
+        return self.store.stats()
@@ -1,60 +1,14 @@
 import time
-import os
-import json
-import random
+import uuid
 import streamlit as st
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationalRetrievalChain
-from vectorize_documents import embeddings
-from deep_translator import GoogleTranslator
-from googlesearch import search
-
-# Set up working directory and API configuration
-working_dir = os.path.dirname(os.path.abspath(__file__))
-config_data = json.load(open(f"{working_dir}/config.json"))
-os.environ["GROQ_API_KEY"] = config_data["GROQ_API_KEY"]
-
-def setup_vectorstore():
-    persist_directory = f"{working_dir}/vector_db_dir"
-    vectorstore = Chroma(
-        persist_directory=persist_directory,
-        embedding_function=embeddings
-    )
-    return vectorstore
-
-def chat_chain(vectorstore):
-    from langchain_groq import ChatGroq
-
-    llm = ChatGroq(
-        model="llama-3.1-70b-versatile",
-        temperature=0
-    )
-    retriever = vectorstore.as_retriever()
-    memory = ConversationBufferMemory(
-        llm=llm,
-        output_key="answer",
-        memory_key="chat_history",
-        return_messages=True
-    )
-
-    chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=retriever,
-        chain_type="stuff",
-        memory=memory,
-        verbose=True,
-        return_source_documents=True
-    )
-    return chain
-
-def fetch_daily_quote():
-    query = "Bhagavad Gita inspirational quotes"
-    results = list(search(query, num_results=5))  # Convert generator to list
-    if results:
-        return random.choice(results)
-    return "Explore the Bhagavad Gita and Yoga Sutras for timeless wisdom!"
+import functools
+from resources import setup_vectorstore, chat_chain, get_answer_cache, get_llm_gateway, get_verse_index, get_glossary_index, get_translator, get_metrics_server, get_request_pool
+from semantic_cache import CachedChain
+from daily_wisdom import get_daily_quote
+from streaming import AnswerStream
+from verse_lookup import format_verse, wants_explanation, explanation_prompt
+from glossary import format_glossary
+from tracing import start_trace, span
 
 # Streamlit UI
 st.set_page_config(
@@ -90,21 +44,34 @@ if not st.session_state.chat_started:
         st.session_state.chat_started = True
         st.success(f"Hello {st.session_state.user_name}! How can I assist you today?")
 
-# Display the daily quote
-quote = fetch_daily_quote()
+# Display the daily quote (picked from the local corpus; any web lookup happens in the background)
+quote = get_daily_quote(remote_refresh=True)
+quote_link = f' <a href="{quote["link"]}" target="_blank">Read more</a>' if quote["link"] else ""
 st.markdown(
     f"""
     <div style="text-align: center; background-color: #f0f8ff; padding: 10px; border-radius: 5px; margin-bottom: 20px;">
-        <h4>🌟 Daily Wisdom: <a href="{quote}" target="_blank">{quote}</a></h4>
+        <h4>🌟 Daily Wisdom: {quote['text']}</h4>
+        <p>{quote['reference']}{quote_link}</p>
     </div>
     """,
     unsafe_allow_html=True
 )
 
 if st.session_state.chat_started:
-    # Set up vectorstore and chat chain
-    vectorstore = setup_vectorstore()
-    chain = chat_chain(vectorstore)
+    # Vectorstore, embeddings and LLM are loaded once per process; the chain keeps
+    # this session's memory, so it is built once per session instead of on every rerun.
+    # The session id lives in the URL, so reloading the page resumes the persisted conversation:
+    # the memory comes back from the session store and its recent turns (in English) are shown again.
+    if "session" not in st.query_params:
+        st.query_params["session"] = uuid.uuid4().hex
+    if "chain" not in st.session_state:
+        st.session_state.chain = CachedChain(
+            chat_chain(setup_vectorstore(), session_id=st.query_params["session"]), get_answer_cache()
+        )
+        if "chat_history" not in st.session_state:
+            st.session_state.chat_history = st.session_state.chain.memory.transcript()
+    chain = st.session_state.chain
+    get_metrics_server()
 
     # Select language
     selected_language = st.selectbox("Select your preferred language:", options=[
@@ -112,6 +79,7 @@ if st.session_state.chat_started:
         "Punjabi", "Odia", "Maithili", "Sanskrit", "Santali", "Kashmiri", "Nepali", "Dogri", "Manipuri", "Bodo",
         "Sindhi", "Assamese", "Konkani", "Awadhi", "Rajasthani", "Haryanvi", "Bihari", "Chhattisgarhi", "Magahi"
     ], index=0)
+    stream_answers = st.checkbox("Stream answers as they are generated", value=True)
 
     # Display chat history
     st.markdown("### 💬 Chat History")
@@ -128,20 +96,89 @@ if st.session_state.chat_started:
         submitted = st.form_submit_button("Submit")
 
     if submitted and user_query.strip():
-        start_time = time.time()
-        response = chain({"question": user_query.strip()})
-        end_time = time.time()
+        sources_slot = st.empty()
+        st.write("**🌟 Enlightened Response:**")
+        answer_slot = st.empty()
+
+        # Display source documents if available (as soon as retrieval finishes when streaming)
+        def show_sources(source_documents):
+            if source_documents:
+                with sources_slot.container():
+                    with st.expander("📜 Source Documents"):
+                        for i, doc in enumerate(source_documents):
+                            st.write(f"**Document {i + 1}:** {doc.page_content}")
+
+        # Every stage below records a timing span into this trace (shown in the debug panel)
+        trace = start_trace(user_query.strip())
+
+        # Questions naming a verse ("BG 2.47") are answered from the verse index without vector search;
+        # the LLM is only involved when the user asks for an explanation
+        with span("verse_lookup"):
+            verse_entry = get_verse_index().lookup(user_query.strip())
+        # Word-meaning questions ("what does 'yuyutsavaḥ' mean?") are answered from the glossary index the same way
+        glossary_matches = None
+        if verse_entry is None:
+            with span("glossary_lookup"):
+                glossary_matches = get_glossary_index().answer(user_query.strip())
+        direct_answer = verse_entry is not None or glossary_matches is not None
+        if verse_entry is not None:
+            start_time = time.time()
+            if wants_explanation(user_query):
+                prompt = explanation_prompt(verse_entry, user_query.strip())
+                with answer_slot.container():
+                    llm_stream = get_llm_gateway().stream(prompt, config={"callbacks": [trace.handler(condense_step=False)]})
+                    answer = st.write_stream(chunk.content for chunk in llm_stream)
+                with sources_slot.container():
+                    with st.expander("📜 Source Verse"):
+                        st.markdown(format_verse(verse_entry))
+            else:
+                answer = format_verse(verse_entry)
+                if selected_language == "English":
+                    answer_slot.markdown(answer)
+            chain.memory.save_context({"question": user_query.strip()}, {"answer": answer})
+            response = {"answer": answer, "source_documents": []}
+            metrics = {"total_time": time.time() - start_time}
+        elif glossary_matches is not None:
+            start_time = time.time()
+            answer = format_glossary(glossary_matches, user_query.strip())
+            if selected_language == "English":
+                answer_slot.markdown(answer)
+            chain.memory.save_context({"question": user_query.strip()}, {"answer": answer})
+            response = {"answer": answer, "source_documents": []}
+            metrics = {"total_time": time.time() - start_time}
+        elif stream_answers:
+            # Answers run on the process-wide pool, in order within this session, in parallel across sessions
+            stream = AnswerStream(
+                chain, user_query.strip(), callbacks=[trace.handler()],
+                submit=functools.partial(get_request_pool().submit, st.query_params["session"])
+            )
+            tokens = stream.tokens(on_sources=show_sources)
+            if selected_language != "English":
+                # Sentences are translated while the rest of the answer is still being generated
+                tokens = get_translator().translate_stream(tokens, selected_language.lower())
+            with answer_slot.container():
+                streamed_answer = st.write_stream(tokens)
+            response = stream.response
+            metrics = stream.metrics
+        else:
+            start_time = time.time()
+            response = chain.invoke({"question": user_query.strip()}, config={"callbacks": [trace.handler()]})
+            metrics = {"total_time": time.time() - start_time}
+            show_sources(response.get("source_documents", []))
 
         answer = response.get("answer", "No answer found.")
-        source_documents = response.get("source_documents", [])
-        execution_time = round(end_time - start_time, 2)
-
-        # Translate response if needed
-        if selected_language != "English":
-            translator = GoogleTranslator(source="en", target=selected_language.lower())
-            translated_answer = translator.translate(answer)
+        execution_time = round(metrics["total_time"], 2)
+
+        # Translate response if needed (already done sentence by sentence for streamed chain answers)
+        if selected_language != "English" and stream_answers and not direct_answer:
+            translated_answer = streamed_answer
+        elif selected_language != "English":
+            translated_answer = get_translator().translate(answer, selected_language.lower())
+            answer_slot.write(translated_answer)
         else:
             translated_answer = answer
+            if not stream_answers and not direct_answer:
+                answer_slot.write(translated_answer)
 
         # Save chat history
         if "chat_history" not in st.session_state:
@@ -151,14 +188,31 @@ if st.session_state.chat_started:
             "answer": translated_answer
         })
 
-        # Display source documents if available
-        if source_documents:
-            with st.expander("📜 Source Documents"):
-                for i, doc in enumerate(source_documents):
-                    st.write(f"**Document {i + 1}:** {doc.page_content}")
-
-        st.write(f"**🌟 Enlightened Response:** {translated_answer}")
-        st.write(f"_Response time: {execution_time} seconds_")
+        timing = f"_Response time: {execution_time} seconds"
+        if response.get("cached"):
+            cache_stats = get_answer_cache().stats()
+            timing += f" · answered from cache (hit rate {cache_stats['hit_rate']:.0%})"
+        if metrics.get("time_to_first_token") is not None:
+            timing += f" · first token after {metrics['time_to_first_token']:.2f} seconds"
+        if metrics.get("tokens_per_second"):
+            timing += f" · {metrics['tokens_per_second']:.1f} tokens/sec"
+        if trace.prompt_tokens():
+            timing += f" · {trace.prompt_tokens()} prompt tokens"
+        st.write(timing + "_")
+        trace.finish(
+            cached=bool(response.get("cached")),
+            language=selected_language,
+            prompt_tokens=trace.prompt_tokens(),
+            history_tokens=chain.memory.history_tokens()
+        )
+        st.session_state.last_trace = trace.to_dict()
+
+    # Debug panel: where the time went in the last query
+    if "last_trace" in st.session_state:
+        with st.expander("🔍 Debug: timing breakdown of the last query"):
+            last_trace = st.session_state.last_trace
+            st.write(f"Total: {last_trace['total_ms']:.0f} ms · trace {last_trace['trace_id']}")
+            st.dataframe(last_trace["spans"], use_container_width=True)
 
     # Sharing options
     st.markdown(
@@ -0,0 +1,249 @@
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+import pandas as pd
+from verse_lookup import GITA
+
+# Word-meaning index over the Gita glossary CSVs. Every Sanskrit form, IAST or Devanagari, is
+# folded to one plain-Latin key in the spelling the tables use ("kṣhetre", "क्षेत्रे" and
+# "kshetre" all become "kshetre"), so a lookup is a dict hit; misspellings fall back to an
+# edit-distance search over a deletion index. Built at ingest, loaded once per process.
+working_dir = os.path.dirname(os.path.abspath(__file__))
+data_directory = os.path.join(working_dir, "Data")
+default_index_path = os.path.join(working_dir, "glossary_index", "glossary.json")
+GLOSSARY_FILES = (
+    ("Gita_Word_Meanings_English.csv", "English", "English Meaning"),
+    ("Gita_Word_Meanings_Hindi.csv", "Hindi", "Hindi Meaning"),
+)
+max_occurrences_shown = 20
+max_meanings_shown = 8  # Per language; common words collect dozens of glosses across the verses
+
+# Devanagari to the tables' Latin spelling (ś/ṣ -> sh, च -> ch, ऋ -> ri)
+CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n", "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n", "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m", "य": "y", "र": "r", "ल": "l", "ळ": "l", "व": "v",
+    "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+}
+VOWELS = {
+    "अ": "a", "आ": "a", "इ": "i", "ई": "i", "उ": "u", "ऊ": "u", "ऋ": "ri", "ॠ": "ri", "ऌ": "li",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au",
+}
+MATRAS = {"ा": "a", "ि": "i", "ी": "i", "ु": "u", "ू": "u", "ृ": "ri", "ॄ": "ri", "ॢ": "li", "े": "e", "ै": "ai", "ो": "o", "ौ": "au"}
+VIRAMA, NUKTA, ANUSVARA, CHANDRABINDU, VISARGA, AVAGRAHA = "्", "़", "ं", "ँ", "ः", "ऽ"
+LABIALS = set("पफबभम")
+# IAST letters the tables spell differently, applied before diacritics are stripped
+IAST_FOLDS = (("ṣh", "sh"), ("śh", "sh"), ("ṣ", "sh"), ("ś", "sh"), ("ṛi", "ri"), ("ṝ", "ri"), ("ṛ", "ri"), ("ḷ", "li"))
+# Informal spellings folded on both sides ("geeta", "dharmaa")
+ASCII_FOLDS = (("aa", "a"), ("ii", "i"), ("ee", "i"), ("uu", "u"), ("oo", "u"))
+LONE_C_PATTERN = re.compile(r"c(?!h)")
+
+# "what does 'yuyutsavaḥ' mean", "meaning of the word dharma", "define karma", "X meaning"
+WORD_QUERY_PATTERNS = [re.compile(pattern) for pattern in (
+    r"^\s*what\s+(?:does|do|is)\s+(?:the\s+(?:sanskrit\s+)?(?:word|term)\s+)?(?P<word>.+?)\s+means?\s*[?.!]*\s*$",
+    r"\b(?:meaning|definition|translation)\s+of\s+(?:the\s+(?:sanskrit\s+)?(?:word|term)\s+)?(?P<word>.+?)\s*[?.!]*\s*$",
+    r"^\s*(?:define|translate)\s+(?:the\s+(?:sanskrit\s+)?(?:word|term)\s+)?(?P<word>.+?)\s*[?.!]*\s*$",
+    r"^\s*(?P<word>\S+(?:\s+\S+)?)\s+(?:meaning|means|definition)\s*[?.!]*\s*$",
+)]
+QUOTES = "'\"‘’“”`"
+max_query_words = 3
+min_bare_fuzzy_length = 6
+
+
+def transliterate_devanagari(text):
+    out = []
+    for i, char in enumerate(text):
+        following = text[i + 1:i + 2]
+        if following == NUKTA:
+            following = text[i + 2:i + 3]
+        if char in CONSONANTS:
+            out.append(CONSONANTS[char])
+            if following not in MATRAS and following != VIRAMA:
+                out.append("a")  # Inherent vowel
+        elif char in MATRAS:
+            out.append(MATRAS[char])
+        elif char in VOWELS:
+            out.append(VOWELS[char])
+        elif char in (ANUSVARA, CHANDRABINDU):
+            # Homorganic nasal: "sañjaya" is written संजय
+            out.append("m" if not following or following in LABIALS or following not in CONSONANTS else "n")
+        elif char == VISARGA or (char == ":" and i and "ऀ" <= text[i - 1] <= "ॿ"):
+            out.append("h")  # Some rows write the visarga as a colon
+        elif char in (VIRAMA, NUKTA, AVAGRAHA):
+            continue
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+# Define a function to fold a Sanskrit word (IAST, Devanagari or plain ASCII) to its lookup key
+def normalize_word(text):
+    text = unicodedata.normalize("NFC", str(text).strip().lower())
+    if any("ऀ" <= char <= "ॿ" for char in text):
+        text = transliterate_devanagari(text)
+    for source, target in IAST_FOLDS:
+        text = text.replace(source, target)
+    text = "".join(char for char in unicodedata.normalize("NFD", text) if not unicodedata.combining(char))
+    text = LONE_C_PATTERN.sub("ch", re.sub(r"[^a-z]+", " ", text))
+    for source, target in ASCII_FOLDS:
+        text = text.replace(source, target)
+    return " ".join(text.split())
+
+
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def single_deletions(key):
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+# Define a function to pick the fuzzy budget for a word. A quoted or IAST/Devanagari word is surely
+# Sanskrit: short words tolerate one edit, longer ones two. A bare English-looking word gets one
+# edit, and only when long, so "the meaning of life" falls through to the chain.
+def max_edits(key, explicit=True):
+    if explicit:
+        return 1 if len(key) <= 5 else 2
+    return 1 if len(key) >= min_bare_fuzzy_length else 0
+
+
+class GlossaryIndex:
+    def __init__(self, entries):
+        self.entries = entries  # key -> {"forms", "meanings": {language: [...]}, "occurrences": [[chapter, shloka], ...]}
+        self.tokens = defaultdict(list)  # Single words of multi-word entries ("uvacha") -> entry keys
+        self.deletions = defaultdict(list)  # Key with one character removed -> keys, for the fuzzy fallback
+        for key in entries:
+            words = key.split()
+            if len(words) > 1:
+                for word in words:
+                    self.tokens[word].append(key)
+            for variant in single_deletions(key) | {key}:
+                self.deletions[variant].append(key)
+
+    # Define a function to build the index from the word-meaning CSVs
+    @classmethod
+    def build(cls, data_directory=data_directory):
+        entries = {}
+        for file_name, language, meaning_column in GLOSSARY_FILES:
+            df = pd.read_csv(os.path.join(data_directory, file_name)).dropna(subset=["Sanskrit Word"])
+            for row in df.to_dict("records"):
+                key = normalize_word(row["Sanskrit Word"])
+                if not key:
+                    continue
+                entry = entries.setdefault(key, {"forms": [], "meanings": {}, "occurrences": []})
+                form = str(row["Sanskrit Word"]).strip()
+                if form not in entry["forms"]:
+                    entry["forms"].append(form)
+                meaning = "" if pd.isna(row[meaning_column]) else str(row[meaning_column]).strip()
+                if meaning:
+                    counts = entry["meanings"].setdefault(language, {})
+                    counts[meaning] = counts.get(meaning, 0) + 1
+                occurrence = [int(row["Chapter"]), int(row["Shloka"])]
+                if occurrence not in entry["occurrences"]:
+                    entry["occurrences"].append(occurrence)
+        for entry in entries.values():
+            entry["occurrences"].sort()
+            # The glosses given most often come first; one-off fragments of split rows sink to the end
+            entry["meanings"] = {language: sorted(counts, key=counts.get, reverse=True)
+                                 for language, counts in entry["meanings"].items()}
+        return cls(entries)
+
+    @classmethod
+    def load(cls, path=default_index_path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["entries"])
+
+    @staticmethod
+    def exists(path=default_index_path):
+        return os.path.exists(path)
+
+    def save(self, path=default_index_path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _match(self, key, distance=0):
+        return {"key": key, "distance": distance, **self.entries[key]}
+
+    # Define a function to find a word: exact key, then a word inside a multi-word entry, then the
+    # closest keys within `max_distance` edits (default: max_edits). Returns matches, most frequent first.
+    def lookup(self, word, max_distance=None):
+        key = normalize_word(word)
+        if not key:
+            return []
+        if key in self.entries:
+            return [self._match(key)]
+        if key in self.tokens:
+            keys = self.tokens[key]
+        else:
+            limit = max_edits(key) if max_distance is None else max_distance
+            if limit <= 0:
+                return []
+            # Keys sharing a one-deletion variant with the query are within two edits of it
+            candidates = {candidate for variant in single_deletions(key) | {key} for candidate in self.deletions.get(variant, ())}
+            scored = [(edit_distance(key, candidate, limit), candidate) for candidate in candidates]
+            scored = [(distance, candidate) for distance, candidate in scored if distance <= limit]
+            if not scored:
+                return []
+            best = min(distance for distance, _ in scored)
+            return sorted((self._match(candidate, best) for distance, candidate in scored if distance == best),
+                          key=lambda match: -len(match["occurrences"]))
+        return sorted((self._match(candidate) for candidate in keys), key=lambda match: -len(match["occurrences"]))
+
+    # Define a function to answer a word-meaning question directly; None if it isn't one or the word is unknown
+    def answer(self, question):
+        word = parse_word_query(question)
+        if word is None:
+            return None
+        explicit = any(char in QUOTES for char in question) or any(ord(char) > 127 for char in word)
+        return self.lookup(word, max_distance=max_edits(normalize_word(word), explicit)) or None
+
+
+# Define a function to pull the word out of a word-meaning question ("what does 'yuyutsavaḥ' mean?")
+def parse_word_query(question):
+    text = unicodedata.normalize("NFC", question.strip().lower())
+    for pattern in WORD_QUERY_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            word = match.group("word").strip().strip(QUOTES + "?.!,").strip()
+            if word and len(word.split()) <= max_query_words:
+                return word
+    return None
+
+
+# Define a function to render glossary matches as the assistant's answer
+def format_glossary(matches, question=""):
+    lines = []
+    if matches and matches[0]["distance"]:
+        lines.append(f"_No exact entry for \"{parse_word_query(question) or question}\"; closest matches:_\n")
+    for match in matches[:3]:
+        lines.append(f"**{' / '.join(match['forms'])}**")
+        for language, meanings in match["meanings"].items():
+            if meanings:
+                lines.append(f"- **{language}:** {'; '.join(meanings[:max_meanings_shown])}")
+        shown = ", ".join(f"{chapter}.{shloka}" for chapter, shloka in match["occurrences"][:max_occurrences_shown])
+        more = len(match["occurrences"]) - max_occurrences_shown
+        lines.append(f"- **Occurs in {GITA}:** {shown}" + (f" and {more} more" if more > 0 else "") + "\n")
+    return "\n".join(lines).strip()
+
+
+# Define a function to rebuild the saved index from the CSVs; returns the build time
+def build_glossary_index(data_directory=data_directory, path=default_index_path):
+    start_time = time.perf_counter()
+    GlossaryIndex.build(data_directory).save(path)
+    return time.perf_counter() - start_time
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+
+# 2: every file entry records the shard its chunks live in
+# 3: re-embed everything written through the embedding cache before its slot allocation fix
+MANIFEST_VERSION = 3
+
+
+# Define a function to hash a file's bytes without reading it all into memory
+def file_hash(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Define a function to hash a chunk's text (and metadata that ends up in the index)
+def text_hash(text, metadata=None):
+    digest = hashlib.sha256(text.encode("utf-8"))
+    if metadata:
+        digest.update(json.dumps(metadata, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Stable ID for a chunk: depends on where the chunk comes from, not on its content,
+# so an edited row keeps its ID and is upserted in place
+def chunk_id(source, row_key, chunk_index):
+    key = f"{source}|{row_key}|{chunk_index}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def empty_manifest():
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+# Define a function to load the manifest, starting fresh if it is missing or outdated
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return empty_manifest()
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return empty_manifest()
+    return manifest
+
+
+# Write to a temp file and rename so an interrupted run never leaves a half-written manifest
+def save_manifest(manifest, manifest_path):
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+# Define a function to compare freshly computed chunk hashes against a file's previous entry
+def diff_chunks(old_chunks, new_chunks):
+    changed = [cid for cid, digest in new_chunks.items() if old_chunks.get(cid) != digest]
+    removed = [cid for cid in old_chunks if cid not in new_chunks]
+    return changed, removed
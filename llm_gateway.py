@@ -0,0 +1,217 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_core.pydantic_v1 import PrivateAttr
+from rate_limit import backoff_delay, estimate_tokens, retry_reason, retry_after
+from tracing import llm_queue_depth, llm_in_flight, llm_requests, llm_retries, llm_rate_limit_wait
+
+default_max_concurrency = 8  # Generations running against the provider at once, per gateway
+default_max_answer_tokens = 512  # Completion size assumed when budgeting tokens before the call
+
+
+# One generation shared by every caller that asked for the same prompt while it ran. Chunks are
+# kept as they arrive, so a caller joining late replays the start and then follows live.
+# Once every caller has stopped reading, the flight is abandoned and the generation stops.
+class Flight:
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.listeners = 0
+        self.abandoned = False
+        self.condition = threading.Condition()
+
+    def publish(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            if not self.done:
+                self.done = True
+                self.error = error
+                self.condition.notify_all()
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            index += 1
+            yield chunk
+
+
+# Chat model that sits between the chains and the provider model:
+# - identical prompts in flight at the same time are generated once and streamed to every caller
+#   (each caller still gets its own callbacks, so per-session token streaming and tracing work);
+# - generations run on a fixed pool of `max_concurrency` workers, the rest wait in its queue;
+# - an optional RateBudget (requests and tokens per minute) is paid before each generation;
+# - rate limits and transient errors are retried with jittered exponential backoff, as long as
+#   nothing has been streamed yet.
+class LLMGateway(BaseChatModel):
+    model: Any
+    streaming: bool = False
+    budget: Any = None  # rate_limit.RateBudget
+    max_concurrency: int = default_max_concurrency
+    max_answer_tokens: int = default_max_answer_tokens
+    attempts: int = 5
+    backoff_base: float = 1.0
+    backoff_cap: float = 30.0
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _flights: dict = PrivateAttr(default_factory=dict)
+    _executor: Any = PrivateAttr(default=None)
+    _counts: dict = PrivateAttr(default_factory=lambda: {"generated": 0, "coalesced": 0, "retries": 0, "queued": 0, "running": 0})
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="llm-gateway")
+
+    @property
+    def _llm_type(self):
+        return f"gateway:{getattr(self.model, '_llm_type', type(self.model).__name__)}"
+
+    @property
+    def _identifying_params(self):
+        return {"model": getattr(self.model, "_identifying_params", repr(self.model))}
+
+    # Define a function to key a request: same model, messages, stop words and options share a generation
+    def _key(self, messages, stop, kwargs):
+        payload = json.dumps(
+            [self._identifying_params, [message.dict() for message in messages], stop, kwargs],
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # Define a function to join the generation in flight for this prompt, or queue a new one
+    def _join(self, messages, stop, kwargs):
+        key = self._key(messages, stop, kwargs)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.listeners += 1
+                self._counts["coalesced"] += 1
+                llm_requests.inc(label_value="coalesced")
+                return flight
+            flight = self._flights[key] = Flight(key)
+            flight.listeners += 1
+            self._counts["generated"] += 1
+            self._counts["queued"] += 1
+        llm_requests.inc(label_value="generated")
+        llm_queue_depth.inc()
+        self._executor.submit(self._produce, key, flight, messages, stop, kwargs)
+        return flight
+
+    # Define a function to stop following a flight; the last caller to leave an unfinished one abandons it
+    def _leave(self, flight):
+        with self._lock:
+            flight.listeners -= 1
+            if flight.listeners == 0 and not flight.done:
+                flight.abandoned = True
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]  # Later callers start a fresh generation
+
+    def _model_stream(self, messages, stop, kwargs):
+        if type(self.model)._stream is BaseChatModel._stream:
+            # No native streaming: the whole answer arrives as one chunk
+            message = self.model._generate(messages, stop=stop, **kwargs).generations[0].message
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=message.content, response_metadata=message.response_metadata
+            ))
+            return
+        yield from self.model._stream(messages, stop=stop, **kwargs)
+
+    # Define a function to read the tokens a response actually used from its chunks; providers report usage
+    # on the final chunk, and without a report the prompt estimate plus the generated text is used instead
+    @staticmethod
+    def used_tokens(chunks, prompt_tokens):
+        for chunk in reversed(chunks):
+            message = chunk.message
+            usage = getattr(message, "usage_metadata", None) or {}
+            token_usage = (message.response_metadata or {}).get("token_usage") or {}
+            total = usage.get("total_tokens") or token_usage.get("total_tokens")
+            if total:
+                return total
+        return prompt_tokens + estimate_tokens("".join(chunk.text for chunk in chunks))
+
+    # Runs on a gateway worker: pay the rate budget, then generate with retries, publishing every chunk.
+    # The reservation is settled once the call ends: against the reported usage, or refunded in full on failure.
+    def _produce(self, key, flight, messages, stop, kwargs):
+        with self._lock:
+            self._counts["queued"] -= 1
+            self._counts["running"] += 1
+        llm_queue_depth.dec()
+        llm_in_flight.inc()
+        error = None
+        prompt_tokens = estimate_tokens(" ".join(str(message.content) for message in messages))
+        estimated = None
+        try:
+            if flight.abandoned:
+                return  # Every caller left while this generation was queued
+            if self.budget is not None:
+                llm_rate_limit_wait.observe(self.budget.acquire_blocking(prompt_tokens + self.max_answer_tokens))
+                estimated = prompt_tokens + self.max_answer_tokens
+            for attempt in range(self.attempts):
+                try:
+                    for chunk in self._model_stream(messages, stop, kwargs):
+                        if flight.abandoned:
+                            break  # Every caller has gone (e.g. the client disconnected): stop generating
+                        flight.publish(chunk)
+                    break
+                except Exception as exception:
+                    reason = retry_reason(exception)
+                    # Once callers have seen tokens a retry would repeat them, so the error is passed on
+                    if reason is None or flight.chunks or attempt == self.attempts - 1:
+                        error = exception
+                        break
+                    with self._lock:
+                        self._counts["retries"] += 1
+                    llm_retries.inc(label_value=reason)
+                    time.sleep(retry_after(exception) or backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+        except Exception as exception:
+            error = exception
+        finally:
+            if estimated is not None:
+                self.budget.settle(estimated, 0 if error is not None else self.used_tokens(flight.chunks, prompt_tokens))
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                self._counts["running"] -= 1
+            llm_in_flight.dec()
+            flight.finish(error)
+
+    def _stream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        flight = self._join(messages, stop, kwargs)
+        try:
+            for shared in flight:
+                # Every caller gets its own copy: langchain stamps the caller's run id onto the message
+                chunk = ChatGenerationChunk(message=shared.message.copy(), generation_info=shared.generation_info)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            self._leave(flight)
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        return generate_from_stream(self._stream(messages, stop, run_manager if self.streaming else None, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        calls = counts["generated"] + counts["coalesced"]
+        counts["coalescing_ratio"] = round(counts["coalesced"] / calls, 4) if calls else 0.0
+        return counts
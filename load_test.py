@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from collections import defaultdict
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+from benchmark_retrieval import percentiles, current_rss_mb, results_directory
+from bm25_index import matches_filter
+from concurrency import SessionExecutor, lock_stats, reset_lock_stats
+
+# Multi-user load test: N simulated sessions hold multi-turn conversations against the real
+# retrieval path (or a stub store), all answered by the offline stub LLM on one shared pool
+FOLLOW_UPS = [
+    "Can you explain that more simply?",
+    "What does it mean in daily life?",
+    "Why is that important?",
+    "Tell me more about it.",
+    "How does this relate to meditation?",
+]
+stub_dimensions = 384
+
+
+# Deterministic offline embeddings: hashed bag of words, plus a simulated model latency per call
+class StubEmbeddings(Embeddings):
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = np.zeros(stub_dimensions, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % stub_dimensions] += 1.0 if digest[4] & 1 else -1.0
+        return (vector / max(np.linalg.norm(vector), 1e-12)).tolist()
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# In-memory stand-in for Chroma over the verse translations, with a simulated search latency
+class StubVectorStore:
+    def __init__(self, embeddings, search_latency=0.0):
+        from verse_lookup import VerseIndex
+
+        self.embeddings = embeddings
+        self.search_latency = search_latency
+        self.documents = []
+        for entry in VerseIndex().verses.values():
+            for translator, text in entry["translations"].items():
+                self.documents.append(Document(page_content=text, metadata={
+                    "source": "stub", "scripture": entry["scripture"], "chapter": entry["chapter"],
+                    "verse": entry["verse"], "translator": translator,
+                }))
+        self.matrix = np.asarray([embeddings._embed(doc.page_content) for doc in self.documents], dtype=np.float32)
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        if self.search_latency:
+            time.sleep(self.search_latency)
+        scores = self.matrix @ np.asarray(embedding, dtype=np.float32)
+        if filter:
+            scores[[not matches_filter(doc.metadata, filter) for doc in self.documents]] = -np.inf
+        top = np.argsort(-scores)[:k]
+        return [self.documents[i] for i in top if np.isfinite(scores[i])]
+
+    def get(self, ids=None, include=None, **kwargs):
+        return {"ids": [], "documents": [], "metadatas": []}  # BM25 chunk IDs don't exist in the stub
+
+
+# Define a function to answer one turn on a pool worker; returns its timings
+def answer_turn(chain, question, submitted):
+    from tracing import start_trace
+
+    started = time.perf_counter()
+    trace = start_trace(question)
+    error = None
+    response = {}
+    try:
+        response = chain.invoke({"question": question}, config={"callbacks": [trace.handler()]})
+    except Exception as exception:
+        error = repr(exception)
+    trace.finish(export=False)
+    stages = defaultdict(float)
+    first_token = None
+    for trace_span in trace.to_dict()["spans"]:
+        stages[trace_span["name"]] += trace_span["duration_ms"] / 1000
+        if trace_span["name"] == "answer_llm" and "time_to_first_token_ms" in trace_span:
+            first_token = trace_span["offset_ms"] / 1000 + trace_span["time_to_first_token_ms"] / 1000
+    return {
+        "latency": time.perf_counter() - submitted,
+        "queue_wait": started - submitted,
+        "service": trace.total,
+        "time_to_first_token": None if first_token is None else started - submitted + first_token,
+        "stages": dict(stages),
+        "prompt_tokens": trace.prompt_tokens(),
+        "cached": bool(response.get("cached")),
+        "error": error,
+    }
+
+
+async def run_session(index, args, pool, make_chain, questions, results):
+    rng = random.Random(index)
+    await asyncio.sleep(rng.uniform(0, args.ramp_up))
+    session_id = f"load-test-{os.getpid()}-{index}"
+    chain = make_chain(session_id)
+    loop = asyncio.get_running_loop()
+    for turn in range(args.turns):
+        question = rng.choice(questions) if turn == 0 or rng.random() < 0.5 else rng.choice(FOLLOW_UPS)
+        future = pool.submit(session_id, answer_turn, chain, question, time.perf_counter())
+        results.append(await asyncio.wrap_future(future, loop=loop))
+        if args.think_time:
+            await asyncio.sleep(rng.expovariate(1 / args.think_time))
+    return chain
+
+
+async def sample_rss(samples, stop):
+    while not stop.is_set():
+        samples.append(current_rss_mb())
+        await asyncio.sleep(0.2)
+
+
+async def run_load_test(args):
+    from resources import chat_chain, setup_vectorstore, get_embeddings
+    from semantic_cache import SemanticAnswerCache, CachedChain
+    from stub_llm import StubChatModel
+    from llm_gateway import LLMGateway
+    from verse_lookup import load_question_verses
+
+    if args.stub_retrieval:
+        vectorstore = StubVectorStore(StubEmbeddings(args.embed_latency), args.search_latency)
+        embeddings = vectorstore.embeddings
+    else:
+        vectorstore = setup_vectorstore()
+        embeddings = get_embeddings()
+    # The stub behind the same gateway the app uses (coalescing, worker pool), without the Groq rate budget
+    llm = LLMGateway(
+        model=StubChatModel(first_token_latency=args.first_token_latency, token_latency=args.token_latency),
+        streaming=True, max_concurrency=args.workers
+    )
+    cache_directory = tempfile.mkdtemp(prefix="load-test-cache-")
+    answer_cache = None if args.no_answer_cache else SemanticAnswerCache(
+        embeddings, path=os.path.join(cache_directory, "answers.sqlite")
+    )
+
+    def make_chain(session_id):
+        chain = chat_chain(vectorstore, llm=llm, session_id=session_id)
+        # Verbose chains print every prompt; redirecting stdout isn't thread-safe, so switch it off instead
+        for component in (chain, chain.question_generator, chain.combine_docs_chain,
+                          getattr(chain.combine_docs_chain, "llm_chain", None)):
+            if component is not None:
+                component.verbose = False
+        return CachedChain(chain, answer_cache) if answer_cache is not None else chain
+
+    questions = [question for question, *_ in load_question_verses()]
+    if args.hot_questions:
+        # A trending topic: every session draws from a few questions, so identical prompts overlap
+        questions = random.Random(0).sample(questions, args.hot_questions)
+    # Warm up models and indexes so the baseline RSS and the first sessions don't include loading
+    warmup = make_chain("load-test-warmup")
+    answer_turn(warmup, questions[0], time.perf_counter())
+    warmup.memory.clear()
+    reset_lock_stats()
+
+    pool = SessionExecutor(max_workers=args.workers, thread_name_prefix="load-test")
+    results = []
+    rss_samples = []
+    stop = asyncio.Event()
+    baseline_rss = current_rss_mb()
+    sampler = asyncio.create_task(sample_rss(rss_samples, stop))
+    start_time = time.perf_counter()
+    chains = await asyncio.gather(*(
+        run_session(index, args, pool, make_chain, questions, results) for index in range(args.sessions)
+    ))
+    elapsed = time.perf_counter() - start_time
+    stop.set()
+    await sampler
+    peak_rss = max(rss_samples + [current_rss_mb()])
+    for chain in chains:
+        chain.memory.clear()  # Don't leave load-test conversations in the session store
+    pool.shutdown()
+
+    completed = [result for result in results if result["error"] is None]
+    stage_names = sorted({name for result in completed for name in result["stages"]})
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "turns": len(results),
+        "errors": len(results) - len(completed),
+        "error_samples": sorted({result["error"] for result in results if result["error"]})[:5],
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_turns_per_second": round(len(completed) / max(elapsed, 1e-9), 2),
+        "latency": percentiles([result["latency"] for result in completed]),
+        "service_time": percentiles([result["service"] for result in completed]),
+        "queue_wait": percentiles([result["queue_wait"] for result in completed]),
+        "time_to_first_token": percentiles([r["time_to_first_token"] for r in completed if r["time_to_first_token"] is not None]),
+        "stages": {name: percentiles([r["stages"][name] for r in completed if name in r["stages"]]) for name in stage_names},
+        "mean_prompt_tokens": round(float(np.mean([r["prompt_tokens"] for r in completed])), 1) if completed else None,
+        "answer_cache_hits": sum(result["cached"] for result in completed),
+        "memory": {
+            "baseline_rss_mb": baseline_rss,
+            "peak_rss_mb": peak_rss,
+            "rss_per_session_mb": round((peak_rss - baseline_rss) / max(args.sessions, 1), 3),
+        },
+        "locks": {name: stats for name, stats in lock_stats().items() if stats["acquisitions"]},
+        "pool": pool.stats(),
+        "llm_gateway": llm.stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent multi-turn sessions against the question path")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=4, help="Questions per session (first is new, later ones may be follow-ups)")
+    parser.add_argument("--workers", type=int, default=16, help="Shared pool threads answering questions")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds a user waits between questions")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds over which sessions start")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="Stub LLM time to first token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Stub LLM seconds per token")
+    parser.add_argument("--stub-retrieval", action="store_true", help="Use an in-memory stub instead of Chroma and the model")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="Stub embedding seconds per call")
+    parser.add_argument("--search-latency", type=float, default=0.005, help="Stub vector search seconds per call")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Answer every question through the chain")
+    parser.add_argument("--hot-questions", type=int, default=0, help="Draw first questions from only this many (0 = all)")
+    parser.add_argument("--output", default=None, help="JSON file to write (default: benchmark_results/load-<timestamp>.json)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args))
+    output = args.output or os.path.join(results_directory, f"load-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Saved to {output}")
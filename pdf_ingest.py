@@ -0,0 +1,136 @@
+import argparse
+import glob
+import os
+import sqlite3
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PyPDF2 import PdfReader
+from PyPDF2.errors import PyPdfError
+from ingest_manifest import file_hash
+
+# Streaming PDF extraction: pages are extracted in small ranges across a process pool and yielded
+# in page order, with only a bounded window of ranges in flight, so memory does not grow with the
+# size of the PDF. Extracted text is cached on disk by (file hash, page), so re-runs and edits to
+# other files never extract a page twice.
+working_dir = os.path.dirname(os.path.abspath(__file__))
+default_cache_path = os.path.join(working_dir, "pdf_text_cache", "pages.sqlite")
+pages_per_task = 8  # Pages one worker extracts per task
+max_workers = min(4, os.cpu_count() or 1)
+max_pending_tasks = 2 * max_workers  # Page ranges extracted ahead of the consumer
+
+# What a malformed PDF can raise: PyPDF2's own errors, the low-level ones its parser lets through
+# (bad xref offsets, broken streams), or a worker process that died while parsing it
+PDF_ERRORS = (PyPdfError, ValueError, KeyError, IndexError, TypeError, AttributeError,
+              struct.error, zlib.error, BrokenProcessPool)
+
+
+def is_pdf(path):
+    return path.lower().endswith(".pdf")
+
+
+# Define a function to list the PDFs in a directory, whatever the case of their extension
+def find_pdfs(directory):
+    return sorted(path for path in glob.glob(os.path.join(directory, "*")) if is_pdf(path))
+
+
+class PageTextCache:
+    def __init__(self, path=default_cache_path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS pages (file_hash TEXT, page INTEGER, text TEXT, PRIMARY KEY (file_hash, page))")
+
+    def get_many(self, digest, pages):
+        rows = self.db.execute(
+            "SELECT page, text FROM pages WHERE file_hash = ? AND page BETWEEN ? AND ?", (digest, min(pages), max(pages))
+        )
+        return dict(rows)
+
+    def put_many(self, digest, texts):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO pages (file_hash, page, text) VALUES (?, ?, ?)",
+            [(digest, page, text) for page, text in texts.items()]
+        )
+        self.db.commit()
+
+    # Define a function to drop the pages of file versions that are no longer in the data directory
+    def prune(self, keep_digests):
+        keep_digests = list(keep_digests)
+        placeholders = ",".join("?" * len(keep_digests))
+        where = f"WHERE file_hash NOT IN ({placeholders})" if keep_digests else ""
+        removed = self.db.execute(f"DELETE FROM pages {where}", keep_digests).rowcount
+        self.db.commit()
+        return removed
+
+
+def page_count(file_path):
+    with open(file_path, "rb") as f:
+        return len(PdfReader(f).pages)
+
+
+# Worker entry point: extract a range of pages (1-based); the reader is opened per task so a
+# worker never accumulates parsed pages across a large file
+def extract_pages(file_path, pages):
+    with open(file_path, "rb") as f:
+        reader = PdfReader(f)
+        return {page: reader.pages[page - 1].extract_text() or "" for page in pages}
+
+
+# Define a function to yield (page number, text) for every page of a PDF, in order.
+# `stats` collects page counts and timings across calls.
+def iter_pdf_pages(file_path, digest=None, cache=None, stats=None):
+    digest = digest or file_hash(file_path)
+    cache = cache or PageTextCache()
+    stats = stats if stats is not None else {}
+    start_time = time.perf_counter()
+    total = page_count(file_path)
+    ranges = iter(range(start, min(start + pages_per_task, total + 1)) for start in range(1, total + 1, pages_per_task))
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        def schedule():
+            pages = next(ranges, None)
+            if pages is None:
+                return False
+            cached = cache.get_many(digest, pages)
+            missing = [page for page in pages if page not in cached]
+            pending.append((pages, cached, executor.submit(extract_pages, file_path, missing) if missing else None))
+            return True
+
+        while len(pending) < max_pending_tasks and schedule():
+            pass
+        while pending:
+            pages, texts, future = pending.popleft()
+            schedule()
+            stats["cached_pages"] = stats.get("cached_pages", 0) + len(texts)
+            if future is not None:
+                extracted = future.result()
+                cache.put_many(digest, extracted)
+                texts.update(extracted)
+                stats["extracted_pages"] = stats.get("extracted_pages", 0) + len(extracted)
+            for page in pages:
+                yield page, texts[page]
+    stats["pages"] = stats.get("pages", 0) + total
+    stats["seconds"] = stats.get("seconds", 0.0) + time.perf_counter() - start_time
+
+
+def pages_per_second(stats):
+    return round(stats.get("pages", 0) / max(stats.get("seconds", 0.0), 1e-9), 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract PDF pages through the text cache and report pages/sec")
+    parser.add_argument("paths", nargs="*", help="PDF files (default: every PDF in Data/)")
+    parser.add_argument("--no-cache", action="store_true", help="Extract into a throwaway cache, to time cold extraction")
+    args = parser.parse_args()
+
+    paths = args.paths or find_pdfs(os.path.join(working_dir, "Data"))
+    cache = PageTextCache(":memory:") if args.no_cache else PageTextCache()
+    stats = {}
+    for path in paths:
+        characters = sum(len(text) for _, text in iter_pdf_pages(path, cache=cache, stats=stats))
+        print(f"{os.path.basename(path)}: {characters} characters")
+    print(f"{stats.get('pages', 0)} pages ({stats.get('extracted_pages', 0)} extracted, "
+          f"{stats.get('cached_pages', 0)} from cache) in {stats.get('seconds', 0.0):.2f}s: {pages_per_second(stats)} pages/sec")
@@ -0,0 +1,105 @@
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.base import _get_chat_history
+from langchain_core.callbacks import CallbackManagerForChainRun
+from tracing import span
+
+# Words that only make sense with the earlier conversation ("what does *he* say about *it*")
+REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|him|his|she|her|hers|the same|"
+    r"above|previous|earlier|former|latter|last one|again)\b"
+)
+# Openers that continue the previous answer rather than ask something new
+FOLLOW_UP_PATTERN = re.compile(
+    r"^(and|but|also|so|then|what about|how about|why( not)?\??$|why is that|tell me more|more|"
+    r"elaborate|explain (more|further)|continue|go on|can you expand|what else|and (what|how|why))\b"
+)
+min_standalone_words = 4  # "and karma?" / "why?" are follow-ups however they are phrased
+rewrite_overlap = 0.8  # Word overlap at which the rewrite counts as the same question as the raw one
+
+# Speculative retrievals for the raw question, run while the rewrite is in flight
+speculative_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-retrieval")
+
+
+def words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+# Define a function to decide, without an LLM, whether a question can be searched as it is
+def is_standalone(question):
+    text = question.strip().lower()
+    if len(words(text)) < min_standalone_words:
+        return False
+    return not (FOLLOW_UP_PATTERN.search(text) or REFERENCE_PATTERN.search(text))
+
+
+# Define a function to tell whether a rewrite kept the raw question's meaning (so its documents still apply)
+def same_question(question, rewritten):
+    original, new = set(words(question)), set(words(rewritten))
+    if not original or not new:
+        return False
+    return len(original & new) / len(original | new) >= rewrite_overlap
+
+
+# ConversationalRetrievalChain whose condense-question step only runs when it is needed:
+# never on an empty history, never for questions the heuristic finds standalone, and with
+# retrieval for the raw question started speculatively while the rewrite is generated
+class RewritingRetrievalChain(ConversationalRetrievalChain):
+    speculative_retrieval: bool = True
+
+    def _speculative_docs(self, question, inputs):
+        with span("speculative_retrieval"):
+            # No callbacks: its retriever events must not reach the streaming handler early
+            return self._get_docs(question, inputs, run_manager=CallbackManagerForChainRun.get_noop_manager())
+
+    # Define a function to report documents retrieved earlier to the callbacks as a normal retrieval,
+    # so streaming handlers and tracing see the sources at the usual point
+    def _replay_retrieval(self, question, docs, run_manager):
+        retriever_run = run_manager.get_child().on_retriever_start({"name": type(self.retriever).__name__}, question)
+        retriever_run.on_retriever_end(docs)
+        return docs
+
+    def _call(self, inputs, run_manager=None):
+        run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        question = inputs["question"]
+        get_chat_history = self.get_chat_history or _get_chat_history
+        chat_history_str = get_chat_history(inputs["chat_history"])
+
+        if not chat_history_str or is_standalone(question):
+            with span("query_rewrite", skipped="empty_history" if not chat_history_str else "standalone"):
+                new_question = question
+            docs = self._get_docs(new_question, inputs, run_manager=run_manager)
+        else:
+            speculative = None
+            if self.speculative_retrieval:
+                speculative = speculative_executor.submit(
+                    contextvars.copy_context().run, self._speculative_docs, question, inputs
+                )
+            new_question = self.question_generator.run(
+                question=question, chat_history=chat_history_str, callbacks=run_manager.get_child()
+            )
+            if speculative is not None and same_question(question, new_question):
+                docs = self._replay_retrieval(new_question, speculative.result(), run_manager)
+            else:
+                if speculative is not None:
+                    speculative.cancel()  # Only stops it if it hasn't started yet
+                docs = self._get_docs(new_question, inputs, run_manager=run_manager)
+
+        output = {}
+        if self.response_if_no_docs_found is not None and len(docs) == 0:
+            output[self.output_key] = self.response_if_no_docs_found
+        else:
+            new_inputs = inputs.copy()
+            if self.rephrase_question:
+                new_inputs["question"] = new_question
+            new_inputs["chat_history"] = chat_history_str
+            output[self.output_key] = self.combine_docs_chain.run(
+                input_documents=docs, callbacks=run_manager.get_child(), **new_inputs
+            )
+        if self.return_source_documents:
+            output["source_documents"] = docs
+        if self.return_generated_question:
+            output["generated_question"] = new_question
+        return output
@@ -0,0 +1,113 @@
+import asyncio
+import random
+import threading
+import time
+
+
+# Token bucket refilled continuously at `per_minute / 60` units per second, holding at most `per_minute`
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until `amount` units are available (0 if they are available now)
+    def delay(self, amount):
+        self._refill()
+        amount = min(amount, self.capacity)  # A single oversized request still goes through eventually
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+
+# Requests-per-minute and tokens-per-minute budget shared by every caller in the process
+class RateBudget:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.lock = asyncio.Lock()
+        self.thread_lock = threading.Lock()
+
+    async def acquire(self, tokens):
+        async with self.lock:
+            while True:
+                wait = max(self.requests.delay(1), self.tokens.delay(tokens))
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+                await asyncio.sleep(wait)
+
+    # Blocking counterpart of acquire() for callers on threads; returns the seconds spent waiting
+    def acquire_blocking(self, tokens):
+        waited = 0.0
+        while True:
+            with self.thread_lock:
+                wait = max(self.requests.delay(1), self.tokens.delay(tokens))
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    # Give back the difference once the real token usage is known
+    def settle(self, estimated, actual):
+        with self.thread_lock:
+            self.tokens._refill()
+            taken = min(estimated, self.tokens.capacity)  # take() never removes more than the capacity
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + taken - actual)
+
+
+# Define a function to compute a jittered exponential backoff delay ("full jitter")
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+# Define a function to classify a provider error: "rate_limit", "transient" or None (not worth retrying)
+def retry_reason(error):
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    name = type(error).__name__
+    if status == 429 or "RateLimit" in name:
+        return "rate_limit"
+    if status in RETRYABLE_STATUS or any(word in name for word in ("Timeout", "Connection", "InternalServer")):
+        return "transient"
+    return None
+
+
+# Define a function to read the provider's Retry-After hint (seconds), if the error carries one
+def retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# Define a function to retry an async call with jittered exponential backoff. Only rate limits and
+# transient errors are retried (a 4xx would fail the same way again), after the provider's
+# Retry-After when it sends one.
+async def retry_async(call, attempts=5, base=1.0, cap=60.0):
+    for attempt in range(attempts):
+        try:
+            return await call(), attempt + 1
+        except Exception as error:
+            if retry_reason(error) is None or attempt == attempts - 1:
+                raise
+            await asyncio.sleep(retry_after(error) or backoff_delay(attempt, base, cap))
+
+
+# Rough token estimate (~4 characters per token) used before the API reports real usage
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
@@ -0,0 +1,271 @@
+import functools
+import json
+import os
+import time
+from concurrency import InstrumentedLock
+
+# Set up working directory and paths shared by the app and the ingest script
+working_dir = os.path.dirname(os.path.abspath(__file__))
+persist_directory = f"{working_dir}/vector_db_dir"
+
+# Seconds spent building each resource the first time it was requested in this process
+load_timings = {}
+
+
+# Decorator: build a resource lazily on first use, then share the instance process-wide,
+# so Streamlit reruns and concurrent sessions all reuse the same model/client
+def process_resource(loader):
+    instances = {}
+    lock = InstrumentedLock(f"resource:{loader.__name__}")
+
+    @functools.wraps(loader)
+    def wrapper(*args):
+        if args not in instances:
+            with lock:
+                if args not in instances:
+                    start_time = time.perf_counter()
+                    instances[args] = loader(*args)
+                    load_timings[loader.__name__] = time.perf_counter() - start_time
+        return instances[args]
+
+    return wrapper
+
+
+@process_resource
+def load_config():
+    config_data = json.load(open(f"{working_dir}/config.json"))
+    os.environ["GROQ_API_KEY"] = config_data["GROQ_API_KEY"]
+    return config_data
+
+
+@process_resource
+def get_embeddings():
+    # Imported here: pulling in sentence-transformers/torch is a large part of startup
+    from embedding_backends import load_embedding_backend, cache_model_name, BatchingEmbeddings
+    from embedding_cache import CachedEmbeddings
+
+    config = load_config()
+    # "EMBEDDING_BACKEND": "torch" (default), "torch-int8", "onnx" or "onnx-int8" in config.json;
+    # switching it needs `python embedding_backends.py migrate <backend>`. "EMBEDDING_THREADS" caps CPU threads.
+    backend = config.get("EMBEDDING_BACKEND", "torch")
+    embeddings = load_embedding_backend(backend, threads=config.get("EMBEDDING_THREADS"))
+    # Concurrent sessions' query embeddings share forward passes
+    return CachedEmbeddings(BatchingEmbeddings(embeddings), model_name=cache_model_name(backend))
+
+
+@process_resource
+def setup_vectorstore():
+    from compact_index import CompactIndex
+    from shards import open_vectorstore
+
+    # "VECTOR_INDEX": "compact" serves queries from the read-only mmap export (python compact_index.py export)
+    if load_config().get("VECTOR_INDEX") == "compact" and CompactIndex.exists():
+        return CompactIndex(embeddings=get_embeddings())
+    # Per-source shard collections (python vectorize_documents.py), routed per query
+    vectorstore = open_vectorstore(embeddings=get_embeddings(), directory=persist_directory)
+    return vectorstore
+
+
+@process_resource
+def get_http_client():
+    import httpx
+
+    # One keep-alive connection pool shared by every Groq model in the process
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60.0),
+        timeout=httpx.Timeout(60.0, connect=10.0)
+    )
+
+
+@process_resource
+def get_llm(model="llama-3.1-70b-versatile"):
+    from langchain_groq import ChatGroq
+
+    load_config()
+    llm = ChatGroq(
+        model=model,
+        temperature=0,
+        streaming=True,  # Emits per-token callbacks; non-streaming callers still get the full message
+        http_client=get_http_client(),
+        max_retries=0  # Retried with backoff by the gateway (or batch_answer), not inside the SDK as well
+    )
+    return llm
+
+
+# The model as the chains use it: identical concurrent prompts share one generation, calls are
+# rate-limited per model and retried with backoff (see llm_gateway.py)
+@process_resource
+def get_llm_gateway(model="llama-3.1-70b-versatile"):
+    from llm_gateway import LLMGateway, default_max_concurrency
+    from rate_limit import RateBudget
+
+    config = load_config()
+    # "LLM_REQUESTS_PER_MINUTE" / "LLM_TOKENS_PER_MINUTE" in config.json: the Groq account's limits for the model
+    budget = RateBudget(config.get("LLM_REQUESTS_PER_MINUTE", 30), config.get("LLM_TOKENS_PER_MINUTE", 6000))
+    return LLMGateway(
+        model=get_llm(model),
+        streaming=True,
+        budget=budget,
+        max_concurrency=config.get("LLM_MAX_CONCURRENCY", default_max_concurrency)
+    )
+
+
+# Define a function to build the retriever the chat chain searches with.
+# With a `token_budget`, candidates are over-fetched and collapsed to one chunk per verse (or MMR
+# diversified) before being packed into the budget; without one, plain top-k is returned.
+def build_retriever(vectorstore, metadata_filter=None, k=4, token_budget=None):
+    from retrieval_filters import MetadataFilteredRetriever
+    from bm25_index import HybridRetriever
+    from context_packing import DiversifiedRetriever, default_fetch_k
+
+    # "CONTEXT_DIVERSITY": "group" (default), "mmr" or "off" in config.json
+    mode = load_config().get("CONTEXT_DIVERSITY", "group") if token_budget else "off"
+    fetch_k = max(default_fetch_k, 3 * k) if mode != "off" else k
+    # Questions that name a scripture, chapter or translator only search that slice of the collection
+    retriever = MetadataFilteredRetriever(vectorstore=vectorstore, filter=metadata_filter, k=fetch_k)
+    # Fuse in lexical BM25 hits (Sanskrit terms, proper nouns) when the ingest has built the index
+    if get_bm25_index() is not None:
+        retriever = HybridRetriever(
+            dense_retriever=retriever, bm25_index=get_bm25_index(), vectorstore=vectorstore,
+            k=fetch_k, fetch_k=max(20, fetch_k)
+        )
+    if mode != "off":
+        # The store's own embedding function: the cached model for Chroma, whatever a stub store brings
+        embeddings = getattr(vectorstore, "embeddings", None) or get_embeddings()
+        retriever = DiversifiedRetriever(base=retriever, embeddings=embeddings, k=k, mode=mode, token_budget=token_budget)
+    return retriever
+
+
+# The chain itself is cheap to build and holds per-conversation memory,
+# so callers keep one per session rather than one per process
+# (`llm` overrides the Groq gateway, e.g. with the offline stub used by benchmarks).
+# Memory is persisted under `session_id`, so a returning session picks up its conversation.
+def chat_chain(vectorstore, metadata_filter=None, llm=None, session_id=None):
+    import uuid
+    from query_rewrite import RewritingRetrievalChain
+    from session_memory import SessionMemory, default_token_budget
+    from context_packing import default_token_budget as default_context_budget
+
+    # "CONDENSE_MODEL": "llama-3.1-8b-instant" in config.json sends follow-up rewrites to a faster model
+    condense_model = load_config().get("CONDENSE_MODEL")
+    condense_llm = llm or (get_llm_gateway(condense_model) if condense_model else get_llm_gateway())
+    llm = llm or get_llm_gateway()
+    # "CONTEXT_TOKEN_BUDGET" in config.json caps the retrieved context sent with each question
+    retriever = build_retriever(
+        vectorstore, metadata_filter, token_budget=load_config().get("CONTEXT_TOKEN_BUDGET", default_context_budget)
+    )
+    # Recent turns plus a rolling summary under a token budget, so the condense-question prompt stays flat
+    memory = SessionMemory.for_session(
+        session_id or uuid.uuid4().hex,
+        get_memory_store(),
+        summarizer=llm,
+        token_budget=load_config().get("MEMORY_TOKEN_BUDGET", default_token_budget),
+        output_key="answer",
+        memory_key="chat_history",
+        return_messages=True
+    )
+
+    # Follow-ups are rewritten into standalone questions only when the history is needed to understand them
+    chain = RewritingRetrievalChain.from_llm(
+        llm=llm,
+        condense_question_llm=condense_llm,
+        retriever=retriever,
+        chain_type="stuff",
+        memory=memory,
+        verbose=True,
+        return_source_documents=True,
+        return_generated_question=True
+    )
+    return chain
+
+
+@process_resource
+def get_request_pool():
+    from concurrency import SessionExecutor
+
+    # Shared by every session in the process: "REQUEST_WORKERS" bounds the questions answered at once
+    return SessionExecutor(max_workers=load_config().get("REQUEST_WORKERS", 16))
+
+
+@process_resource
+def get_memory_store():
+    from session_memory import SessionMemoryStore, default_ttl_seconds
+
+    # "SESSION_TTL_DAYS" in config.json: conversations untouched this long are deleted
+    ttl_days = load_config().get("SESSION_TTL_DAYS")
+    return SessionMemoryStore(ttl_seconds=ttl_days * 24 * 3600 if ttl_days else default_ttl_seconds)
+
+
+@process_resource
+def get_bm25_index():
+    from bm25_index import BM25Index
+
+    return BM25Index() if BM25Index.exists() else None
+
+
+@process_resource
+def get_translator():
+    from translation import Translator, BACKENDS
+
+    # "TRANSLATION_BACKEND": "local" in config.json swaps in the offline stand-in
+    backend = BACKENDS[load_config().get("TRANSLATION_BACKEND", "google")]()
+    return Translator(backend=backend)
+
+
+@process_resource
+def get_verse_index():
+    from verse_lookup import VerseIndex
+
+    return VerseIndex()
+
+
+@process_resource
+def get_glossary_index():
+    from glossary import GlossaryIndex
+
+    # Written by vectorize_documents.py; built from the word-meaning tables if ingest hasn't run yet
+    return GlossaryIndex.load() if GlossaryIndex.exists() else GlossaryIndex.build()
+
+
+@process_resource
+def get_answer_cache():
+    from semantic_cache import SemanticAnswerCache
+
+    return SemanticAnswerCache(get_embeddings())
+
+
+@process_resource
+def get_metrics_server():
+    from tracing import serve_metrics
+
+    # "METRICS_PORT": 9100 in config.json exposes /metrics for Prometheus; off by default
+    port = load_config().get("METRICS_PORT")
+    return serve_metrics(int(port)) if port else None
+
+
+# Define a function to measure cold start (first load in a fresh process) against a warm rerun
+def startup_timing_report():
+    report = {}
+    start_time = time.perf_counter()
+    get_embeddings()
+    vectorstore = setup_vectorstore()
+    get_llm_gateway()
+    chat_chain(vectorstore)
+    report["cold_total"] = time.perf_counter() - start_time
+    report["cold_resources"] = dict(load_timings)
+
+    start_time = time.perf_counter()
+    vectorstore = setup_vectorstore()
+    get_llm_gateway()
+    chat_chain(vectorstore)
+    report["warm_rerun"] = time.perf_counter() - start_time
+    return report
+
+
+if __name__ == "__main__":
+    report = startup_timing_report()
+    print("Cold start breakdown:")
+    for name, seconds in report["cold_resources"].items():
+        print(f"  {name:<20} {seconds:8.3f}s")
+    print(f"Cold start total:       {report['cold_total']:8.3f}s")
+    print(f"Warm rerun total:       {report['warm_rerun']:8.3f}s")
@@ -0,0 +1,82 @@
+import re
+from typing import Any, Optional
+from langchain_core.retrievers import BaseRetriever
+from verse_lookup import GITA, YOGA_SUTRAS, GITA_PATTERN, YOGA_SUTRAS_PATTERN
+from tracing import span
+
+CHAPTER_PATTERN = re.compile(r"\b(?:in|from|of|within)\s+(?:the\s+)?(?:chapter|pada|book)\s+(\d{1,2})\b")
+TRANSLATOR_NAMES = {
+    "adidevananda": "Swami Adidevananda",
+    "gambirananda": "Swami Gambirananda",
+    "sivananda": "Swami Sivananda",
+    "sankaranarayan": "Dr. S. Sankaranarayan",
+    "purohit": "Shri Purohit Swami",
+}
+
+
+# Define a function to derive a Chroma metadata filter from the wording of a question
+def parse_metadata_filter(question):
+    text = question.lower()
+    conditions = []
+    if YOGA_SUTRAS_PATTERN.search(text):
+        conditions.append({"scripture": YOGA_SUTRAS})
+    elif GITA_PATTERN.search(text):
+        conditions.append({"scripture": GITA})
+    match = CHAPTER_PATTERN.search(text)
+    if match:
+        conditions.append({"chapter": int(match.group(1))})
+    for name, translator in TRANSLATOR_NAMES.items():
+        if name in text:
+            conditions.append({"translator": translator})
+            break
+    return combine_filters(conditions)
+
+
+def combine_filters(conditions):
+    conditions = [condition for condition in conditions if condition]
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+# Retriever that narrows the similarity search with metadata filters: a fixed `filter`
+# set by the caller plus whatever the question itself names ("in chapter 2", "Sivananda").
+# Falls back to the unfiltered search if the filtered subset comes back empty.
+class MetadataFilteredRetriever(BaseRetriever):
+    vectorstore: Any
+    k: int = 4
+    filter: Optional[dict] = None
+
+    # A sharded store also routes on the question's wording, which its vector search alone never sees
+    def shard_kwargs(self, query, vector, metadata_filter=None):
+        if not hasattr(self.vectorstore, "route"):
+            return {}
+        return {"shards": self.vectorstore.route(query, vector, metadata_filter)}
+
+    # Define a function to run the (possibly filtered) search; returns the documents and the filter applied
+    def search(self, query, k=None):
+        return self.search_routed(query, k)[:2]
+
+    # Define a function to run the search and also return the shards it searched (None for an unsharded store)
+    def search_routed(self, query, k=None):
+        k = k or self.k
+        metadata_filter = combine_filters([self.filter, parse_metadata_filter(query)])
+        # Embedded once up front, so the unfiltered fallback doesn't embed the query a second time
+        with span("embed_query"):
+            vector = self.vectorstore.embeddings.embed_query(query)
+        with span("vector_search", filtered=bool(metadata_filter)) as attributes:
+            documents = []
+            if metadata_filter:
+                routing = self.shard_kwargs(query, vector, metadata_filter)
+                documents = self.vectorstore.similarity_search_by_vector(vector, k=k, filter=metadata_filter, **routing)
+            if not documents:
+                metadata_filter = None
+                routing = self.shard_kwargs(query, vector)
+                documents = self.vectorstore.similarity_search_by_vector(vector, k=k, **routing)
+            attributes["documents"] = len(documents)
+        return documents, metadata_filter, routing.get("shards")
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search(query)[0]
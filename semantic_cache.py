@@ -0,0 +1,222 @@
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+import numpy as np
+from langchain.docstore.document import Document
+from tracing import span
+from concurrency import InstrumentedLock
+from query_rewrite import is_standalone
+from retrieval_filters import parse_metadata_filter
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+default_cache_path = os.path.join(working_dir, "answer_cache", "answers.sqlite")
+default_threshold = 0.92  # Cosine similarity needed to treat two questions as the same
+default_max_entries = 5000
+default_ttl_seconds = 30 * 24 * 3600
+# 1: entries from before were embedded through the faulty embedding cache
+# 2: every entry records its question's scope
+schema_version = 2
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+# Define a function to describe what a question pins down that embeddings barely see: the scripture,
+# chapter and translator it names, and every number in it ("chapter 2" and "chapter 3" embed almost
+# alike). A cached answer is only reused for a question with exactly the same scope.
+def question_scope(question):
+    return json.dumps(
+        {"filter": parse_metadata_filter(question), "numbers": NUMBER_PATTERN.findall(question)}, sort_keys=True
+    )
+
+
+# Semantic answer cache: questions are embedded, and a new question whose embedding is close
+# enough to a cached one with the same scope gets that answer (and its sources) back without touching the chain.
+# Entries persist in SQLite; the normalized vectors are also held in memory for a fast scan.
+class SemanticAnswerCache:
+    def __init__(self, embeddings, path=default_cache_path, threshold=default_threshold,
+                 max_entries=default_max_entries, ttl_seconds=default_ttl_seconds):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = InstrumentedLock("answer_cache")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, question TEXT, answer TEXT, "
+            "sources TEXT, vector BLOB, created REAL, last_used REAL, scope TEXT)"
+        )
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < schema_version:
+            self.db.execute("DELETE FROM answers")
+            if "scope" not in {row[1] for row in self.db.execute("PRAGMA table_info(answers)")}:
+                self.db.execute("ALTER TABLE answers ADD COLUMN scope TEXT")
+            self.db.execute(f"PRAGMA user_version = {schema_version}")
+        self.db.execute("DELETE FROM answers WHERE created < ?", (time.time() - ttl_seconds,))
+        self.db.commit()
+        rows = self.db.execute("SELECT id, vector, scope FROM answers").fetchall()
+        self.ids = [row_id for row_id, _, _ in rows]
+        self.scopes = [scope for _, _, scope in rows]
+        self.matrix = np.array([np.frombuffer(blob, dtype=np.float32) for _, blob, _ in rows], dtype=np.float32)
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self.miss_latency = None  # Moving average of what a full chain call costs
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question.strip()), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    # Define a function to find the closest cached answer with the same scope above the similarity threshold
+    def lookup(self, question):
+        start_time = time.perf_counter()
+        vector = self._embed(question)
+        scope = question_scope(question)
+        with self.lock:
+            row = None
+            if len(self.ids):
+                scores = self.matrix @ vector
+                scores[np.asarray(self.scopes) != scope] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    row_id = self.ids[best]
+                    row = self.db.execute(
+                        "SELECT question, answer, sources, created FROM answers WHERE id = ?", (row_id,)
+                    ).fetchone()
+                    if row and row[3] < time.time() - self.ttl_seconds:
+                        self._remove([row_id])
+                        row = None
+                    elif row:
+                        self.db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), row_id))
+                        self.db.commit()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.miss_latency is not None:
+                self.latency_saved += max(self.miss_latency - (time.perf_counter() - start_time), 0.0)
+        sources = [Document(page_content=s["page_content"], metadata=s["metadata"]) for s in json.loads(row[2])]
+        return {"question": row[0], "answer": row[1], "source_documents": sources, "similarity": float(scores[best])}
+
+    def put(self, question, answer, source_documents=(), latency=None):
+        vector = self._embed(question)
+        sources = json.dumps(
+            [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in source_documents],
+            ensure_ascii=False
+        )
+        now = time.time()
+        with self.lock:
+            if latency is not None:
+                self.miss_latency = latency if self.miss_latency is None else 0.8 * self.miss_latency + 0.2 * latency
+            cursor = self.db.execute(
+                "INSERT INTO answers (question, answer, sources, vector, created, last_used, scope) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (question, answer, sources, vector.tobytes(), now, now, question_scope(question))
+            )
+            self.ids.append(cursor.lastrowid)
+            self.scopes.append(question_scope(question))
+            self.matrix = np.vstack([self.matrix.reshape(-1, len(vector)), vector[None, :]])
+            overflow = len(self.ids) - self.max_entries
+            if overflow > 0:
+                # Least recently used entries go first
+                stale = [row_id for (row_id,) in self.db.execute(
+                    "SELECT id FROM answers ORDER BY last_used LIMIT ?", (overflow,)
+                )]
+                self._remove(stale)
+            self.db.commit()
+
+    def _remove(self, row_ids):
+        row_ids = set(row_ids)
+        self.db.executemany("DELETE FROM answers WHERE id = ?", [(row_id,) for row_id in row_ids])
+        keep = [i for i, row_id in enumerate(self.ids) if row_id not in row_ids]
+        self.ids = [self.ids[i] for i in keep]
+        self.scopes = [self.scopes[i] for i in keep]
+        self.matrix = self.matrix[keep]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.ids),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": self.latency_saved,
+            }
+
+
+# Wraps a ConversationalRetrievalChain: answers from the cache when the question is already
+# standalone (first turn of a conversation), otherwise runs the chain and caches its result
+# under the standalone question the chain generated.
+class CachedChain:
+    def __init__(self, chain, cache):
+        self.chain = chain
+        self.cache = cache
+        self.memory = chain.memory
+
+    # Questions that don't depend on the conversation can be answered from the cache as they are
+    def standalone_question(self, question):
+        if not self.memory.chat_memory.messages or is_standalone(question):
+            return question
+        return None
+
+    def invoke(self, inputs, config=None):
+        question = inputs["question"]
+        standalone = self.standalone_question(question)
+        if standalone is not None:
+            with span("cache_lookup") as attributes:
+                hit = self.cache.lookup(standalone)
+                attributes["hit"] = hit is not None
+            if hit is not None:
+                self.memory.save_context({"question": question}, {"answer": hit["answer"]})
+                return {"question": question, "answer": hit["answer"],
+                        "source_documents": hit["source_documents"], "cached": True}
+        start_time = time.perf_counter()
+        response = self.chain.invoke(inputs, config=config)
+        self.cache.put(
+            response.get("generated_question") or standalone or question,
+            response["answer"],
+            response.get("source_documents", []),
+            latency=time.perf_counter() - start_time
+        )
+        return response
+
+    def __call__(self, inputs):
+        return self.invoke(inputs)
+
+
+# Define a function to collect the curated questions shipped in the *_Questions.csv files
+def load_curated_questions(data_directory=os.path.join(working_dir, "Data")):
+    import pandas as pd
+
+    questions = []
+    for file_path in glob.glob(os.path.join(data_directory, "*_Questions*.csv")):
+        df = pd.read_csv(file_path)
+        questions.extend(df["question"].dropna().astype(str).str.strip().tolist())
+    return list(dict.fromkeys(q for q in questions if q))
+
+
+# Define a function to pre-warm the cache by answering each curated question once
+def prewarm(cache, make_chain, questions=None):
+    answered = 0
+    for question in questions if questions is not None else load_curated_questions():
+        if cache.lookup(question) is not None:
+            continue
+        start_time = time.perf_counter()
+        chain = make_chain()  # A fresh conversation per question, so each answer stands alone
+        try:
+            response = chain.invoke({"question": question})
+        finally:
+            chain.memory.clear()  # Don't leave pre-warm conversations in the session store
+        cache.put(question, response["answer"], response.get("source_documents", []),
+                  latency=time.perf_counter() - start_time)
+        answered += 1
+    return answered
+
+
+if __name__ == "__main__":
+    from resources import setup_vectorstore, chat_chain, get_answer_cache
+
+    cache = get_answer_cache()
+    count = prewarm(cache, lambda: chat_chain(setup_vectorstore()))
+    print(f"Pre-warmed {count} answers; cache stats: {cache.stats()}")
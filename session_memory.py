@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.messages import SystemMessage, get_buffer_string, messages_from_dict, messages_to_dict
+from langchain_core.pydantic_v1 import PrivateAttr
+from rate_limit import backoff_delay, estimate_tokens, retry_after
+from concurrency import InstrumentedLock
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+default_store_path = os.path.join(working_dir, "session_memory", "sessions.sqlite")
+default_token_budget = 1000  # History (summary + recent turns) fed to the condense-question prompt
+default_ttl_seconds = 30 * 24 * 3600  # Sessions nobody has touched for this long are deleted
+prune_interval_seconds = 3600  # How often saves also sweep out expired sessions
+min_window_turns = 1  # The last exchange is always kept verbatim, whatever its size
+summary_retry_base = 5.0  # Seconds; a failed summary is retried with jittered exponential backoff
+summary_retry_cap = 300.0
+
+logger = logging.getLogger("wisdom_query.session_memory")
+
+# Summaries are written off the request path; one shared pool for every session in the process
+summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+# Persistent per-session memory: the rolling summary, the verbatim recent turns and the evicted
+# turns still waiting to be folded into the summary. Sessions expire `ttl_seconds` after their last save.
+class SessionMemoryStore:
+    def __init__(self, path=default_store_path, ttl_seconds=default_ttl_seconds):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.lock = InstrumentedLock("session_memory_store")
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(session_id TEXT PRIMARY KEY, summary TEXT, messages TEXT, updated REAL, pending TEXT)"
+        )
+        if "pending" not in {row[1] for row in self.db.execute("PRAGMA table_info(sessions)")}:
+            self.db.execute("ALTER TABLE sessions ADD COLUMN pending TEXT")  # Stores created before pending turns were kept
+        self.db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        self.last_pruned = 0.0
+        self.prune()
+
+    # Define a function to delete the sessions that have expired; returns how many were removed
+    def prune(self):
+        with self.lock:
+            removed = self.db.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl_seconds,)).rowcount
+            self.db.commit()
+            self.last_pruned = time.time()
+        return removed
+
+    # Define a function to load a session as (summary, recent messages, messages pending summary)
+    def load(self, session_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT summary, messages, pending FROM sessions WHERE session_id = ? AND updated >= ?",
+                (session_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        if row is None:
+            return "", [], []
+        return row[0], messages_from_dict(json.loads(row[1])), messages_from_dict(json.loads(row[2] or "[]"))
+
+    def save(self, session_id, summary, messages, pending=()):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, summary, messages, updated, pending) VALUES (?, ?, ?, ?, ?)",
+                (session_id, summary, json.dumps(messages_to_dict(messages)), time.time(),
+                 json.dumps(messages_to_dict(list(pending))))
+            )
+            self.db.commit()
+        if time.time() - self.last_pruned > prune_interval_seconds:
+            self.prune()
+
+    def delete(self, session_id):
+        with self.lock:
+            self.db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self.db.commit()
+
+
+# Chat memory under a token budget: recent turns stay verbatim; once they exceed the budget the
+# oldest turns are folded into a rolling summary by the LLM in the background, so the history
+# sent with each question stays roughly the same size however long the conversation gets
+class SessionMemory(BaseChatMemory):
+    session_id: str
+    store: Any
+    summarizer: Any = None
+    token_budget: int = default_token_budget
+    memory_key: str = "chat_history"
+    summary: str = ""
+    _pending: List[Any] = PrivateAttr(default_factory=list)  # Evicted turns waiting to be summarized
+    _summarizing_turns: List[Any] = PrivateAttr(default_factory=list)  # Evicted turns being summarized now
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _summarizing: bool = PrivateAttr(default=False)
+    _generation: int = PrivateAttr(default=0)  # Bumped by clear(), so a summary in progress is discarded
+    _failures: int = PrivateAttr(default=0)  # Consecutive summarizer failures, for the retry backoff
+
+    @classmethod
+    def for_session(cls, session_id, store, **kwargs):
+        summary, messages, pending = store.load(session_id)
+        memory = cls(session_id=session_id, store=store, summary=summary, **kwargs)
+        memory.chat_memory.add_messages(messages)
+        # Turns evicted before a restart are still folded into the summary
+        memory._pending = list(pending)
+        memory._schedule_summary()
+        return memory
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+
+    def history_messages(self):
+        with self._lock:
+            messages = list(self.chat_memory.messages)
+            summary = self.summary
+        if summary:
+            messages.insert(0, SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+        return messages
+
+    def history_tokens(self):
+        return estimate_tokens(get_buffer_string(self.history_messages()))
+
+    # Define a function to list the verbatim recent turns as {"question", "answer"} pairs, for display
+    def transcript(self):
+        with self._lock:
+            messages = list(self.chat_memory.messages)
+        return [
+            {"question": question.content, "answer": answer.content}
+            for question, answer in zip(messages[0::2], messages[1::2])
+        ]
+
+    def load_memory_variables(self, inputs):
+        messages = self.history_messages()
+        return {self.memory_key: messages if self.return_messages else get_buffer_string(messages)}
+
+    def save_context(self, inputs, outputs):
+        with self._lock:
+            super().save_context(inputs, outputs)
+            self._evict_over_budget()
+            self._save()
+        self._schedule_summary()
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self.summary = ""
+            self._pending = []
+            self._summarizing_turns = []
+            self._generation += 1
+            self.store.delete(self.session_id)
+
+    # Saved with every evicted turn not yet in the summary, so a restart doesn't lose them (call with _lock held)
+    def _save(self):
+        self.store.save(self.session_id, self.summary, self.chat_memory.messages, self._summarizing_turns + self._pending)
+
+    # Define a function to move the oldest turns out of the window until it fits the budget
+    def _evict_over_budget(self):
+        messages = self.chat_memory.messages
+        budget = self.token_budget - estimate_tokens(self.summary) if self.summary else self.token_budget
+        while len(messages) > 2 * min_window_turns and estimate_tokens(get_buffer_string(messages)) > budget:
+            self._pending.extend(messages[:2])
+            messages = messages[2:]
+        if len(messages) != len(self.chat_memory.messages):
+            self.chat_memory.clear()
+            self.chat_memory.add_messages(messages)
+
+    def _schedule_summary(self):
+        with self._lock:
+            if not self._pending or self._summarizing:
+                return
+            self._summarizing = True
+        summary_executor.submit(self._summarize)
+
+    # Runs on the summary pool: fold the evicted turns into the summary, repeating if more arrived meanwhile
+    def _summarize(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._summarizing_turns = pending
+                summary = self.summary
+                generation = self._generation
+                if not pending:
+                    self._summarizing = False
+                    return
+            # Without a model the evicted turns are simply dropped; the recent window still fits the budget
+            if self.summarizer is not None:
+                prompt = SUMMARY_PROMPT.format(summary=summary, new_lines=get_buffer_string(pending))
+                try:
+                    result = self.summarizer.invoke(prompt)
+                    summary = getattr(result, "content", result).strip()
+                except Exception as error:
+                    self._retry_later(pending, generation, error)
+                    return
+            with self._lock:
+                self._summarizing_turns = []
+                self._failures = 0
+                if generation != self._generation:
+                    continue  # Cleared meanwhile: the session is gone, don't write it back
+                self.summary = summary
+                self._save()
+
+    # Define a function to keep the turns a failed summary was given (rate limit, timeout...) and try
+    # again after a backoff; they stay persisted as pending meanwhile, so a restart retries them too
+    def _retry_later(self, pending, generation, error):
+        with self._lock:
+            self._summarizing_turns = []
+            if generation == self._generation:
+                self._pending[:0] = pending
+            self._failures += 1
+            delay = retry_after(error) or backoff_delay(self._failures - 1, summary_retry_base, summary_retry_cap)
+        logger.warning("Summary for session %s failed (%r); retrying in %.1fs", self.session_id, error, delay)
+        timer = threading.Timer(delay, summary_executor.submit, args=(self._summarize,))
+        timer.daemon = True
+        timer.start()
@@ -0,0 +1,267 @@
+import json
+import os
+import re
+import numpy as np
+from verse_lookup import GITA, YOGA_SUTRAS
+from tracing import span
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+persist_directory = os.path.join(working_dir, "vector_db_dir")
+shards_path = os.path.join(persist_directory, "shards.json")
+manifest_name = "ingest_manifest.json"  # Written by vectorize_documents.py; records each file's shard and chunk IDs
+
+default_max_shards = 3  # Shards searched per query, on top of any the question's wording forces in
+stats_page_size = 5000  # Rows read per call while computing a shard's centroid
+
+SCRIPTURE_SLUGS = {GITA: "gita", YOGA_SUTRAS: "yoga_sutras"}
+# Source families, matched on the lower-cased file name; anything else is a verse table
+FAMILY_PATTERNS = (
+    ("questions", re.compile(r"question")),
+    ("concepts", re.compile(r"concept")),
+    ("glossary", re.compile(r"word_meaning|glossary")),
+)
+# Wording that asks about a word rather than a teaching; only then are the glossaries searched
+GLOSSARY_PATTERN = re.compile(
+    r"\b(?:word|words|term|terms|meaning of|what does \w+ mean|define|definition|sanskrit for|hindi for|etymology)\b"
+)
+
+
+def scripture_for_source(source):
+    return YOGA_SUTRAS if "patanjali" in source.lower() else GITA
+
+
+# Define a function to name the shard a source file is ingested into ("gita_verses", "yoga_sutras_questions", ...)
+def shard_for_source(source):
+    name = os.path.basename(source).lower()
+    if name.endswith(".pdf"):
+        return "documents"  # Free-form PDFs carry no scripture metadata
+    family = next((family for family, pattern in FAMILY_PATTERNS if pattern.search(name)), "verses")
+    return f"{SCRIPTURE_SLUGS[scripture_for_source(source)]}_{family}"
+
+
+def shard_attributes(name):
+    for scripture, slug in SCRIPTURE_SLUGS.items():
+        if name.startswith(slug + "_"):
+            return {"scripture": scripture, "family": name[len(slug) + 1:]}
+    return {"scripture": None, "family": name}
+
+
+def collection_name(shard):
+    return f"shard_{shard}"
+
+
+# Define a function to pull the value a Chroma-style filter pins `key` to, if any
+def filter_value(metadata_filter, key):
+    if not metadata_filter:
+        return None
+    if "$and" in metadata_filter:
+        return next((value for condition in metadata_filter["$and"]
+                     if (value := filter_value(condition, key)) is not None), None)
+    value = metadata_filter.get(key)
+    return value.get("$eq") if isinstance(value, dict) else value
+
+
+# Picks the shards worth searching for a query. Rules first (a scripture or translator filter
+# rules shards out; glossaries only answer questions about words), then the query vector's
+# cosine similarity to each shard's centroid ranks what is left.
+class ShardRouter:
+    def __init__(self, shards, max_shards=default_max_shards):
+        self.shards = shards  # name -> {"scripture", "family", "count", "centroid"}
+        self.max_shards = max_shards
+        self.centroid_names = [name for name, info in shards.items() if info.get("centroid")]
+        self.centroids = np.asarray([shards[name]["centroid"] for name in self.centroid_names], dtype=np.float32)
+
+    @classmethod
+    def load(cls, path=shards_path, **kwargs):
+        if not os.path.exists(path):
+            return cls({}, **kwargs)
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["shards"], **kwargs)
+
+    def route(self, query=None, vector=None, metadata_filter=None):
+        candidates = [name for name, info in self.shards.items() if info.get("count")]
+        scripture = filter_value(metadata_filter, "scripture")
+        if scripture is not None:
+            candidates = [name for name in candidates if self.shards[name]["scripture"] == scripture]
+        if filter_value(metadata_filter, "translator") is not None:
+            candidates = [name for name in candidates if self.shards[name]["family"] == "verses"]
+        forced = []
+        if query is not None:
+            if GLOSSARY_PATTERN.search(query.lower()):
+                forced = [name for name in candidates if self.shards[name]["family"] == "glossary"]
+            else:
+                candidates = [name for name in candidates if self.shards[name]["family"] != "glossary"]
+        ranked = [name for name in candidates if name not in forced]
+        if vector is not None and len(self.centroid_names):
+            query_vector = np.asarray(vector, dtype=np.float32)
+            query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+            similarity = dict(zip(self.centroid_names, (self.centroids @ query_vector).tolist()))
+            ranked.sort(key=lambda name: similarity.get(name, -1.0), reverse=True)
+        return forced + ranked[:self.max_shards]
+
+    def scanned_fraction(self, names):
+        total = sum(info.get("count", 0) for info in self.shards.values())
+        return round(sum(self.shards.get(name, {}).get("count", 0) for name in names) / total, 4) if total else 1.0
+
+
+# One Chroma collection per shard under vector_db_dir, behind the same surface the retrievers,
+# the BM25 lookup and the compact export use on a single collection. Searches go to the routed
+# shards only and their hits are merged by distance (every shard shares the embedding model).
+class ShardedVectorStore:
+    def __init__(self, embeddings=None, directory=persist_directory, max_shards=default_max_shards):
+        self.embeddings = embeddings
+        self.directory = directory
+        self.shards_path = os.path.join(directory, "shards.json")
+        self.router = ShardRouter.load(self.shards_path, max_shards=max_shards)
+        self.collections = {}
+        self._id_shards = None
+
+    @staticmethod
+    def exists(directory=persist_directory):
+        return os.path.exists(os.path.join(directory, "shards.json"))
+
+    def shard_names(self):
+        return sorted(set(self.router.shards) | set(self.collections))
+
+    # Define a function to open (or create) one shard's collection
+    def shard(self, name):
+        if name not in self.collections:
+            from langchain_chroma import Chroma
+
+            self.collections[name] = Chroma(
+                collection_name=collection_name(name),
+                persist_directory=self.directory,
+                embedding_function=self.embeddings
+            )
+        return self.collections[name]
+
+    def route(self, query=None, vector=None, metadata_filter=None):
+        return self.router.route(query, vector, metadata_filter)
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, shards=None, **kwargs):
+        if shards is None:
+            shards = self.route(vector=embedding, metadata_filter=filter)
+        with span("shard_search", shards=",".join(shards), scanned_fraction=self.router.scanned_fraction(shards)):
+            scored = []
+            for name in shards:
+                scored.extend(self.shard(name).similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter))
+        scored.sort(key=lambda pair: pair[1])  # Distances: lower is closer
+        return [document for document, _ in scored[:k]]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        vector = self.embeddings.embed_query(query)
+        return self.similarity_search_by_vector(vector, k=k, filter=filter, shards=self.route(query, vector, filter))
+
+    # Define a function to map chunk IDs to their shard, read once from the ingest manifest
+    def id_shards(self):
+        if self._id_shards is None:
+            from ingest_manifest import load_manifest
+
+            manifest = load_manifest(os.path.join(self.directory, manifest_name))
+            self._id_shards = {
+                chunk: entry["shard"] for entry in manifest["files"].values() for chunk in entry["chunks"]
+            }
+        return self._id_shards
+
+    # Define a function to read rows by ID or page through every shard in turn. IDs are only looked up
+    # in the shard the manifest puts them in; with `shards`, IDs that live in any other shard are skipped.
+    # IDs the manifest doesn't know (an ingest after this store was opened) are looked up in every candidate shard.
+    def get(self, ids=None, include=None, limit=None, offset=None, shards=None, **kwargs):
+        include = ["documents", "metadatas"] if include is None else include
+        result = {"ids": [], **{field: [] for field in include}}
+        if ids is not None:
+            candidates = self.shard_names() if shards is None else list(shards)
+            grouped = {name: [] for name in candidates}
+            unknown = []
+            for doc_id in ids:
+                name = self.id_shards().get(doc_id)
+                if name is None:
+                    unknown.append(doc_id)
+                elif name in grouped:
+                    grouped[name].append(doc_id)
+            for name in grouped:
+                grouped[name].extend(unknown)
+            pages = [self.shard(name).get(ids=shard_ids, include=include) for name, shard_ids in grouped.items() if shard_ids]
+        else:
+            pages, skip, remaining = [], offset or 0, limit
+            for name in self.shard_names():
+                if remaining is not None and remaining <= 0:
+                    break
+                count = self.shard(name)._collection.count()
+                if skip >= count:
+                    skip -= count
+                    continue
+                page = self.shard(name).get(include=include, limit=remaining, offset=skip or None)
+                skip = 0
+                if remaining is not None:
+                    remaining -= len(page["ids"])
+                pages.append(page)
+        for page in pages:
+            result["ids"].extend(page["ids"])
+            for field in include:
+                values = page.get(field)
+                result[field].extend(list(values) if values is not None else [None] * len(page["ids"]))
+        return result
+
+    # Define a function to upsert documents into the shard each one's source file belongs to
+    def add_documents(self, documents, ids):
+        grouped = {}
+        for document, document_id in zip(documents, ids):
+            shard_documents, shard_ids = grouped.setdefault(shard_for_source(document.metadata["source"]), ([], []))
+            shard_documents.append(document)
+            shard_ids.append(document_id)
+        for name, (shard_documents, shard_ids) in grouped.items():
+            self.shard(name).add_documents(documents=shard_documents, ids=shard_ids)
+        return list(ids)
+
+    # Deleting an ID a shard doesn't hold is a no-op, so every shard is asked
+    def delete(self, ids=None, **kwargs):
+        for name in self.shard_names():
+            self.shard(name).delete(ids=ids)
+
+    # Define a function to drop one shard's collection entirely, so it can be rebuilt on its own
+    def drop_shard(self, name):
+        self.shard(name).delete_collection()
+        self.collections.pop(name, None)
+        self.router.shards.pop(name, None)
+
+    # Define a function to refresh the row count and centroid of the given shards and save the routing table
+    def update_stats(self, names):
+        shards = dict(self.router.shards)
+        for name in names:
+            total, count, offset = None, 0, 0
+            while True:
+                page = self.shard(name).get(include=["embeddings"], limit=stats_page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                vectors = np.asarray(page["embeddings"], dtype=np.float32)
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                total = vectors.sum(axis=0) if total is None else total + vectors.sum(axis=0)
+                count += len(page["ids"])
+                offset += len(page["ids"])
+            centroid = None if total is None else (total / max(float(np.linalg.norm(total)), 1e-12)).tolist()
+            shards[name] = {**shard_attributes(name), "count": count, "centroid": centroid}
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.shards_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "shards": shards}, f)
+        os.replace(tmp_path, self.shards_path)
+        self.router = ShardRouter(shards, max_shards=self.router.max_shards)
+
+    def __len__(self):
+        return sum(self.shard(name)._collection.count() for name in self.shard_names())
+
+    def as_retriever(self, k=4, metadata_filter=None, **kwargs):
+        from retrieval_filters import MetadataFilteredRetriever
+
+        return MetadataFilteredRetriever(vectorstore=self, k=k, filter=metadata_filter)
+
+
+# Define a function to open vector_db_dir: the sharded collections once ingest has written them,
+# otherwise the single collection of a tree vectorized before sharding
+def open_vectorstore(embeddings=None, directory=persist_directory):
+    if ShardedVectorStore.exists(directory):
+        return ShardedVectorStore(embeddings=embeddings, directory=directory)
+    from langchain_chroma import Chroma
+
+    return Chroma(persist_directory=directory, embedding_function=embeddings)
@@ -0,0 +1,114 @@
+import contextvars
+import queue
+import threading
+import time
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# Raised inside the chain once its consumer has gone away, so the generation stops at the next token
+class StreamCancelled(Exception):
+    pass
+
+
+# Callback handler that forwards retrieval results and answer tokens onto a queue.
+# Tokens seen before retrieval finishes belong to the condense-question call and are skipped.
+class StreamingAnswerHandler(BaseCallbackHandler):
+    raise_error = True  # Lets StreamCancelled abort the chain instead of being logged and ignored
+
+    def __init__(self, events, cancelled=None):
+        self.events = events
+        self.cancelled = cancelled or threading.Event()
+        self.retrieved = False
+
+    def on_retriever_end(self, documents, **kwargs):
+        if self.cancelled.is_set():
+            raise StreamCancelled()
+        self.retrieved = True
+        self.events.put(("sources", documents, time.perf_counter()))
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.cancelled.is_set():
+            raise StreamCancelled()
+        if self.retrieved and token:
+            self.events.put(("token", token, time.perf_counter()))
+
+
+# Runs a ConversationalRetrievalChain in a worker thread and exposes its progress as events:
+# ("sources", documents) as soon as retrieval ends, then ("token", text) per generated token,
+# then ("done", response). Timing metrics are filled in as the events are consumed.
+class AnswerStream:
+    # `submit(fn, *args)` runs the chain on a shared pool (e.g. a SessionExecutor); by default it gets its own thread
+    def __init__(self, chain, question, callbacks=None, submit=None):
+        self.chain = chain
+        self.question = question
+        self.callbacks = callbacks or []
+        self.submit = submit
+        self.cancelled = threading.Event()
+        self.response = None
+        self.source_documents = []
+        self.metrics = {
+            "retrieval_time": None,
+            "time_to_first_token": None,
+            "total_time": None,
+            "tokens": 0,
+            "tokens_per_second": None,
+        }
+
+    # Define a function to stop the answer early (the client disconnected); the chain aborts at its next token
+    def cancel(self):
+        self.cancelled.set()
+
+    def _run(self, events):
+        handler = StreamingAnswerHandler(events, self.cancelled)
+        try:
+            response = self.chain.invoke({"question": self.question}, config={"callbacks": [handler, *self.callbacks]})
+            events.put(("done", response, time.perf_counter()))
+        except Exception as error:
+            events.put(("error", error, time.perf_counter()))
+
+    def events(self):
+        events = queue.Queue()
+        start_time = time.perf_counter()
+        first_token_time = None
+        # The worker runs in a copy of this context, so it records into the caller's current trace
+        if self.submit is not None:
+            self.submit(self._run, events)
+        else:
+            threading.Thread(target=contextvars.copy_context().run, args=(self._run, events), daemon=True).start()
+        while True:
+            kind, payload, timestamp = events.get()
+            if kind == "error":
+                raise payload
+            if kind == "sources":
+                self.source_documents = payload
+                self.metrics["retrieval_time"] = timestamp - start_time
+            elif kind == "token":
+                if first_token_time is None:
+                    first_token_time = timestamp
+                    self.metrics["time_to_first_token"] = timestamp - start_time
+                self.metrics["tokens"] += 1
+            elif kind == "done":
+                self.response = payload
+                self.source_documents = payload.get("source_documents", self.source_documents)
+                self.metrics["total_time"] = timestamp - start_time
+                if first_token_time is not None and timestamp > first_token_time:
+                    self.metrics["tokens_per_second"] = self.metrics["tokens"] / (timestamp - first_token_time)
+            yield kind, payload
+            if kind == "done":
+                return
+
+    # Define a function to yield only the answer tokens, for st.write_stream and similar consumers.
+    # Answers that arrive without streaming (e.g. from a cache) are yielded whole.
+    def tokens(self, on_sources=None):
+        sources_shown = False
+        for kind, payload in self.events():
+            if kind == "sources" and on_sources is not None:
+                on_sources(payload)
+                sources_shown = True
+            elif kind == "token":
+                yield payload
+            elif kind == "done":
+                if not sources_shown and on_sources is not None:
+                    on_sources(self.source_documents)
+                if not self.metrics["tokens"]:
+                    yield payload.get("answer", "")
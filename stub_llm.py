@@ -0,0 +1,52 @@
+import time
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+# Deterministic offline stand-in for ChatGroq, for benchmarks and load tests.
+# The answer is built from the prompt itself, so it varies with the retrieved context
+# but is identical across runs; latency is simulated as time-to-first-token plus a per-token delay.
+class StubChatModel(BaseChatModel):
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    answer_words: int = 40
+    streaming: bool = False  # Like ChatGroq(streaming=True): invoke() streams and fires per-token callbacks
+
+    @property
+    def _llm_type(self):
+        return "stub-chat"
+
+    def _answer(self, messages):
+        prompt = " ".join(str(message.content) for message in messages)
+        if "Standalone question:" in prompt or "standalone question" in prompt.lower():
+            # Condense-question prompt: echo the follow-up, which is a valid standalone rewrite
+            return prompt.rsplit("Follow Up Input:", 1)[-1].split("Standalone question:")[0].strip()
+        words = prompt.split()
+        return "Based on the scriptures: " + " ".join(words[-self.answer_words:])
+
+    def _tokens(self, messages):
+        answer = self._answer(messages)
+        return [word + " " for word in answer.split(" ")]
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        if self.streaming:
+            return generate_from_stream(self._stream(messages, stop, run_manager, **kwargs))
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        text = "".join(tokens).strip()
+        usage = {"prompt_tokens": sum(len(str(m.content)) // 4 for m in messages), "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        message = AIMessage(content=text, response_metadata={"token_usage": usage})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in self._tokens(messages):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
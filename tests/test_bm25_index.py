@@ -0,0 +1,75 @@
+from langchain.docstore.document import Document
+from bm25_index import BM25Index, HybridRetriever, build_bm25_index, matches_filter, tokenize
+
+TEXTS = {
+    "verse": "You have a right to perform your prescribed duty, but not to the fruits of action",
+    "sthita": "The sthita-prajña is one whose wisdom is steady",
+    "yoga": "Yoga is the stilling of the fluctuations of the mind",
+}
+
+
+def test_tokenize_folds_diacritics_and_splits_compounds():
+    assert tokenize("What is the Sthita-Prajña?") == ["sthitaprajna", "sthita", "prajna"]
+
+
+def test_bm25_ranks_matching_rows(tmp_path):
+    build_bm25_index(list(TEXTS), list(TEXTS.values()), directory=str(tmp_path))
+    index = BM25Index(str(tmp_path))
+    assert index.search("sthita prajna wisdom")[0][0] == "sthita"
+    assert [doc_id for doc_id, _ in index.search("mind", k=5)] == ["yoga"]
+    assert index.search("unknownword") == []
+
+
+def test_matches_filter():
+    metadata = {"scripture": "Bhagavad Gita", "chapter": 2}
+    assert matches_filter(metadata, {"$and": [{"scripture": "Bhagavad Gita"}, {"chapter": 2}]})
+    assert not matches_filter(metadata, {"chapter": 3})
+
+
+# Stands in for MetadataFilteredRetriever: a fixed dense ranking routed to one shard
+class StubDenseRetriever:
+    def __init__(self, ids, metadata_filter=None):
+        self.ids = ids
+        self.metadata_filter = metadata_filter
+
+    def search_routed(self, query, k=None):
+        return [document(doc_id) for doc_id in self.ids], self.metadata_filter, ["gita_verses"]
+
+
+class StubBM25:
+    def __init__(self, ids):
+        self.ids = ids
+
+    def search(self, query, k=10):
+        return [(doc_id, 1.0) for doc_id in self.ids]
+
+
+class StubVectorStore:
+    def __init__(self):
+        self.shards = None
+
+    def get(self, ids, include, shards=None):
+        self.shards = shards
+        return {"ids": ids, "documents": [TEXTS[doc_id] for doc_id in ids], "metadatas": [document(doc_id).metadata for doc_id in ids]}
+
+
+def document(doc_id):
+    return Document(page_content=TEXTS[doc_id], metadata={"chapter": 6 if doc_id == "yoga" else 2})
+
+
+def test_rrf_puts_rows_found_by_both_rankings_first():
+    vectorstore = StubVectorStore()
+    retriever = HybridRetriever(
+        dense_retriever=StubDenseRetriever(["verse", "sthita"]), bm25_index=StubBM25(["yoga", "sthita"]),
+        vectorstore=vectorstore, k=3
+    )
+    assert [doc.page_content for doc in retriever.invoke("steady wisdom")] == [TEXTS["sthita"], TEXTS["verse"], TEXTS["yoga"]]
+    assert vectorstore.shards == ["gita_verses"]  # Lexical hits come from the shards the dense search used
+
+
+def test_lexical_hits_respect_the_dense_filter():
+    retriever = HybridRetriever(
+        dense_retriever=StubDenseRetriever(["verse"], {"chapter": 2}), bm25_index=StubBM25(["yoga", "sthita"]),
+        vectorstore=StubVectorStore(), k=3
+    )
+    assert [doc.page_content for doc in retriever.invoke("mind")] == [TEXTS["verse"], TEXTS["sthita"]]
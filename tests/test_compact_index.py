@@ -0,0 +1,69 @@
+import numpy as np
+from compact_index import CompactIndex, export_compact_index
+from verse_lookup import YOGA_SUTRAS
+
+
+# Serves get() pages the way Chroma does while exporting; row i points along axis i % 4
+class FakeVectorStore:
+    def __init__(self, texts, sources=None):
+        self.texts = texts
+        self.sources = sources or ["Bhagwad_Gita_Verses_English.csv"] * len(texts)
+
+    def get(self, limit, offset, include):
+        texts = self.texts[offset:offset + limit]
+        vectors = [np.eye(4)[i % 4] for i in range(offset, offset + len(texts))]
+        return {
+            "ids": [f"id-{offset + i}" for i in range(len(texts))],
+            "documents": texts,
+            "metadatas": [{"source": source, "Chapter": 1} for source in self.sources[offset:offset + limit]],
+            "embeddings": vectors,
+        }
+
+
+def test_export_round_trip(tmp_path):
+    export_compact_index(FakeVectorStore(["a", "b", "c"]), directory=str(tmp_path), dtype="float16")
+    index = CompactIndex(str(tmp_path))
+    assert len(index) == 3
+    assert [doc.page_content for doc in index.similarity_search_by_vector([0, 1, 0, 0], k=1)] == ["b"]
+    assert index.get(["id-2"])["metadatas"] == [{"source": "Bhagwad_Gita_Verses_English.csv", "Chapter": 1}]
+
+
+def test_reexport_does_not_touch_an_open_index(tmp_path):
+    directory = str(tmp_path)
+    export_compact_index(FakeVectorStore(["a", "b"]), directory=directory)
+    old = CompactIndex(directory)
+    export_compact_index(FakeVectorStore(["new a", "new b", "new c"]), directory=directory)
+    assert len(old) == 2 and old.texts[1] == "b"
+    new = CompactIndex(directory)
+    assert len(new) == 3 and new.texts[1] == "new b"
+    assert new.directory != old.directory
+
+
+def test_old_versions_are_removed(tmp_path):
+    for texts in (["a"], ["b"], ["c"]):
+        export_compact_index(FakeVectorStore(texts), directory=str(tmp_path))
+    # CURRENT, the served version and the previous one
+    assert len(list(tmp_path.iterdir())) == 3
+    assert CompactIndex(str(tmp_path)).texts[0] == "c"
+
+
+def test_legacy_flat_export_still_opens(tmp_path):
+    export_compact_index(FakeVectorStore(["a"]), directory=str(tmp_path))
+    version = CompactIndex(str(tmp_path)).directory
+    assert CompactIndex.exists(version) and CompactIndex(version).texts[0] == "a"
+    assert not CompactIndex.exists(str(tmp_path / "missing"))
+
+
+def test_routing_matches_the_sharded_store(tmp_path):
+    sources = ["Bhagwad_Gita_Verses_English.csv", "Gita_Word_Meanings_English.csv",
+               "Patanjali_Yoga_Sutras_Verses_English.csv", "Bhagwad_Gita_Verses_Concepts.csv"]
+    export_compact_index(FakeVectorStore(["verse", "word", "sutra", "concept"], sources), directory=str(tmp_path))
+    index = CompactIndex(str(tmp_path))
+    assert set(index.meta["shards"]) == {"gita_verses", "gita_glossary", "yoga_sutras_verses", "gita_concepts"}
+    # Glossaries only answer questions about words, even when the vector is closest to one
+    shards = index.route("What does Krishna teach about duty?", [0, 1, 0, 0])
+    assert "gita_glossary" not in shards
+    assert [doc.page_content for doc in index.similarity_search_by_vector([0, 1, 0, 0], k=1, shards=shards)] != ["word"]
+    assert "gita_glossary" in index.route("What does the word dharma mean?", [1, 0, 0, 0])
+    assert index.route(None, [1, 0, 0, 0], {"scripture": YOGA_SUTRAS}) == ["yoga_sutras_verses"]
+    assert index.get(["id-0", "id-1"], shards=["gita_verses"])["ids"] == ["id-0"]
@@ -0,0 +1,34 @@
+from langchain.docstore.document import Document
+from context_packing import DiversifiedRetriever, verse_key
+from load_test import StubEmbeddings
+from verse_lookup import GITA
+
+
+def row(source, text, chapter=2, verse=47, **metadata):
+    return Document(page_content=text, metadata={"source": source, "scripture": GITA, "chapter": chapter, "verse": verse, **metadata})
+
+
+def test_translations_collapse_and_glossary_rows_survive():
+    documents = [
+        row("Bhagwad_Gita_Verses_English.csv", "You have a right to your duty alone", translator="Swami Gambirananda"),
+        row("Bhagwad_Gita_Verses_English.csv", "Your right is to work only", translator="Swami Sivananda"),
+        row("Gita_Word_Meanings_English.csv", "karmaṇi: in prescribed duties"),
+        row("Gita_Word_Meanings_English.csv", "phaleṣhu: in the fruits"),
+        row("Bhagwad_Gita_Verses_English.csv", "The self is never born", verse=20),
+    ]
+    retriever = DiversifiedRetriever(base=None, embeddings=StubEmbeddings(0))
+    kept = [document.page_content for document in retriever.group("What is my duty?", documents)]
+    assert kept == [
+        "You have a right to your duty alone",
+        "karmaṇi: in prescribed duties",
+        "phaleṣhu: in the fruits",
+        "The self is never born",
+    ]
+
+
+def test_verse_and_question_rows_share_a_key():
+    verse = row("Bhagwad_Gita_Verses_English.csv", "")
+    question = row("Bhagwad_Gita_Verses_English_Questions (1).csv", "")
+    assert verse_key(verse.metadata) == verse_key(question.metadata) is not None
+    assert verse_key(row("Gita_Word_Meanings_Hindi.csv", "").metadata) is None
+    assert verse_key(row("Bhagwad_Gita_Verses_Concepts.csv", "").metadata) is None
@@ -0,0 +1,94 @@
+import multiprocessing
+import numpy as np
+from embedding_cache import EmbeddingStore
+
+dim = 4
+
+
+def vector(i):
+    return [float(i), float(i) + 0.5, -float(i), 1.0]
+
+
+def test_batches_get_their_own_slots(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many(["a"], [vector(1)])
+    store.put_many(["b"], [vector(2)])
+    store.put_many(["c", "d"], [vector(3), vector(4)])
+    slots = dict(store.db.execute("SELECT key, slot FROM entries"))
+    assert len(set(slots.values())) == 4
+    assert store.get_many(["a", "b", "c", "d"]) == [vector(1), vector(2), vector(3), vector(4)]
+
+
+def test_many_batches_read_back(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    keys = [f"key-{i}" for i in range(600)]
+    for start in range(0, len(keys), 256):
+        store.put_many(keys[start:start + 256], [vector(i) for i in range(start, min(start + 256, len(keys)))])
+    assert store.get_many(keys) == [vector(i) for i in range(len(keys))]
+    assert store.stats()["evictions"] == 0
+
+
+def test_full_store_evicts_least_recently_used(tmp_path):
+    max_slots = 10
+    store = EmbeddingStore(str(tmp_path), max_bytes=max_slots * dim * np.dtype(np.float16).itemsize)
+    keys = [f"key-{i}" for i in range(30)]
+    for start in range(0, len(keys), 3):
+        store.put_many(keys[start:start + 3], [vector(i) for i in range(start, start + 3)])
+    stats = store.stats()
+    assert stats["evictions"] >= 20
+    assert stats["entries"] <= max_slots
+    # Whatever survived still reads back its own vector, and the newest batch always survives
+    for key, cached in zip(keys, store.get_many(keys)):
+        assert cached is None or cached == vector(int(key.split("-")[1]))
+    assert store.get_many(keys[-3:]) == [vector(27), vector(28), vector(29)]
+
+
+def test_replaced_key_reuses_a_hole(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many(["a", "b"], [vector(1), vector(2)])
+    store.put_many(["a"], [vector(5)])
+    store.put_many(["c"], [vector(3)])
+    assert store.get_many(["a", "b", "c"]) == [vector(5), vector(2), vector(3)]
+    assert store._used_slots() == (3, 3)
+
+
+def test_store_from_an_older_version_is_discarded(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many(["a"], [vector(1)])
+    with open(store.meta_path, "w") as f:
+        f.write('{"dim": 4, "capacity": 1024, "dtype": "float16"}')
+    reopened = EmbeddingStore(str(tmp_path))
+    assert reopened.get_many(["a"]) == [None]
+    reopened.put_many(["b"], [vector(2)])
+    assert reopened.get_many(["b"]) == [vector(2)]
+
+
+# Vectors repeat every 1000 keys: float16 can't hold the half-steps of larger values
+def write_keys(directory, prefix, count):
+    store = EmbeddingStore(directory)
+    for start in range(0, count, 50):
+        store.put_many([f"{prefix}-{i}" for i in range(start, start + 50)], [vector(i % 1000) for i in range(start, start + 50)])
+
+
+def test_processes_sharing_a_store_never_share_slots(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=write_keys, args=(str(tmp_path), prefix, 1500)) for prefix in ("ingest", "app")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+    store = EmbeddingStore(str(tmp_path))
+    for prefix in ("ingest", "app"):
+        assert store.get_many([f"{prefix}-{i}" for i in range(1500)]) == [vector(i % 1000) for i in range(1500)]
+    assert store._used_slots() == (3000, 3000)
+
+
+def test_reader_picks_up_a_file_grown_by_another_writer(tmp_path):
+    reader = EmbeddingStore(str(tmp_path))
+    writer = EmbeddingStore(str(tmp_path))
+    writer.put_many(["a"], [vector(1)])
+    assert reader.get_many(["a"]) == [vector(1)]
+    keys = [f"key-{i}" for i in range(2000)]
+    writer.put_many(keys, [vector(i % 1000) for i in range(2000)])
+    assert reader.get_many(keys[-2:]) == [vector(998), vector(999)]
@@ -0,0 +1,51 @@
+import pytest
+from glossary import GlossaryIndex, normalize_word, parse_word_query
+
+
+@pytest.fixture(scope="module")
+def index():
+    return GlossaryIndex.build()
+
+
+@pytest.mark.parametrize("question, word", [
+    ("What does 'yuyutsavaḥ' mean?", "yuyutsavaḥ"),
+    ("what does dharma mean", "dharma"),
+    ("What does the Sanskrit word karma mean?", "karma"),
+    ("Meaning of the word dharma", "dharma"),
+    ("define karma", "karma"),
+    ("yoga meaning?", "yoga"),
+])
+def test_word_queries(question, word):
+    assert parse_word_query(question) == word
+
+
+@pytest.mark.parametrize("question", [
+    "What does Krishna mean when he says to act without attachment?",
+    "What does Arjuna mean by his despair?",
+    "What does the Gita say about duty?",
+])
+def test_not_word_queries(question):
+    assert parse_word_query(question) is None
+
+
+@pytest.mark.parametrize("forms", [
+    ("yuyutsavaḥ", "युयुत्सवः", "yuyutsavah"),
+    ("kṣhetre", "क्षेत्रे", "kshetre"),
+    ("Geeta", "gita"),
+])
+def test_spellings_share_a_key(forms):
+    assert len({normalize_word(form) for form in forms}) == 1
+
+
+def test_devanagari_lookup(index):
+    matches = index.answer("what does युयुत्सवः mean?")
+    assert matches[0]["key"] == "yuyutsavah" and matches[0]["distance"] == 0
+
+
+def test_misspelled_word_falls_back_to_fuzzy_match(index):
+    matches = index.answer("what does 'yuyutsava' mean?")
+    assert matches[0]["key"] == "yuyutsavah" and matches[0]["distance"] == 1
+
+
+def test_english_phrase_is_left_to_the_chain(index):
+    assert index.answer("What is the meaning of life?") is None
@@ -0,0 +1,41 @@
+import json
+from ingest_manifest import MANIFEST_VERSION, chunk_id, diff_chunks, load_manifest, save_manifest, text_hash
+
+
+def test_chunk_id_depends_on_position_not_content():
+    assert chunk_id("Gita.csv", "2-47", 0) == chunk_id("Gita.csv", "2-47", 0)
+    assert len({chunk_id("Gita.csv", "2-47", 0), chunk_id("Gita.csv", "2-47", 1),
+                chunk_id("Gita.csv", "2-48", 0), chunk_id("Other.csv", "2-47", 0)}) == 4
+
+
+def test_text_hash_covers_metadata():
+    assert text_hash("verse") != text_hash("verse", {"chapter": 2})
+    assert text_hash("verse", {"a": 1, "b": 2}) == text_hash("verse", {"b": 2, "a": 1})
+
+
+def test_diff_reports_changed_added_and_removed_chunks():
+    old = {"kept": text_hash("same"), "edited": text_hash("before"), "dropped": text_hash("gone")}
+    new = {"kept": text_hash("same"), "edited": text_hash("after"), "added": text_hash("new")}
+    changed, removed = diff_chunks(old, new)
+    assert sorted(changed) == ["added", "edited"]
+    assert removed == ["dropped"]
+
+
+def test_unchanged_file_needs_no_work():
+    chunks = {chunk_id("Gita.csv", "1-1", 0): text_hash("verse")}
+    assert diff_chunks(chunks, dict(chunks)) == ([], [])
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / "db" / "ingest_manifest.json")
+    assert load_manifest(path) == {"version": MANIFEST_VERSION, "files": {}}
+    manifest = {"version": MANIFEST_VERSION, "files": {"Gita.csv": {"hash": "abc", "shard": "gita_verses", "chunks": {}}}}
+    save_manifest(manifest, path)
+    assert load_manifest(path) == manifest
+    assert not (tmp_path / "db" / "ingest_manifest.json.tmp").exists()
+
+
+def test_outdated_manifest_starts_fresh(tmp_path):
+    path = tmp_path / "ingest_manifest.json"
+    path.write_text(json.dumps({"version": MANIFEST_VERSION - 1, "files": {"Gita.csv": {}}}))
+    assert load_manifest(str(path))["files"] == {}
@@ -0,0 +1,104 @@
+import threading
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from llm_gateway import LLMGateway
+from rate_limit import RateBudget, estimate_tokens
+from stub_llm import StubChatModel
+
+
+def ask_concurrently(gateway, questions):
+    answers = [None] * len(questions)
+
+    def ask(i):
+        answers[i] = gateway.invoke([HumanMessage(content=questions[i])]).content
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(questions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return answers
+
+
+def test_identical_prompts_in_flight_share_one_generation():
+    gateway = LLMGateway(model=StubChatModel(first_token_latency=0.3))
+    answers = ask_concurrently(gateway, ["What is dharma?"] * 4)
+    assert len(set(answers)) == 1 and answers[0]
+    stats = gateway.stats()
+    assert (stats["generated"], stats["coalesced"], stats["coalescing_ratio"]) == (1, 3, 0.75)
+
+
+def test_different_prompts_are_generated_separately():
+    gateway = LLMGateway(model=StubChatModel(first_token_latency=0.1))
+    answers = ask_concurrently(gateway, ["What is dharma?", "What is karma?"])
+    assert answers[0] != answers[1]
+    assert gateway.stats()["generated"] == 2
+
+
+def test_finished_prompt_is_generated_again():
+    gateway = LLMGateway(model=StubChatModel())
+    gateway.invoke("What is dharma?")
+    gateway.invoke("What is dharma?")
+    assert gateway.stats()["generated"] == 2
+
+
+# Times out on its first `failures` calls, then answers in one piece and reports 42 tokens used
+class FlakyModel(BaseChatModel):
+    failures: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "flaky"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise TimeoutError("provider timed out")
+        message = AIMessage(content="answer", response_metadata={"token_usage": {"total_tokens": 42}})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def test_transient_errors_are_retried():
+    gateway = LLMGateway(model=FlakyModel(failures=2), backoff_base=0.01)
+    assert gateway.invoke("What is dharma?").content == "answer"
+    assert gateway.stats()["retries"] == 2
+
+
+def test_exhausted_retries_raise():
+    gateway = LLMGateway(model=FlakyModel(failures=5), attempts=2, backoff_base=0.01)
+    with pytest.raises(TimeoutError):
+        gateway.invoke("What is dharma?")
+
+
+def test_settle_refunds_the_unused_estimate():
+    budget = RateBudget(requests_per_minute=60, tokens_per_minute=1000)
+    budget.acquire_blocking(600)
+    budget.settle(600, 100)
+    assert budget.tokens.level == pytest.approx(900, abs=1)
+    budget.settle(600, 0)  # A failed call gives its whole reservation back, up to the capacity
+    assert budget.tokens.level == pytest.approx(1000)
+
+
+def test_settle_charges_an_overrun():
+    budget = RateBudget(requests_per_minute=60, tokens_per_minute=1000)
+    budget.acquire_blocking(100)
+    budget.settle(100, 400)
+    assert budget.tokens.level == pytest.approx(600, abs=1)
+
+
+def test_gateway_settles_against_reported_usage():
+    budget = RateBudget(requests_per_minute=60, tokens_per_minute=10000)
+    gateway = LLMGateway(model=FlakyModel(), budget=budget)
+    gateway.invoke("What is dharma?")
+    assert budget.tokens.level == pytest.approx(10000 - 42, abs=1)
+
+
+def test_gateway_estimates_usage_without_a_report():
+    budget = RateBudget(requests_per_minute=60, tokens_per_minute=10000)
+    gateway = LLMGateway(model=StubChatModel(answer_words=5), budget=budget)
+    answer = gateway.invoke("What is dharma?").content
+    used = estimate_tokens("What is dharma?") + estimate_tokens(answer)
+    assert budget.tokens.level == pytest.approx(10000 - used, abs=2)
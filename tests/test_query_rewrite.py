@@ -0,0 +1,71 @@
+import pytest
+from typing import List
+from langchain.docstore.document import Document
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.retrievers import BaseRetriever
+from query_rewrite import RewritingRetrievalChain, is_standalone, same_question
+
+
+@pytest.mark.parametrize("question", [
+    "What does the Gita say about duty?",
+    "How should one meditate according to Patanjali?",
+])
+def test_standalone_questions(question):
+    assert is_standalone(question)
+
+
+@pytest.mark.parametrize("question", [
+    "why?",
+    "and karma?",
+    "What does he say about it?",
+    "Tell me more about the second chapter",
+    "What about the Yoga Sutras view on this?",
+])
+def test_follow_up_questions(question):
+    assert not is_standalone(question)
+
+
+def test_same_question_threshold():
+    assert same_question("What is the self according to the Gita", "What is the self according to the Gita?")
+    # 7 of 8 distinct words shared: 0.88 overlap
+    assert same_question("What does Krishna say about karma yoga", "What does Krishna say about karma yoga then")
+    # 4 of 9 distinct words shared: 0.44 overlap
+    assert not same_question("What does he say about it", "What does Krishna say about karma yoga")
+    assert not same_question("", "anything")
+
+
+# Records every query it is asked
+class RecordingRetriever(BaseRetriever):
+    queries: List[str] = []
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        self.queries.append(query)
+        return [Document(page_content=f"passage for {query}")]
+
+
+# The fake model answers the rewrite prompt (if one is sent) and then the answer prompt
+def ask(rewrite, question, chat_history):
+    retriever = RecordingRetriever(queries=[])
+    chain = RewritingRetrievalChain.from_llm(
+        FakeListLLM(responses=[rewrite, "answer"]), retriever=retriever, return_generated_question=True
+    )
+    result = chain.invoke({"question": question, "chat_history": chat_history})
+    return result, retriever.queries
+
+
+def test_standalone_question_skips_the_rewrite():
+    result, queries = ask("unused", "What does the Gita say about duty?", [("What is dharma?", "Duty.")])
+    assert result["generated_question"] == "What does the Gita say about duty?"
+    assert queries == ["What does the Gita say about duty?"]
+
+
+def test_near_identical_rewrite_reuses_the_speculative_retrieval():
+    question = "and what does Krishna say about karma yoga"
+    result, queries = ask("What does Krishna say about karma yoga", question, [("What is yoga?", "Union.")])
+    assert result["generated_question"] == "What does Krishna say about karma yoga"
+    assert queries == [question]
+
+
+def test_different_rewrite_retrieves_again():
+    result, queries = ask("What does Krishna say about the self?", "what does he say about it", [("Who is Krishna?", "A teacher.")])
+    assert queries == ["what does he say about it", "What does Krishna say about the self?"]
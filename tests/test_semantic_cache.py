@@ -0,0 +1,39 @@
+from load_test import StubEmbeddings
+from semantic_cache import SemanticAnswerCache, question_scope
+
+
+def make_cache(tmp_path):
+    # A low threshold, so only the scope check can tell these near-identical questions apart
+    return SemanticAnswerCache(StubEmbeddings(), path=str(tmp_path / "answers.sqlite"), threshold=0.5)
+
+
+def test_same_question_hits(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("What is taught in chapter 2 of the Gita?", "Chapter 2 answer")
+    assert cache.lookup("what is taught in chapter 2 of the gita")["answer"] == "Chapter 2 answer"
+
+
+def test_other_chapter_or_verse_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("What is taught in chapter 2 of the Gita?", "Chapter 2 answer")
+    cache.put("Explain Gita 2.47", "Verse 2.47 answer")
+    assert cache.lookup("What is taught in chapter 3 of the Gita?") is None
+    assert cache.lookup("Explain Gita 2.48") is None
+
+
+def test_other_translator_or_scripture_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("How does Sivananda explain detachment in the Gita?", "Sivananda answer")
+    assert cache.lookup("How does Gambirananda explain detachment in the Gita?") is None
+    assert cache.lookup("How does Sivananda explain detachment in the Yoga Sutras?") is None
+
+
+def test_scope_survives_a_reopen(tmp_path):
+    make_cache(tmp_path).put("Explain Gita 2.47", "Verse 2.47 answer")
+    cache = make_cache(tmp_path)
+    assert cache.lookup("Explain Gita 2.47")["answer"] == "Verse 2.47 answer"
+    assert cache.lookup("Explain Gita 2.74") is None
+
+
+def test_scope_ignores_wording():
+    assert question_scope("What is taught in chapter 2?") == question_scope("Summarize the teaching of chapter 2")
@@ -0,0 +1,96 @@
+import threading
+import time
+from langchain_core.messages import AIMessage, HumanMessage
+import session_memory
+from session_memory import SessionMemory, SessionMemoryStore
+
+
+def turn(i):
+    return [HumanMessage(content=f"question {i}"), AIMessage(content=f"answer {i}")]
+
+
+def test_expired_sessions_are_pruned(tmp_path):
+    store = SessionMemoryStore(str(tmp_path / "sessions.sqlite"), ttl_seconds=60)
+    store.save("old", "", turn(1))
+    store.save("new", "", turn(2))
+    store.db.execute("UPDATE sessions SET updated = ? WHERE session_id = 'old'", (time.time() - 120,))
+    assert store.load("old") == ("", [], [])
+    assert store.prune() == 1
+    assert store.load("new")[1] == turn(2)
+
+
+def test_pending_turns_survive_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    SessionMemoryStore(path).save("s", "summary", turn(2), pending=turn(1))
+    summary, messages, pending = SessionMemoryStore(path).load("s")
+    assert (summary, messages, pending) == ("summary", turn(2), turn(1))
+
+
+def test_reload_restores_transcript(tmp_path):
+    store = SessionMemoryStore(str(tmp_path / "sessions.sqlite"))
+    memory = SessionMemory.for_session("s", store)
+    memory.save_context({"question": "question 1"}, {"answer": "answer 1"})
+    reloaded = SessionMemory.for_session("s", store)
+    assert reloaded.transcript() == [{"question": "question 1", "answer": "answer 1"}]
+
+
+# A summarizer that blocks until released, so clear() can run while a summary is in progress
+class BlockingSummarizer:
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def invoke(self, prompt):
+        self.started.set()
+        self.release.wait(5)
+        return "stale summary"
+
+
+def test_clear_during_summary_does_not_resurrect_session(tmp_path):
+    store = SessionMemoryStore(str(tmp_path / "sessions.sqlite"))
+    summarizer = BlockingSummarizer()
+    memory = SessionMemory.for_session("s", store, summarizer=summarizer, token_budget=1)
+    memory.save_context({"question": "question 1"}, {"answer": "answer 1"})
+    memory.save_context({"question": "question 2"}, {"answer": "answer 2"})
+    assert summarizer.started.wait(5)
+    memory.clear()
+    summarizer.release.set()
+    deadline = time.time() + 5
+    while memory._summarizing and time.time() < deadline:
+        time.sleep(0.01)
+    assert store.load("s") == ("", [], [])
+    assert memory.summary == ""
+
+
+# Fails the first `failures` calls, like a rate-limited or timed-out model, then summarizes
+class FlakySummarizer:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise TimeoutError("summarizer timed out")
+        return "summary of question 1"
+
+
+def wait_for(condition):
+    deadline = time.time() + 5
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_failed_summary_keeps_the_turns_and_retries(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_memory, "summary_retry_base", 0.05)
+    store = SessionMemoryStore(str(tmp_path / "sessions.sqlite"))
+    summarizer = FlakySummarizer(failures=2)
+    memory = SessionMemory.for_session("s", store, summarizer=summarizer, token_budget=1)
+    memory.save_context({"question": "question 1"}, {"answer": "answer 1"})
+    memory.save_context({"question": "question 2"}, {"answer": "answer 2"})
+    assert wait_for(lambda: summarizer.calls >= 1)
+    assert wait_for(lambda: store.load("s")[2] == turn(1))  # Still pending after the failure
+    assert wait_for(lambda: memory.summary == "summary of question 1")
+    assert summarizer.calls == 3
+    assert store.load("s") == ("summary of question 1", turn(2), [])
@@ -0,0 +1,54 @@
+import pytest
+from shards import ShardRouter, filter_value, shard_attributes, shard_for_source
+from verse_lookup import GITA, YOGA_SUTRAS
+
+
+@pytest.mark.parametrize("source, shard", [
+    ("Bhagwad_Gita_Verses_English.csv", "gita_verses"),
+    ("Bhagwad_Gita_Verses_English_Questions (1).csv", "gita_questions"),
+    ("Bhagwad_Gita_Verses_Concepts.csv", "gita_concepts"),
+    ("Gita_Word_Meanings_Hindi.csv", "gita_glossary"),
+    ("Patanjali_Yoga_Sutras_Verses_English.csv", "yoga_sutras_verses"),
+    ("books/sample.pdf", "documents"),
+])
+def test_shard_for_source(source, shard):
+    assert shard_for_source(source) == shard
+
+
+def make_router(max_shards=10):
+    centroids = {"gita_verses": [1, 0, 0], "gita_questions": [0, 1, 0], "gita_glossary": [0, 0, 1],
+                 "yoga_sutras_verses": [0.6, 0.8, 0], "documents": [0, 0.6, 0.8]}
+    shards = {name: {**shard_attributes(name), "count": 10, "centroid": centroid} for name, centroid in centroids.items()}
+    shards["gita_concepts"] = {**shard_attributes("gita_concepts"), "count": 0, "centroid": None}
+    return ShardRouter(shards, max_shards=max_shards)
+
+
+def test_empty_shards_are_never_searched():
+    assert "gita_concepts" not in make_router().route()
+
+
+def test_scripture_filter_keeps_that_scripture():
+    assert make_router().route(metadata_filter={"scripture": YOGA_SUTRAS}) == ["yoga_sutras_verses"]
+    nested = {"$and": [{"scripture": {"$eq": GITA}}, {"chapter": 2}]}
+    assert filter_value(nested, "scripture") == GITA
+    assert set(make_router().route(metadata_filter=nested)) == {"gita_verses", "gita_questions", "gita_glossary"}
+
+
+def test_translator_filter_keeps_verse_tables():
+    shards = make_router().route(metadata_filter={"translator": "Swami Sivananda"})
+    assert set(shards) == {"gita_verses", "yoga_sutras_verses"}
+
+
+def test_glossary_only_for_word_questions():
+    assert "gita_glossary" not in make_router().route("What does Krishna teach about duty?")
+    assert make_router(max_shards=1).route("What does the word karma mean?", [1, 0, 0])[0] == "gita_glossary"
+
+
+def test_centroids_rank_and_cap_the_shards():
+    router = make_router(max_shards=2)
+    assert router.route("Why act without attachment?", [1, 0.1, 0]) == ["gita_verses", "yoga_sutras_verses"]
+    assert router.route("Why act without attachment?", [0, 1, 0.1]) == ["gita_questions", "yoga_sutras_verses"]
+
+
+def test_scanned_fraction():
+    assert make_router().scanned_fraction(["gita_verses", "documents"]) == 0.4
@@ -0,0 +1,64 @@
+import time
+import translation
+from translation import LocalBackend, TranslationCache, Translator, split_sentences
+
+ANSWER = "Act without attachment. The wise see action in inaction!\n\nकर्मण्येवाधिकारस्ते। Why? Because"
+
+
+def make_translator(tmp_path, backend=None):
+    return Translator(backend=backend or LocalBackend(), cache=TranslationCache(str(tmp_path / "translations.sqlite")))
+
+
+def test_split_keeps_separators():
+    segments = split_sentences(ANSWER)
+    assert [sentence for sentence, _ in segments] == [
+        "Act without attachment.", "The wise see action in inaction!", "कर्मण्येवाधिकारस्ते।", "Why?", "Because",
+    ]
+    assert "".join(sentence + separator for sentence, separator in segments) == ANSWER
+
+
+def test_long_sentence_is_cut_on_whitespace(monkeypatch):
+    monkeypatch.setattr(translation, "max_segment_chars", 10)
+    assert split_sentences("aaaa bbbb cccc dddd.") == [("aaaa bbbb", " "), ("cccc dddd.", "")]
+
+
+def test_stream_matches_whole_translation(tmp_path):
+    translator = make_translator(tmp_path)
+    tokens = [ANSWER[i:i + 3] for i in range(0, len(ANSWER), 3)]
+    assert "".join(translator.translate_stream(tokens, "hi")) == make_translator(tmp_path).translate(ANSWER, "hi")
+
+
+# Records the sentences it was asked to translate
+class RecordingBackend(LocalBackend):
+    def __init__(self):
+        super().__init__()
+        self.seen = []
+
+    def translate(self, text, target):
+        self.seen.append(text)
+        return super().translate(text, target)
+
+
+def test_finished_sentences_are_translated_before_the_stream_ends(tmp_path):
+    backend = RecordingBackend()
+    translator = make_translator(tmp_path, backend)
+    submitted = []
+
+    def tokens():
+        yield from ["Act without ", "attachment. ", "The wise"]
+        deadline = time.time() + 5
+        while not backend.seen and time.time() < deadline:
+            time.sleep(0.01)
+        submitted.extend(backend.seen)
+        yield " see."
+
+    pieces = list(translator.translate_stream(tokens(), "hi"))
+    assert submitted == ["Act without attachment."]
+    assert pieces == ["[hi] Act without attachment. ", "[hi] The wise see."]
+
+
+def test_repeated_sentences_come_from_the_cache(tmp_path):
+    translator = make_translator(tmp_path)
+    translator.translate("Act without attachment.", "hi")
+    translator.translate("Act without attachment. Be steady.", "hi")
+    assert (translator.stats()["hits"], translator.stats()["misses"]) == (1, 2)
@@ -0,0 +1,49 @@
+import pytest
+from verse_lookup import GITA, YOGA_SUTRAS, parse_verse_reference, wants_explanation
+
+
+@pytest.mark.parametrize("question, reference", [
+    ("BG 2.47", (GITA, 2, 47)),
+    ("B.G. 2.47", (GITA, 2, 47)),
+    ("What is b.g 2.47?", (GITA, 2, 47)),
+    ("Explain Bhagavad Gita 2:47", (GITA, 2, 47)),
+    ("Gita (2.47)", (GITA, 2, 47)),
+    ("YS 2.46", (YOGA_SUTRAS, 2, 46)),
+    ("sutra 1.2", (YOGA_SUTRAS, 1, 2)),
+    ("chapter 3 verse 5", (GITA, 3, 5)),
+    ("chapter 2 verse 47 of the yoga sutras", (YOGA_SUTRAS, 2, 47)),
+    ("verse 2.47", (GITA, 2, 47)),
+    ("What does the Gita say in 18.66?", (GITA, 18, 66)),
+])
+def test_references(question, reference):
+    assert parse_verse_reference(question) == reference
+
+
+@pytest.mark.parametrize("question, reference", [
+    ("Gita 2.47 vs Yoga Sutra 1.2", (GITA, 2, 47)),
+    ("Yoga Sutra 1.2 vs Gita 2.47", (YOGA_SUTRAS, 1, 2)),
+    ("Compare Patanjali 1.2 with what the gita says", (YOGA_SUTRAS, 1, 2)),
+])
+def test_scripture_binds_to_its_own_reference(question, reference):
+    assert parse_verse_reference(question) == reference
+
+
+@pytest.mark.parametrize("question", [
+    "Which sutras of chapter 1 talk about 1.5 minds?",
+    "The gita has 700 verses. What is 1.5 times 2?",
+    "2.47",
+    "What does Krishna say about duty?",
+])
+def test_bare_numbers_are_not_references(question):
+    assert parse_verse_reference(question) is None
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What does the Gita say in 18.66?", True),
+    ("Explain BG 2.47", True),
+    ("What does BG 2.47 mean?", True),
+    ("BG 2.47", False),
+    ("Show me Yoga Sutra 1.2", False),
+])
+def test_wants_explanation(question, expected):
+    assert wants_explanation(question) == expected
@@ -0,0 +1,304 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from langchain_core.callbacks import BaseCallbackHandler
+from rate_limit import estimate_tokens
+
+# Per-request timing spans for the question path (cache lookup, condense question, embedding,
+# vector/BM25 search, answer LLM, translation). A finished trace is written as one JSON line to
+# the trace log and folded into Prometheus-style histograms.
+working_dir = os.path.dirname(os.path.abspath(__file__))
+trace_log_path = os.path.join(working_dir, "logs", "traces.jsonl")
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# The trace of the request being handled in this thread / task (None outside a request)
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    def __init__(self, question=""):
+        self.trace_id = uuid.uuid4().hex
+        self.question = question
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.total = None
+        self.spans = []
+        self.attributes = {}
+        self.lock = threading.Lock()  # Spans arrive from the chain's worker thread too
+        self.token = None
+
+    def add(self, name, start, end, **attributes):
+        with self.lock:
+            self.spans.append({
+                "name": name,
+                "offset_ms": round(1000 * (start - self.start), 2),
+                "duration_ms": round(1000 * (end - start), 2),
+                **attributes,
+            })
+
+    # Tokens sent to the LLM for this request (condense question + answer)
+    def prompt_tokens(self):
+        with self.lock:
+            return sum(span.get("prompt_tokens", 0) for span in self.spans)
+
+    def handler(self, condense_step=True):
+        return TracingHandler(self, condense_step)
+
+    # Define a function to end the trace: stop collecting spans, then log it and update the metrics.
+    # `error` is the exception the request failed with, if it did.
+    def finish(self, export=True, error=None, **attributes):
+        self.total = time.perf_counter() - self.start
+        self.attributes.update(attributes)
+        if error is not None:
+            self.attributes.update(error=str(error) or repr(error), error_type=type(error).__name__)
+        if self.token is not None:
+            current_trace.reset(self.token)
+            self.token = None
+        if export:
+            export_trace(self)
+        return self
+
+    def to_dict(self):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span["offset_ms"])
+        return {
+            "trace_id": self.trace_id,
+            "question": self.question,
+            "started_at": self.started_at,
+            "total_ms": round(1000 * self.total, 2) if self.total is not None else None,
+            **self.attributes,
+            "spans": spans,
+        }
+
+
+# Define a function to start a trace and make it the current one, so instrumented code records into it
+def start_trace(question=""):
+    trace = Trace(question)
+    trace.token = current_trace.set(trace)
+    return trace
+
+
+# Define a function to time a block as a span of the current trace; the yielded dict takes extra
+# attributes (document counts etc.). Outside a request it only costs a ContextVar lookup.
+@contextlib.contextmanager
+def span(name, **attributes):
+    trace = current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        if trace is not None:
+            trace.add(name, start, time.perf_counter(), **attributes)
+
+
+# Callback handler that turns the chain's LLM and retriever runs into spans. LLM calls before
+# retrieval are the condense-question rewrite; the one after it is the answer.
+class TracingHandler(BaseCallbackHandler):
+    def __init__(self, trace, condense_step=True):
+        self.trace = trace
+        self.retrieved = not condense_step
+        self.runs = {}
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self.runs[run_id] = {"start": time.perf_counter()}
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self.retrieved = True
+        run = self.runs.pop(run_id, None)
+        if run:
+            self.trace.add("retrieval", run["start"], time.perf_counter(), documents=len(documents))
+
+    def _llm_start(self, run_id, prompt_text):
+        self.runs[run_id] = {
+            "start": time.perf_counter(),
+            "name": "answer_llm" if self.retrieved else "condense_question",
+            "prompt_tokens": estimate_tokens(prompt_text),
+            "completion_tokens": 0,
+            "first_token": None,
+        }
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._llm_start(run_id, " ".join(str(message.content) for message in messages[0]))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._llm_start(run_id, " ".join(prompts))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self.runs.get(run_id)
+        if run and token:
+            run["first_token"] = run["first_token"] or time.perf_counter()
+            run["completion_tokens"] += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self.runs.pop(run_id, None)
+        if not run:
+            return
+        # Prefer the provider's reported usage over the local estimates
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        text = "".join(generation.text for generations in response.generations for generation in generations)
+        attributes = {
+            "prompt_tokens": usage.get("prompt_tokens", run["prompt_tokens"]),
+            "completion_tokens": usage.get("completion_tokens", run["completion_tokens"] or estimate_tokens(text)),
+        }
+        if run["first_token"] is not None:
+            attributes["time_to_first_token_ms"] = round(1000 * (run["first_token"] - run["start"]), 2)
+        self.trace.add(run["name"], run["start"], time.perf_counter(), **attributes)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self.runs.pop(run_id, None)
+        if run:
+            self.trace.add(run["name"], run["start"], time.perf_counter(), error=repr(error))
+
+
+# Cumulative-bucket latency histogram in the Prometheus text format, one series per label value
+class Histogram:
+    def __init__(self, name, help_text, label=None, buckets=latency_buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, label_value=None):
+        with self.lock:
+            counts = self.series.setdefault(label_value, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts["buckets"][i] += 1
+            counts["sum"] += seconds
+            counts["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_value, counts in sorted(self.series.items(), key=lambda item: str(item[0])):
+                labels = f'{self.label}="{label_value}",' if self.label else ""
+                for bound, count in zip(self.buckets, counts["buckets"]):
+                    lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels}le="+Inf"}} {counts["count"]}')
+                selector = f"{{{labels.rstrip(',')}}}" if labels else ""
+                lines.append(f"{self.name}_sum{selector} {counts['sum']:.6f}")
+                lines.append(f"{self.name}_count{selector} {counts['count']}")
+        return "\n".join(lines)
+
+
+class Counter:
+    def __init__(self, name, help_text, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, label_value=None):
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_value, value in sorted(self.values.items(), key=lambda item: str(item[0])):
+                selector = f'{{{self.label}="{label_value}"}}' if self.label else ""
+                lines.append(f"{self.name}{selector} {value}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def render(self):
+        with self.lock:
+            value = self.value
+        return "\n".join([f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value}"])
+
+
+request_latency = Histogram("wisdom_request_latency_seconds", "End-to-end question latency")
+stage_latency = Histogram("wisdom_stage_latency_seconds", "Latency of each request stage", label="stage")
+llm_tokens = Counter("wisdom_llm_tokens_total", "Tokens sent to and generated by the LLM", label="kind")
+retrieved_documents = Counter("wisdom_retrieved_documents_total", "Documents returned by retrieval")
+llm_queue_depth = Gauge("wisdom_llm_queue_depth", "LLM generations waiting for a gateway worker")
+llm_in_flight = Gauge("wisdom_llm_in_flight", "LLM generations running in the gateway")
+llm_requests = Counter("wisdom_llm_requests_total", "LLM calls through the gateway: generated, or coalesced onto one in flight", label="outcome")
+llm_retries = Counter("wisdom_llm_retries_total", "LLM generations retried after a transient error", label="reason")
+llm_rate_limit_wait = Histogram("wisdom_llm_rate_limit_wait_seconds", "Time LLM generations waited for the rate budget")
+request_errors = Counter("wisdom_request_errors_total", "Questions that failed or were abandoned, by exception type", label="error")
+metrics = [
+    request_latency, stage_latency, llm_tokens, retrieved_documents,
+    llm_queue_depth, llm_in_flight, llm_requests, llm_retries, llm_rate_limit_wait, request_errors,
+]
+
+
+# Define a function to render every metric in the Prometheus text exposition format
+def render_metrics():
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+trace_logger = logging.getLogger("wisdom_query.traces")
+trace_logger_lock = threading.Lock()
+
+
+def get_trace_logger():
+    with trace_logger_lock:
+        if not trace_logger.handlers:
+            os.makedirs(os.path.dirname(trace_log_path), exist_ok=True)
+            handler = logging.FileHandler(trace_log_path, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            trace_logger.addHandler(handler)
+            trace_logger.setLevel(logging.INFO)
+            trace_logger.propagate = False
+    return trace_logger
+
+
+def export_trace(trace):
+    request_latency.observe(trace.total)
+    if "error_type" in trace.attributes:
+        request_errors.inc(label_value=trace.attributes["error_type"])
+    for trace_span in trace.to_dict()["spans"]:
+        stage_latency.observe(trace_span["duration_ms"] / 1000, trace_span["name"])
+        if "documents" in trace_span and trace_span["name"] == "retrieval":
+            retrieved_documents.inc(trace_span["documents"])
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if kind in trace_span:
+                llm_tokens.inc(trace_span[kind], kind)
+    get_trace_logger().info(json.dumps(trace.to_dict(), ensure_ascii=False))
+
+
+# Define a function to serve /metrics on its own port, for processes without a web server (Streamlit)
+def serve_metrics(port, host="0.0.0.0"):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # Scrapes would otherwise flood the console
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from tracing import span
+from concurrency import InstrumentedLock
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+default_cache_path = os.path.join(working_dir, "translation_cache", "translations.sqlite")
+max_segment_chars = 4500  # GoogleTranslator rejects requests over 5000 characters
+
+# A sentence ends at . ! ? or the Devanagari danda, followed by whitespace; blank lines also end one
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?।॥])\s+|\n{2,}")
+
+
+# Define a function to split text into sentence segments, keeping each segment's trailing whitespace
+# so the translated pieces can be joined back with the original layout
+def split_sentences(text):
+    segments = []
+    position = 0
+    for match in SENTENCE_END_PATTERN.finditer(text):
+        segments.append((text[position:match.start()], match.group()))
+        position = match.end()
+    if position < len(text):
+        segments.append((text[position:], ""))
+    # Sentences over the request limit are cut on whitespace
+    bounded = []
+    for sentence, separator in segments:
+        while len(sentence) > max_segment_chars:
+            cut = sentence.rfind(" ", 0, max_segment_chars)
+            cut = cut if cut > 0 else max_segment_chars
+            bounded.append((sentence[:cut], " "))
+            sentence = sentence[cut:].lstrip()
+        bounded.append((sentence, separator))
+    return bounded
+
+
+# Backend calling Google Translate through deep_translator; one client per target language
+class GoogleBackend:
+    name = "google"
+
+    def __init__(self):
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def translate(self, text, target):
+        from deep_translator import GoogleTranslator
+
+        with self.lock:
+            if target not in self.clients:
+                self.clients[target] = GoogleTranslator(source="en", target=target)
+            client = self.clients[target]
+        return client.translate(text)
+
+
+# Local stand-in for tests and benchmarks: no network, deterministic output, optional simulated latency
+class LocalBackend:
+    name = "local"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def translate(self, text, target):
+        if self.latency:
+            time.sleep(self.latency)
+        return f"[{target}] {text}"
+
+
+BACKENDS = {"google": GoogleBackend, "local": LocalBackend}
+
+
+# Persistent cache of translated segments keyed by (segment hash, target language, backend)
+class TranslationCache:
+    def __init__(self, path=default_cache_path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = InstrumentedLock("translation_cache")
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS translations (key TEXT, target TEXT, backend TEXT, text TEXT, "
+            "PRIMARY KEY (key, target, backend))"
+        )
+
+    @staticmethod
+    def key(segment):
+        return hashlib.sha256(segment.strip().encode("utf-8")).hexdigest()
+
+    def get(self, segment, target, backend):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT text FROM translations WHERE key = ? AND target = ? AND backend = ?",
+                (self.key(segment), target, backend)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, segment, target, backend, text):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO translations (key, target, backend, text) VALUES (?, ?, ?, ?)",
+                (self.key(segment), target, backend, text)
+            )
+            self.db.commit()
+
+
+# Translation front end: splits answers into sentences, serves repeats from the cache and
+# translates the rest concurrently on a shared thread pool
+class Translator:
+    def __init__(self, backend=None, cache=None, max_workers=8):
+        self.backend = backend or GoogleBackend()
+        self.cache = cache or TranslationCache()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+        self.hits = 0
+        self.misses = 0
+
+    def translate_segment(self, segment, target):
+        if not segment.strip():
+            return segment
+        cached = self.cache.get(segment, target, self.backend.name)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        try:
+            translated = self.backend.translate(segment, target)
+        except Exception:
+            return segment  # Unsupported language or transient failure: show the original sentence
+        if translated is None:
+            return segment
+        self.cache.put(segment, target, self.backend.name, translated)
+        return translated
+
+    def translate(self, text, target):
+        with span("translation", target=target) as attributes:
+            segments = split_sentences(text)
+            attributes["segments"] = len(segments)
+            futures = [self.executor.submit(self.translate_segment, sentence, target) for sentence, _ in segments]
+            return "".join(future.result() + separator for future, (_, separator) in zip(futures, segments))
+
+    # Define a function to translate a token stream while it is still being generated: each sentence is
+    # submitted as soon as it is complete, and translations are yielded in order as they finish
+    def translate_stream(self, tokens, target):
+        with span("translation", target=target, streamed=True) as attributes:
+            # The span covers the whole stream, so it overlaps the answer LLM span
+            for piece in self._translate_stream(tokens, target):
+                attributes["segments"] = attributes.get("segments", 0) + 1
+                yield piece
+
+    def _translate_stream(self, tokens, target):
+        pending = deque()
+        buffer = ""
+        for token in tokens:
+            buffer += token
+            segments = split_sentences(buffer)
+            # The last segment may still be growing; everything before it is a finished sentence
+            for sentence, separator in segments[:-1]:
+                pending.append((self.executor.submit(self.translate_segment, sentence, target), separator))
+            buffer = "".join(sentence + separator for sentence, separator in segments[-1:])
+            while pending and pending[0][0].done():
+                future, separator = pending.popleft()
+                yield future.result() + separator
+        for sentence, separator in split_sentences(buffer):
+            pending.append((self.executor.submit(self.translate_segment, sentence, target), separator))
+        while pending:
+            future, separator = pending.popleft()
+            yield future.result() + separator
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -58,72 +58,359 @@
 
 
 from langchain_text_splitters import CharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain.docstore.document import Document
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from itertools import islice, chain
 import pandas as pd
+import argparse
+import multiprocessing
 import os
 import glob
-from PyPDF2 import PdfReader  # Ensure PyPDF2 is installed
+import time
+from pdf_ingest import PDF_ERRORS, PageTextCache, find_pdfs, is_pdf, iter_pdf_pages, pages_per_second  # Ensure PyPDF2 is installed
+from resources import get_embeddings
+from shards import ShardedVectorStore, scripture_for_source, shard_for_source
+from bm25_index import build_bm25_index, BM25Index
+from compact_index import export_compact_index, CompactIndex
+from glossary import build_glossary_index, GlossaryIndex, GLOSSARY_FILES
+from ingest_manifest import load_manifest, save_manifest, file_hash, text_hash, chunk_id, diff_chunks
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+data_directory = os.path.join(working_dir, "Data")
+persist_directory = os.path.join(working_dir, "vector_db_dir")
+manifest_path = os.path.join(persist_directory, "ingest_manifest.json")
+
+batch_size = 5000  # Chroma's batch size limit is 5461, set a slightly smaller size for safety
+embedding_batch_size = 256  # Chunks embedded and written per Chroma call
+csv_block_rows = 2000  # Rows pandas reads at a time while streaming a CSV
+max_workers = min(4, os.cpu_count() or 1)  # Files parsed concurrently
+block_queue_size = 2 * max_workers  # Parsed CSV blocks waiting for the embed/upsert loop (held in memory at most)
+
+chunk_size = 2000  # CSV rows stay whole unless longer than this; PDF pages are split to this size
+
+text_splitter = CharacterTextSplitter(
+    chunk_size=chunk_size,
+    chunk_overlap=200
+)
+
+# Columns that identify a row independently of its position in the file
+ROW_KEY_COLUMNS = {"Chapter", "chapter", "Verse", "verse", "Shloka", "Sanskrit Word", "Translator"}
+
+# Column roles, matched on stripped, lower-cased names
+CHAPTER_COLUMNS = ("chapter",)
+VERSE_COLUMNS = ("verse", "shloka")
+SPEAKER_COLUMNS = ("speaker",)
+# Wide tables with one column per translator are melted so each chunk carries a single translator
+TRANSLATOR_COLUMNS = {
+    "swami adidevananda", "swami gambirananda", "swami sivananda", "dr. s. sankaranarayan", "shri purohit swami"
+}
+
+def find_column(df, names):
+    return next((column for column in df.columns if column.lower() in names), None)
+
+# Define a function to compute a stable key for every row of a CSV block;
+# `seen` carries key counts over from earlier blocks of the same file
+def csv_row_keys(df, seen):
+    key_columns = [column for column in df.columns if column.strip() in ROW_KEY_COLUMNS]
+    if not key_columns:
+        return df.index.astype(str).tolist()
+    keys = df[key_columns[0]].fillna("").astype(str)
+    for column in key_columns[1:]:
+        keys = keys + "|" + df[column].fillna("").astype(str)
+    # Rows sharing a key (e.g. a word repeated within a shloka) are told apart by occurrence
+    occurrence = keys.groupby(keys).cumcount() + keys.map(seen).fillna(0).astype(int)
+    seen.update(keys.value_counts().to_dict())
+    return (keys + "#" + occurrence.astype(str)).tolist()
+
+# Define a function to build every row's labelled text ("Bhagavad Gita 2.47 | Speaker: ... | ...")
+# with whole-column string operations
+def build_row_contents(df, scripture, chapter_column, verse_column):
+    if chapter_column and verse_column:
+        contents = scripture + " " + df[chapter_column].astype(str) + "." + df[verse_column].astype(str)
+    else:
+        contents = pd.Series(scripture, index=df.index)
+    for column in df.columns:
+        if column in (chapter_column, verse_column):
+            continue
+        contents = contents + " | " + column + ": " + df[column].fillna("").astype(str).str.strip()
+    return contents
+
+def integer_column(df, column):
+    if column is None:
+        return [0] * len(df)
+    return pd.to_numeric(df[column], errors="coerce").fillna(0).astype(int).tolist()
+
+def text_column(df, column):
+    if column is None:
+        return [""] * len(df)
+    return df[column].fillna("").astype(str).str.strip().tolist()
+
+# Define a function to stream one CSV file, a block of `csv_block_rows` rows at a time, as lists
+# of documents (one per verse row, with structured metadata)
+def iter_csv_blocks(file_path):
+    source = os.path.relpath(file_path, data_directory)
+    scripture = scripture_for_source(source)
+    seen = Counter()
+    for block in pd.read_csv(file_path, chunksize=csv_block_rows):
+        block.columns = [column.strip() for column in block.columns]
+        translators = [column for column in block.columns if column.lower() in TRANSLATOR_COLUMNS]
+        if translators:
+            block = block.melt(
+                id_vars=[column for column in block.columns if column not in translators],
+                value_vars=translators, var_name="Translator", value_name="Translation"
+            ).dropna(subset=["Translation"])
+        chapter_column = find_column(block, CHAPTER_COLUMNS)
+        verse_column = find_column(block, VERSE_COLUMNS)
+        rows = zip(
+            csv_row_keys(block, seen),
+            build_row_contents(block, scripture, chapter_column, verse_column),
+            integer_column(block, chapter_column),
+            integer_column(block, verse_column),
+            text_column(block, find_column(block, SPEAKER_COLUMNS)),
+            text_column(block, "Translator" if translators else None),
+        )
+        yield [
+            Document(page_content=row_content, metadata={
+                "source": source,
+                "row_key": row_key,
+                "scripture": scripture,
+                "chapter": chapter,
+                "verse": verse,
+                "speaker": speaker,
+                "translator": translator,
+            })
+            for row_key, row_content, chapter, verse, speaker, translator in rows
+        ]
+
+# Define a function to stream one CSV file as one document per verse row
+def iter_csv_documents(file_path):
+    return chain.from_iterable(iter_csv_blocks(file_path))
+
+# Define a function to stream one PDF file as page documents; pages are extracted in parallel
+# (or read from the page text cache) and arrive in order, a bounded window at a time
+def iter_pdf_documents(file_path, digest=None, cache=None, stats=None):
+    source = os.path.relpath(file_path, data_directory)
+    for page_number, text in iter_pdf_pages(file_path, digest, cache, stats):
+        if text:  # Only add non-empty text
+            yield Document(page_content=text, metadata={"source": source, "row_key": f"page-{page_number}", "page": page_number})
 
 # Define a function to process CSV files
 def process_csv_files(csv_files):
-    documents = []
-    for file_path in csv_files:
-        df = pd.read_csv(file_path)
-        for _, row in df.iterrows():
-            row_content = " ".join(row.astype(str))
-            documents.append(Document(page_content=row_content))
-    return documents
+    return [document for file_path in csv_files for document in iter_csv_documents(file_path)]
 
 # Define a function to process PDF files
 def process_pdf_files(pdf_files):
-    documents = []
-    for file_path in pdf_files:
-        reader = PdfReader(file_path)
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:  # Only add non-empty text
-                documents.append(Document(page_content=text))
-    return documents
-
-# Define a function to perform vectorization for CSV and PDF files
-def vectorize_documents():
-    embeddings = HuggingFaceEmbeddings()
+    return [document for file_path in pdf_files for document in iter_pdf_documents(file_path)]
+
+# Define a function to split documents and give every chunk its stable ID and content hash
+def iter_chunks(documents):
+    for document in documents:
+        if len(document.page_content) <= chunk_size:
+            pieces = [document]  # One verse row is one chunk: no splitting, no overlap
+        else:
+            pieces = text_splitter.split_documents([document])
+        for chunk_index, chunk in enumerate(pieces):
+            metadata = chunk.metadata
+            cid = chunk_id(metadata["source"], metadata["row_key"], chunk_index)
+            yield cid, text_hash(chunk.page_content, metadata), chunk
+
+# Worker entry point: parse and chunk one CSV file inside the process pool, handing each block's
+# chunk records to the parent as soon as it is parsed, then an end-of-file marker (rows=None).
+# `blocks` is bounded, so a worker waits while the embed/upsert loop catches up.
+# (PDFs stream through iter_changed_pdf_chunks, which parallelizes over pages instead)
+def parse_source_file(file_path, blocks):
+    source = os.path.relpath(file_path, data_directory)
+    try:
+        for documents in iter_csv_blocks(file_path):
+            blocks.put((source, len(documents), list(iter_chunks(documents))))
+    finally:
+        blocks.put((source, None, None))
+
+# Define a function to parse files across a process pool, yielding (source, rows, records) per block
+# as blocks arrive, and (source, None, None) once a file is done. At most `max_workers` files are
+# open and `block_queue_size` blocks buffered, so memory stays flat whatever the size of the files.
+def stream_parsed_blocks(file_paths):
+    file_paths = iter(file_paths)
+    # The manager closes first on the way out, so workers stuck on a full queue fail instead of hanging
+    with ProcessPoolExecutor(max_workers=max_workers) as executor, multiprocessing.Manager() as manager:
+        blocks = manager.Queue(maxsize=block_queue_size)
+        futures = {}
+
+        def submit():
+            path = next(file_paths, None)
+            if path is not None:
+                futures[os.path.relpath(path, data_directory)] = executor.submit(parse_source_file, path, blocks)
+
+        for _ in range(max_workers):
+            submit()
+        while futures:
+            source, rows, records = blocks.get()
+            if rows is None:
+                futures.pop(source).result()  # Re-raises a parse error from the worker
+                submit()
+            yield source, rows, records
+
+# Define a function to group an iterable into lists of at most `size` items
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+# Define a function to yield only the chunks that are new or edited, block by block; only chunk
+# hashes are kept per file, and its manifest entry is written once its last block has arrived
+def iter_changed_chunks(file_paths, file_digests, manifest, deletions, stats):
+    new_hashes = {}
+    for source, rows, records in stream_parsed_blocks(file_paths):
+        old_hashes = manifest["files"].get(source, {"chunks": {}})["chunks"]
+        if rows is None:
+            file_hashes = new_hashes.pop(source, {})
+            deletions.extend(diff_chunks(old_hashes, file_hashes)[1])
+            manifest["files"][source] = {"hash": file_digests[source], "shard": shard_for_source(source), "chunks": file_hashes}
+            continue
+        stats["rows"] += rows
+        stats["chunks"] += len(records)
+        file_hashes = new_hashes.setdefault(source, {})
+        for cid, chunk_hash, chunk in records:
+            file_hashes[cid] = chunk_hash
+            if old_hashes.get(cid) != chunk_hash:
+                yield cid, chunk
+
+# Define a function to yield the new or edited chunks of PDFs page by page, so a large PDF is never
+# held in memory; only its chunk hashes are kept until the file is done and its manifest entry written
+def iter_changed_pdf_chunks(file_paths, file_digests, manifest, deletions, stats, pdf_stats):
+    cache = PageTextCache()
+    for file_path in file_paths:
+        source = os.path.relpath(file_path, data_directory)
+        old_hashes = manifest["files"].get(source, {"chunks": {}})["chunks"]
+        new_hashes = {}
+        try:
+            for document in iter_pdf_documents(file_path, file_digests[source], cache, pdf_stats):
+                stats["rows"] += 1
+                for cid, chunk_hash, chunk in iter_chunks([document]):
+                    stats["chunks"] += 1
+                    new_hashes[cid] = chunk_hash
+                    if old_hashes.get(cid) != chunk_hash:
+                        yield cid, chunk
+        except PDF_ERRORS as error:
+            # Left out of the manifest, so its previous chunks stay and it is retried next run
+            print(f"Skipping unreadable PDF {source}: {error!r}")
+            continue
+        deletions.extend(diff_chunks(old_hashes, new_hashes)[1])
+        manifest["files"][source] = {"hash": file_digests[source], "shard": shard_for_source(source), "chunks": new_hashes}
+    # Pages of PDF versions no longer in the data directory are dropped from the cache
+    cache.prune(digest for source, digest in file_digests.items() if is_pdf(source))
+
+# Define a function to drop vectors the manifest doesn't track: auto-generated IDs from before the
+# manifest existed, or the single collection written before ingestion was sharded
+def purge_untracked_vectors(vectordb):
+    existing_ids = vectordb.get(include=[])["ids"]
+    for i in range(0, len(existing_ids), batch_size):
+        vectordb.delete(ids=existing_ids[i:i + batch_size])
+    return len(existing_ids)
+
+# Define a function to perform vectorization for CSV and PDF files.
+# Each source family is written to its own shard collection; `rebuild_shards` empties the named
+# shards first, so only their files are parsed and embedded again.
+def vectorize_documents(rebuild_shards=()):
+    vectordb = ShardedVectorStore(embeddings=get_embeddings(), directory=persist_directory)
+
+    manifest = load_manifest(manifest_path)
+    if not manifest["files"]:
+        purged = purge_untracked_vectors(Chroma(persist_directory=persist_directory))
+        purged += sum(purge_untracked_vectors(vectordb.shard(name)) for name in vectordb.shard_names())
+        if purged:
+            print(f"Removed {purged} untracked vectors from a previous full rebuild")
+
+    touched_shards = set()
+    for name in rebuild_shards:
+        vectordb.drop_shard(name)
+        touched_shards.add(name)
+        for source in [source for source, entry in manifest["files"].items() if entry["shard"] == name]:
+            del manifest["files"][source]
+
+    start_time = time.time()
 
     # Directory containing files
-    data_directory = "Data"  # Replace with your folder name
     csv_files = glob.glob(os.path.join(data_directory, "*.csv"))
-    pdf_files = glob.glob(os.path.join(data_directory, "*.pdf"))
+    pdf_files = find_pdfs(data_directory)
 
-    # Process CSV and PDF files
-    documents = process_csv_files(csv_files) + process_pdf_files(pdf_files)
+    # Unchanged files are never parsed or embedded
+    file_digests = {}
+    changed_files = []
+    for file_path in csv_files + pdf_files:
+        source = os.path.relpath(file_path, data_directory)
+        file_digests[source] = file_hash(file_path)
+        if manifest["files"].get(source, {}).get("hash") != file_digests[source]:
+            changed_files.append(file_path)
+            touched_shards.add(shard_for_source(source))
 
-    # Splitting the text and creating chunks of these documents
-    text_splitter = CharacterTextSplitter(
-        chunk_size=2000,
-        chunk_overlap=500
+    # Files that disappeared from the data directory take their chunks with them
+    deletions = []
+    for source in list(manifest["files"]):
+        if source not in file_digests:
+            entry = manifest["files"].pop(source)
+            deletions.extend(entry["chunks"])
+            touched_shards.add(entry["shard"])
+
+    # Chunks stream from the pool into fixed-size batches; add_documents upserts, so edited chunks keep their IDs
+    stats = {"rows": 0, "chunks": 0, "upserted": 0}
+    pdf_stats = {}
+    changed_chunks = chain(
+        iter_changed_chunks([path for path in changed_files if path.endswith(".csv")], file_digests, manifest, deletions, stats),
+        iter_changed_pdf_chunks([path for path in changed_files if is_pdf(path)], file_digests, manifest, deletions, stats, pdf_stats)
     )
+    for batch in batched(changed_chunks, embedding_batch_size):
+        vectordb.add_documents(documents=[chunk for _, chunk in batch], ids=[cid for cid, _ in batch])
+        stats["upserted"] += len(batch)
 
-    text_chunks = text_splitter.split_documents(documents)
+    for i in range(0, len(deletions), batch_size):
+        vectordb.delete(ids=deletions[i:i + batch_size])
 
-    # Process text chunks in batches
-    batch_size = 5000  # Chroma's batch size limit is 5461, set a slightly smaller size for safety
-    for i in range(0, len(text_chunks), batch_size):
-        batch = text_chunks[i:i + batch_size]
+    # Row counts and centroids feed the query router; only shards whose files changed are re-read
+    if touched_shards or not ShardedVectorStore.exists(persist_directory):
+        vectordb.update_stats(sorted(touched_shards))
+        print(f"Updated shards: {', '.join(sorted(touched_shards)) or 'none'}")
 
-        # Store the batch in Chroma vector DB
-        vectordb = Chroma.from_documents(
-            documents=batch,
-            embedding=embeddings,
-            persist_directory="vector_db_dir"
-        )
+    # The lexical index is rebuilt over the whole collection (seconds), but only when something changed
+    if stats["upserted"] or deletions or not BM25Index.exists():
+        collection = vectordb.get(include=["documents"])
+        build_time = build_bm25_index(collection["ids"], collection["documents"])
+        print(f"Built BM25 index over {len(collection['ids'])} chunks in {build_time:.2f}s")
+
+    # A compact export, if one is in use, is refreshed with the same settings so it never serves stale vectors
+    if (stats["upserted"] or deletions) and CompactIndex.exists():
+        previous = CompactIndex().meta
+        export_time = export_compact_index(vectordb, dtype=previous["dtype"], nlist=previous["nlist"])
+        print(f"Re-exported compact index in {export_time:.2f}s")
+
+    # The word-meaning lookup is rebuilt from the glossary tables whenever one of them changed
+    glossary_sources = {file_name for file_name, _, _ in GLOSSARY_FILES}
+    if not GlossaryIndex.exists() or any(os.path.relpath(path, data_directory) in glossary_sources for path in changed_files):
+        build_time = build_glossary_index(data_directory)
+        print(f"Built glossary index in {build_time:.2f}s")
 
-    print("Documents Vectorized and saved in VectorDB")
+    save_manifest(manifest, manifest_path)
+    elapsed = max(time.time() - start_time, 1e-9)
+    print(f"Documents Vectorized and saved in VectorDB: {stats['upserted']} upserted, {len(deletions)} removed")
+    print(f"Parsed {stats['rows']} rows ({stats['rows'] / elapsed:.1f} rows/sec), "
+          f"{stats['chunks']} chunks ({stats['chunks'] / elapsed:.1f} chunks/sec) in {elapsed:.2f}s")
+    if pdf_stats.get("pages"):
+        print(f"PDF pages: {pdf_stats['pages']} ({pdf_stats.get('extracted_pages', 0)} extracted, "
+              f"{pdf_stats.get('cached_pages', 0)} from the text cache), {pages_per_second(pdf_stats)} pages/sec")
+    print(f"Embedding cache: {get_embeddings().stats()}")
 
-# Expose embeddings if needed
-embeddings = HuggingFaceEmbeddings()
+# Expose embeddings if needed; resolved lazily so importing this module never loads the model
+def __getattr__(name):
+    if name == "embeddings":
+        return get_embeddings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Main guard to prevent execution on import
 if __name__ == "__main__":
-    vectorize_documents()
+    parser = argparse.ArgumentParser(description="Incrementally vectorize the files in Data/ into per-source shards")
+    parser.add_argument("--rebuild-shard", action="append", default=[], metavar="SHARD",
+                        help="Empty and re-embed one shard (e.g. gita_glossary); may be repeated")
+    args = parser.parse_args()
+    vectorize_documents(rebuild_shards=args.rebuild_shard)
@@ -0,0 +1,196 @@
+import os
+import re
+import pandas as pd
+
+working_dir = os.path.dirname(os.path.abspath(__file__))
+data_directory = os.path.join(working_dir, "Data")
+
+GITA = "Bhagavad Gita"
+YOGA_SUTRAS = "Yoga Sutras"
+
+# Scripture names as users type them; Yoga Sutras are checked first since "sutra" is the stronger hint.
+# Lookarounds rather than \b, so abbreviations ending in a dot ("B.G.") still match.
+YOGA_SUTRAS_CUE = r"(?<![a-z])(?:ys|y\.\s?s\.|yoga\s*-?\s*sutras?|patanjali|sutras?)(?![a-z])"
+GITA_CUE = r"(?<![a-z])(?:bg|b\.\s?g\.?|bhagavad\s*-?\s*gita|bhagwad\s*-?\s*gita|bhagavadgita|gita|geeta)(?![a-z])"
+YOGA_SUTRAS_PATTERN = re.compile(YOGA_SUTRAS_CUE)
+GITA_PATTERN = re.compile(GITA_CUE)
+SCRIPTURE_PATTERNS = ((YOGA_SUTRAS, YOGA_SUTRAS_PATTERN), (GITA, GITA_PATTERN))
+
+# A bare number pair ("1.5") only counts as a reference in verse-shaped context: right after a
+# scripture name ("Gita 2.47", "B.G. 2.47"), after a verse word ("verse 2.47"), as "chapter 3
+# verse 5", or after "in"/"at" with a scripture named in the same question ("what does the Gita
+# say in 18.66")
+NUMBER_PAIR = r"(?P<chapter>\d{1,2})\s*[.:]\s*(?P<verse>\d{1,3})(?![\d])"
+VERSE_WORDS = r"(?:verses?|shlokas?|slokas?|sutras?|texts?)"
+CUED_REFERENCE_PATTERNS = tuple(
+    (scripture, re.compile(rf"{cue}\s*[,(]?\s*(?:{VERSE_WORDS}\s*)?{NUMBER_PAIR}"))
+    for scripture, cue in ((YOGA_SUTRAS, YOGA_SUTRAS_CUE), (GITA, GITA_CUE))
+)
+VERSE_WORD_PATTERN = re.compile(rf"\b{VERSE_WORDS}\s*(?:no\.?\s*)?{NUMBER_PAIR}")
+CHAPTER_VERSE_PATTERN = re.compile(
+    r"\bchapter\s*(?P<chapter>\d{1,2})\s*,?\s*(?:verse|shloka|sloka|sutra|text)\s*(?P<verse>\d{1,3})\b"
+)
+PREPOSITION_PATTERN = re.compile(rf"\b(?:in|at)\s+(?:{VERSE_WORDS}\s*)?{NUMBER_PAIR}")
+EXPLANATION_PATTERN = re.compile(
+    r"\b(?:explain|explanation|interpret|elaborate|meaning of|what does .* mean|what (?:does|do) .* say|"
+    r"significance|why|teach|lesson|apply|relevance|commentary|discuss)\b"
+)
+
+
+# Define a function to find the scripture named closest to a span of the text, or None if none is named
+def nearest_scripture(text, start, end):
+    mentions = [
+        (max(match.start() - end, start - match.end(), 0), scripture)
+        for scripture, pattern in SCRIPTURE_PATTERNS for match in pattern.finditer(text)
+    ]
+    return min(mentions, key=lambda mention: mention[0])[1] if mentions else None
+
+
+# Define a function to parse a direct verse reference; returns (scripture, chapter, verse) or None.
+# With several references ("Gita 2.47 vs Yoga Sutra 1.2") the first one wins, with the scripture named next to it.
+def parse_verse_reference(text):
+    text = text.lower()
+    references = []
+    for scripture, pattern in CUED_REFERENCE_PATTERNS:
+        references.extend((match, scripture) for match in pattern.finditer(text))
+    for pattern in (VERSE_WORD_PATTERN, CHAPTER_VERSE_PATTERN):
+        # "verse 2.47" or "chapter 3 verse 5" with no scripture named refers to the Gita, our main corpus
+        references.extend(
+            (match, nearest_scripture(text, match.start(), match.end()) or GITA) for match in pattern.finditer(text)
+        )
+    references.extend(
+        (match, scripture) for match in PREPOSITION_PATTERN.finditer(text)
+        if (scripture := nearest_scripture(text, match.start(), match.end())) is not None
+    )
+    if not references:
+        return None
+    match, scripture = min(references, key=lambda reference: reference[0].start())
+    return scripture, int(match.group("chapter")), int(match.group("verse"))
+
+
+def wants_explanation(text):
+    return bool(EXPLANATION_PATTERN.search(text.lower()))
+
+
+def _clean(value):
+    return "" if pd.isna(value) else str(value).strip()
+
+
+# In-memory index over the verse CSVs, keyed by (scripture, chapter, verse)
+class VerseIndex:
+    def __init__(self, data_directory=data_directory):
+        self.verses = {}
+        self._load_gita(data_directory)
+        self._load_yoga_sutras(data_directory)
+
+    def _entry(self, scripture, chapter, verse):
+        key = (scripture, int(chapter), int(verse))
+        if key not in self.verses:
+            self.verses[key] = {
+                "scripture": scripture,
+                "chapter": int(chapter),
+                "verse": int(verse),
+                "speaker": "",
+                "sanskrit": "",
+                "translations": {},
+                "word_meanings": [],
+                "concepts": [],
+            }
+        return self.verses[key]
+
+    def _load_gita(self, data_directory):
+        df = pd.read_csv(os.path.join(data_directory, "Bhagwad_Gita_Verses_English.csv"))
+        df.columns = [column.strip() for column in df.columns]
+        translators = [column for column in df.columns if column not in ("Chapter", "Verse", "Speaker", "Sanskrit")]
+        for row in df.to_dict("records"):
+            entry = self._entry(GITA, row["Chapter"], row["Verse"])
+            entry["speaker"] = _clean(row["Speaker"])
+            entry["sanskrit"] = _clean(row["Sanskrit"])
+            for translator in translators:
+                if _clean(row[translator]):
+                    entry["translations"][translator] = _clean(row[translator])
+
+        for file_name, language, meaning_column in (
+            ("Gita_Word_Meanings_English.csv", "English", "English Meaning"),
+            ("Gita_Word_Meanings_Hindi.csv", "Hindi", "Hindi Meaning"),
+        ):
+            df = pd.read_csv(os.path.join(data_directory, file_name))
+            for row in df.to_dict("records"):
+                entry = self._entry(GITA, row["Chapter"], row["Shloka"])
+                entry["word_meanings"].append((language, _clean(row["Sanskrit Word"]), _clean(row[meaning_column])))
+
+        df = pd.read_csv(os.path.join(data_directory, "Bhagwad_Gita_Verses_Concepts.csv"))
+        for row in df.to_dict("records"):
+            self._entry(GITA, row["Chapter"], row["Verse"])["concepts"].append(_clean(row["Concept"]))
+
+    def _load_yoga_sutras(self, data_directory):
+        df = pd.read_csv(os.path.join(data_directory, "Patanjali_Yoga_Sutras_Verses_English.csv"))
+        df.columns = [column.strip() for column in df.columns]
+        for row in df.to_dict("records"):
+            entry = self._entry(YOGA_SUTRAS, row["Chapter"], row["Verse"])
+            entry["sanskrit"] = _clean(row["Sanskrit"])
+            if _clean(row["Translation"]):
+                entry["translations"]["Translation"] = _clean(row["Translation"])
+            for pair in _clean(row["Word Meanings"]).split(";"):
+                word, _, meaning = pair.partition("=")
+                if word.strip():
+                    entry["word_meanings"].append(("English", word.strip(), meaning.strip()))
+
+    def get(self, scripture, chapter, verse):
+        return self.verses.get((scripture, chapter, verse))
+
+    # Define a function to resolve a free-text question to a verse entry, or None if it names no known verse
+    def lookup(self, text):
+        reference = parse_verse_reference(text)
+        return self.get(*reference) if reference else None
+
+
+# Define a function to load the curated questions with the verse each one is about,
+# as (question, scripture, chapter, verse) tuples; used as ground truth for retrieval checks
+def load_question_verses(data_directory=data_directory):
+    questions = []
+    for file_name, scripture in (
+        ("Bhagwad_Gita_Verses_English_Questions (1).csv", GITA),
+        ("Patanjali_Yoga_Sutras_Verses_English_Questions.csv", YOGA_SUTRAS),
+    ):
+        df = pd.read_csv(os.path.join(data_directory, file_name)).dropna(subset=["question"])
+        for row in df.to_dict("records"):
+            questions.append((str(row["question"]).strip(), scripture, int(row["chapter"]), int(row["verse"])))
+    return questions
+
+
+# A retrieved chunk counts as relevant if it is about the right verse and is not the question row itself
+def is_relevant(metadata, scripture, chapter, verse):
+    return (
+        metadata.get("scripture") == scripture
+        and metadata.get("chapter") == chapter
+        and metadata.get("verse") == verse
+        and "_Questions" not in metadata.get("source", "")
+    )
+
+
+# Define a function to render a verse entry as the assistant's answer
+def format_verse(entry):
+    lines = [f"**{entry['scripture']} {entry['chapter']}.{entry['verse']}**"]
+    if entry["speaker"]:
+        lines.append(f"_Speaker: {entry['speaker']}_")
+    if entry["sanskrit"]:
+        lines.append(f"\n{entry['sanskrit']}\n")
+    for translator, translation in entry["translations"].items():
+        lines.append(f"- **{translator}:** {translation}")
+    if entry["word_meanings"]:
+        for language in ("English", "Hindi"):
+            words = [f"{word} = {meaning}" for lang, word, meaning in entry["word_meanings"] if lang == language and word]
+            if words:
+                lines.append(f"\n**Word meanings ({language}):** " + "; ".join(words))
+    if entry["concepts"]:
+        lines.append(f"\n**Concepts:** {', '.join(entry['concepts'])}")
+    return "\n".join(lines)
+
+
+# Define a function to build the prompt used when the user asks for an explanation of a verse
+def explanation_prompt(entry, question):
+    return (
+        "Use the following verse, its translations and word meanings to answer the question.\n\n"
+        f"{format_verse(entry)}\n\nQuestion: {question}\nHelpful Answer:"
+    )